@@ -4,6 +4,7 @@
 '''display an image using opengl'''
 
 
+import ctypes
 import sys
 
 import PySide
@@ -24,6 +25,67 @@ def shaderFromFile(shaderType, shaderFile):
         shaderSrc = sf.read()
     return shaders.compileShader(shaderSrc, shaderType)
 
+class TextureReadback(object):
+    '''copies RGBA8 textures into a ring of pixel buffers without waiting,
+    poll() hands the finished copies to callback(pixels, tag) as a
+    (height, width, 4) array that is only valid during the callback'''
+    
+    def __init__(self, nbytes, callback, count=2):
+        self.callback = callback
+        self.buffers = list(glGenBuffers(count))
+        for buf in self.buffers:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, buf)
+            glBufferData(GL_PIXEL_PACK_BUFFER, nbytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.free = list(self.buffers)
+        # (buffer, fence, shape, tag) of the copies in flight, oldest first
+        self.inFlight = []
+        
+    def readTexture(self, texture, width, height, tag=None):
+        # a full ring waits for the oldest copy
+        if not self.free:
+            self.finish(*self.inFlight.pop(0))
+        buf = self.free.pop()
+        
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, buf)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glGetTexImage(GL_TEXTURE_2D, 0, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        
+        fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.inFlight.append((buf, fence, (height, width, 4), tag))
+        
+    def pending(self):
+        return len(self.inFlight)
+        
+    def poll(self):
+        '''hand over the copies the gpu has finished, never waits'''
+        while self.inFlight:
+            fence = self.inFlight[0][1]
+            if glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0) not in (GL_ALREADY_SIGNALED,
+                                                                              GL_CONDITION_SATISFIED):
+                break
+            self.finish(*self.inFlight.pop(0))
+        
+    def finish(self, buf, fence, shape, tag):
+        while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000) == GL_TIMEOUT_EXPIRED:
+            pass
+        glDeleteSync(fence)
+        
+        nbytes = shape[0] * shape[1] * shape[2]
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, buf)
+        ptr = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, nbytes, GL_MAP_READ_BIT)
+        data = (ctypes.c_ubyte * nbytes).from_address(ptr)
+        try:
+            self.callback(np.frombuffer(data, dtype=np.uint8).reshape(shape), tag)
+        finally:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, buf)
+            glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            self.free.append(buf)
+
 class MyGLWidget(QGLWidget):
     
     def __init__(self, gformat, parent=None):
@@ -44,6 +106,14 @@ class MyGLWidget(QGLWidget):
         self.workgroupSize = 16
         self.enableFilter = True
         
+        # the filtered image is read back without stalling the paint,
+        # resultImage holds the last one that arrived, press S to save it
+        self.readback = None
+        self.resultImage = None
+        self.readbackTimer = QTimer(self)
+        self.readbackTimer.setInterval(5)
+        self.readbackTimer.timeout.connect(self.pollReadback)
+        
         # chang this to load your image file
         self.loadImage('sample.png')
         
@@ -131,6 +201,9 @@ class MyGLWidget(QGLWidget):
         
         glBindTexture(GL_TEXTURE_2D, 0)
         
+        # two pixel buffers so a repaint doesn't wait for the last readback
+        self.readback = TextureReadback(self.im.size[0] * self.im.size[1] * 4, self.receiveResult, 2)
+        
         sys.stdout.write("Initialization successfull")
         
     def runComputeFilter(self, inputTex, outputTex):
@@ -143,6 +216,28 @@ class MyGLWidget(QGLWidget):
         
         glMemoryBarrier(GL_SHADER_IMAGE_ACCESS_BARRIER_BIT)
         
+    def readResult(self):
+        '''queue a copy of the result texture, it arrives in receiveResult'''
+        glMemoryBarrier(GL_TEXTURE_UPDATE_BARRIER_BIT)
+        self.readback.readTexture(self.resultTexture, self.im.size[0], self.im.size[1])
+        self.readbackTimer.start()
+        
+    def pollReadback(self):
+        self.makeCurrent()
+        self.readback.poll()
+        if not self.readback.pending():
+            self.readbackTimer.stop()
+        
+    def receiveResult(self, pixels, tag):
+        # pixels is a view of the mapped buffer, keep a copy
+        # the texture is upside down like the image it was made from
+        self.resultImage = pixels[::-1].copy()
+        
+    def saveResult(self, imageFile):
+        if self.resultImage is not None:
+            Image.fromarray(self.resultImage, 'RGBA').save(imageFile)
+            sys.stdout.write("\nSaved %s" % imageFile)
+        
     def resizeGL(self, w, h):
         glViewport(0, 0, w, h)
         
@@ -152,6 +247,7 @@ class MyGLWidget(QGLWidget):
         
         if self.enableFilter:
             self.runComputeFilter(self.textureID, self.resultTexture)
+            self.readResult()
             glBindTexture(GL_TEXTURE_2D, self.resultTexture)
         else:
             glBindTexture(GL_TEXTURE_2D, self.textureID)
@@ -168,6 +264,8 @@ class MyGLWidget(QGLWidget):
             self.enableFilter = not self.enableFilter
             self.updateGL()
             #sys.stdout.write("Filter: %s\n" % str(self.enableFilter))
+        elif event.key() == Qt.Key_S:
+            self.saveResult('result.png')
         return super(MyGLWidget, self).keyPressEvent(event)
 
 
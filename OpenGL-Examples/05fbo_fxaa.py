@@ -3,6 +3,11 @@
 # OpenGL example code - fbo & fxaa
 # render the cube from the perspective example to a texture and
 # apply fxaa antialiasing to it.
+# The render target comes from a FramebufferPool, it follows the size of
+# the window framebuffer when it is resized.
+# With a readbackCallback every frame is read back asynchronously and
+# handed to callback(pixels, t) a few frames later, pixels is a
+# (height, width, 4) uint8 array only valid during the callback.
 
 import ctypes
 
@@ -13,15 +18,23 @@ from OpenGL.GL import shaders
 from glfw import *
 import glm
 
+from fbopool import FramebufferPool
+from readback import ReadbackRing
+
 
 class Window(object):
 
-    def __init__(self, width=640, height=480, title='GLFW opengl window'):
+    def __init__(self, width=640, height=480, title='GLFW opengl window', readbackCallback=None,
+                 readbackBuffers=3):
         self.width = width
         self.height = height
         self.title = title
         self.window = None
 
+        self.readbackCallback = readbackCallback
+        self.__readbackBuffers = readbackBuffers
+        self.__readback = None
+
         self.__vertexShader = './shaders/%s.vert' % self.title
         self.__fragmentShader = './shaders/%s.frag' % self.title
         self.__pevShader = './shaders/05post_effect.vert'
@@ -30,10 +43,9 @@ class Window(object):
         self.__pesProgram = None
         self.__vao = None
         self.__pevao = None
-        self.__fbo = None
+        self.__pool = None
         self.__vpLocation = None
         self.__peTexLocation = None
-        self.__texture = None
 
         self.__fxaa = True
         self.__space_dow = False
@@ -193,31 +205,12 @@ class Window(object):
         # "unbind" vao
         glBindVertexArray(0)
 
-        # generate texture
-        self.__texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, self.__texture)
-
-        # set texture parameters
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
-
-        # set texture content
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.width, self.height, 0,
-                     GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        # the render targets, created on first use
+        self.__pool = FramebufferPool()
 
-        # generate renderbuffers
-        rbf = glGenRenderbuffers(1)
-        glBindRenderbuffer(GL_RENDERBUFFER, rbf)
-        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, self.width, self.height)
-
-        # generate framebuffer
-        self.__fbo = glGenFramebuffers(1)
-        glBindFramebuffer(GL_FRAMEBUFFER, self.__fbo)
-
-        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.__texture, 0)
-        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, rbf)
+        if self.readbackCallback is not None:
+            self.__readback = ReadbackRing(self.width * self.height * 4, self.readbackCallback,
+                                           self.__readbackBuffers)
 
     def renderGL(self):
         """opengl render method"""
@@ -229,14 +222,21 @@ class Window(object):
             self.__fxaa = not self.__fxaa
         self.__space_dow = glfwGetKey(self.window, GLFW_KEY_SPACE)
 
+        # follow the size of the window
+        width, height = glfwGetFramebufferSize(self.window)
+        if (width, height) != (self.width, self.height) and width > 0 and height > 0:
+            self.resizeGL(width, height)
+
         # we are drawing 3d objects so we want depth testing
         glEnable(GL_DEPTH_TEST)
 
         # bind target framebuffer
         if self.__fxaa:
-            glBindFramebuffer(GL_FRAMEBUFFER, self.__fbo)
+            target = self.__pool.acquire(self.width, self.height)
+            target.bind()
         else:
             glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            glViewport(0, 0, self.width, self.height)
 
         # clear first
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -245,7 +245,7 @@ class Window(object):
         glUseProgram(self.__shaderProgram)
 
         # calculate ViewProjection matrix
-        projection = glm.perspective(90.0, 4.0 / 3.0, .1, 100.0)
+        projection = glm.perspective(90.0, float(self.width) / self.height, .1, 100.0)
 
         # translate the world/view position
         view = glm.translate(glm.mat4(1.0), glm.vec3(0.0, 0.0, -5.0))
@@ -268,6 +268,7 @@ class Window(object):
         if self.__fxaa:
             # bind the "screen frambuffer"
             glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            glViewport(0, 0, self.width, self.height)
 
             # we are not 3d rendering so no depth test
             glDisable(GL_DEPTH_TEST)
@@ -277,7 +278,7 @@ class Window(object):
 
             # bind texture to texture unit 0
             glActiveTexture(GL_TEXTURE0)
-            glBindTexture(GL_TEXTURE_2D, self.__texture)
+            glBindTexture(GL_TEXTURE_2D, target.texture)
 
             # set uniform
             glUniform1i(self.__peTexLocation, 0)
@@ -291,6 +292,32 @@ class Window(object):
         glBindVertexArray(0)
         glUseProgram(0)
 
+        if self.__readback:
+            # queue a copy of this frame and hand the finished ones over
+            if self.__fxaa:
+                self.__readback.readTexture(target.texture, self.width, self.height, t)
+            else:
+                self.__readback.readPixels(0, 0, self.width, self.height, t)
+            self.__readback.poll()
+
+        # the target can be handed out again next frame
+        if self.__fxaa:
+            self.__pool.release(target)
+        self.__pool.endFrame()
+
+    def resizeGL(self, width, height):
+        """the window framebuffer changed size, the render target of the
+        old size is deleted by the pool once it is no longer used"""
+        self.width = width
+        self.height = height
+
+        if self.__readback:
+            # the pending copies still have the old size
+            self.__readback.flush()
+            self.__readback.delete()
+            self.__readback = ReadbackRing(self.width * self.height * 4, self.readbackCallback,
+                                           self.__readbackBuffers)
+
     def initWindow(self):
         """setup window options. etc, opengl version"""
         # select opengl version
@@ -327,7 +354,18 @@ class Window(object):
 
         self.close()
 
+    def release(self):
+        """free the helpers of the window, the window and glfw are kept"""
+        if self.__readback:
+            self.__readback.flush()
+            self.__readback.delete()
+            self.__readback = None
+        if self.__pool:
+            self.__pool.delete()
+            self.__pool = None
+
     def close(self):
+        self.release()
         glfwDestroyWindow(self.window)
         glfwTerminate()
 
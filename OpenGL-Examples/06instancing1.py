@@ -2,6 +2,7 @@
 
 # OpenGL example code - Instancing
 # create 8 instances of the cube from the perspective example
+# (instanceCount=<n> places n cubes on a grid)
 # with an additional offset buffer and AttribDivisor
 
 import ctypes
@@ -13,10 +14,12 @@ from OpenGL.GL import shaders
 from glfw import *
 import glm
 
+from instancing import gridPositions
+
 
 class Window(object):
 
-    def __init__(self, width=640, height=480, title='GLFW opengl window'):
+    def __init__(self, width=640, height=480, title='GLFW opengl window', instanceCount=8):
         self.width = width
         self.height = height
         self.title = title
@@ -28,6 +31,10 @@ class Window(object):
         self.__vao = None
         self.__vpLocation = None
 
+        self.__instanceCount = instanceCount
+        # distance of the camera from the center of the cubes
+        self.__distance = 5.0
+
     def shaderFromFile(self, shaderType, shaderFile):
         """read shader from file and compile it"""
         shaderSrc = ''
@@ -127,7 +134,7 @@ class Window(object):
                               # face 5:
                               20, 21, 22, # first triangle
                               22, 21, 23, # second triangle
-                              ], dtype=np.uint)
+                              ], dtype=np.uint32)
 
         # fill with data
         glBufferData(GL_ELEMENT_ARRAY_BUFFER, indexData.nbytes, indexData, GL_STATIC_DRAW)
@@ -137,17 +144,10 @@ class Window(object):
         tbo = glGenBuffers(1)
         glBindBuffer(GL_ARRAY_BUFFER, tbo)
 
-        # the offsets
-        translationData = np.array([
-                                     2.0,  2.0,  2.0, # cube 0
-                                     2.0,  2.0, -2.0, # cube 1
-                                     2.0, -2.0,  2.0, # cube 2
-                                     2.0, -2.0, -2.0, # cube 3
-                                    -2.0,  2.0,  2.0, # cube 4
-                                    -2.0,  2.0, -2.0, # cube 5
-                                    -2.0, -2.0,  2.0, # cube 6
-                                    -2.0, -2.0, -2.0, # cube 7
-                                    ], dtype=np.float32)
+        # the offsets, the cubes are placed on a grid 4 units apart,
+        # 8 cubes are the corners of a cube
+        translationData = gridPositions(self.__instanceCount, 4.0)
+        self.__distance = 2.5 + 1.25 * float(np.abs(translationData).max())
 
         # fill with data
         glBufferData(GL_ARRAY_BUFFER, translationData.nbytes, translationData, GL_STATIC_DRAW)
@@ -177,10 +177,10 @@ class Window(object):
         glUseProgram(self.__shaderProgram)
 
         # calculate ViewProjection matrix
-        projection = glm.perspective(90.0, 4.0 / 3.0, .1, 100.0)
+        projection = glm.perspective(90.0, 4.0 / 3.0, .1, max(100.0, 4.0 * self.__distance))
 
         # translate the world/view position
-        view = glm.translate(glm.mat4(1.0), glm.vec3(0.0, 0.0, -5.0))
+        view = glm.translate(glm.mat4(1.0), glm.vec3(0.0, 0.0, -self.__distance))
 
         # make the camera rotate around the origin
         view = glm.rotate(view, 90.0 * t, glm.vec3(1.0, 1.0, 1.0))
@@ -195,7 +195,7 @@ class Window(object):
 
         # draw
         # the additional parameter indicates how many instances to render
-        glDrawElementsInstanced(GL_TRIANGLES, 6 * 6, GL_UNSIGNED_INT, None, 8)
+        glDrawElementsInstanced(GL_TRIANGLES, 6 * 6, GL_UNSIGNED_INT, None, self.__instanceCount)
 
         glBindVertexArray(0)
         glUseProgram(0)
@@ -2,6 +2,7 @@
 
 # OpenGL example code - Instancing with texture buffer
 # create 8 instances of the cube from the perspective example
+# (instanceCount=<n> places n cubes on a grid)
 # the difference to the instancing1 example is that we are
 # using a texture buffer for the per instance data instead of a
 # vertex buffer with divisor.
@@ -15,10 +16,12 @@ from OpenGL.GL import shaders
 from glfw import *
 import glm
 
+from instancing import gridPositions
+
 
 class Window(object):
 
-    def __init__(self, width=640, height=480, title='GLFW opengl window'):
+    def __init__(self, width=640, height=480, title='GLFW opengl window', instanceCount=8):
         self.width = width
         self.height = height
         self.title = title
@@ -33,6 +36,10 @@ class Window(object):
 
         self.__bufferTex = None
 
+        self.__instanceCount = instanceCount
+        # distance of the camera from the center of the cubes
+        self.__distance = 5.0
+
     def shaderFromFile(self, shaderType, shaderFile):
         """read shader from file and compile it"""
         shaderSrc = ''
@@ -133,7 +140,7 @@ class Window(object):
                               # face 5:
                               20, 21, 22, # first triangle
                               22, 21, 23, # second triangle
-                              ], dtype=np.uint)
+                              ], dtype=np.uint32)
 
         # fill with data
         glBufferData(GL_ELEMENT_ARRAY_BUFFER, indexData.nbytes, indexData, GL_STATIC_DRAW)
@@ -143,17 +150,12 @@ class Window(object):
         tbo = glGenBuffers(1)
         glBindBuffer(GL_ARRAY_BUFFER, tbo)
 
-        # the offsets
-        translationData = np.array([
-                                     2.0,  2.0,  2.0, 0.0, # cube 0
-                                     2.0,  2.0, -2.0, 0.0, # cube 1
-                                     2.0, -2.0,  2.0, 0.0, # cube 2
-                                     2.0, -2.0, -2.0, 0.0, # cube 3
-                                    -2.0,  2.0,  2.0, 0.0, # cube 4
-                                    -2.0,  2.0, -2.0, 0.0, # cube 5
-                                    -2.0, -2.0,  2.0, 0.0, # cube 6
-                                    -2.0, -2.0, -2.0, 0.0, # cube 7
-                                    ], dtype=np.float32)
+        # the offsets, the cubes are placed on a grid 4 units apart,
+        # 8 cubes are the corners of a cube
+        positions = gridPositions(self.__instanceCount, 4.0)
+        translationData = np.zeros((self.__instanceCount, 4), dtype=np.float32)
+        translationData[:, 0:3] = positions
+        self.__distance = 2.5 + 1.25 * float(np.abs(positions).max())
 
         # fill with data
         glBufferData(GL_ARRAY_BUFFER, translationData.nbytes, translationData, GL_STATIC_DRAW)
@@ -182,10 +184,10 @@ class Window(object):
         glUseProgram(self.__shaderProgram)
 
         # calculate ViewProjection matrix
-        projection = glm.perspective(90.0, 4.0 / 3.0, .1, 100.0)
+        projection = glm.perspective(90.0, 4.0 / 3.0, .1, max(100.0, 4.0 * self.__distance))
 
         # translate the world/view position
-        view = glm.translate(glm.mat4(1.0), glm.vec3(0.0, 0.0, -5.0))
+        view = glm.translate(glm.mat4(1.0), glm.vec3(0.0, 0.0, -self.__distance))
 
         # make the camera rotate around the origin
         view = glm.rotate(view, 90.0 * t, glm.vec3(1.0, 1.0, 1.0))
@@ -207,7 +209,7 @@ class Window(object):
 
         # draw
         # the additional parameter indicates how many instances to render
-        glDrawElementsInstanced(GL_TRIANGLES, 6 * 6, GL_UNSIGNED_INT, None, 8)
+        glDrawElementsInstanced(GL_TRIANGLES, 6 * 6, GL_UNSIGNED_INT, None, self.__instanceCount)
 
         glBindVertexArray(0)
         glUseProgram(0)
@@ -3,6 +3,9 @@
 # OpenGL example code - Instancing with uniform buffer object
 # create 8 instances of the cube from the perspective example
 # the per instance data is passed with a uniform buffer object.
+# One uniform block only holds GL_MAX_UNIFORM_BLOCK_SIZE bytes, with
+# instanceCount=<n> the model matrices are split into chunks of one
+# block each that are drawn one after the other (see uniformbatch.py).
 
 import ctypes
 
@@ -13,10 +16,14 @@ from OpenGL.GL import shaders
 from glfw import *
 import glm
 
+import glutil
+from instancing import gridPositions, modelMatrices
+from uniformbatch import UniformBatch
+
 
 class Window(object):
 
-    def __init__(self, width=640, height=480, title='GLFW opengl window'):
+    def __init__(self, width=640, height=480, title='GLFW opengl window', instanceCount=8):
         self.width = width
         self.height = height
         self.title = title
@@ -29,48 +36,34 @@ class Window(object):
         self.__vpLocation = None
         self.__ubIndex = None
 
-        self.__ubo = None
+        self.__instanceCount = instanceCount
+        self.__batch = None
         self.__matricesBinding = 0
-
-    def shaderFromFile(self, shaderType, shaderFile):
-        """read shader from file and compile it"""
-        shaderSrc = ''
-        with open(shaderFile) as sf:
-            shaderSrc = sf.read()
-
-        return shaders.compileShader(shaderSrc, shaderType)
+        # distance of the camera from the center of the cubes
+        self.__distance = 5.0
 
     def initGL(self):
         """opengl initialization"""
+        # the uniform buffer chunks, their size is needed by the shader
+        self.__batch = UniformBatch(self.__instanceCount)
+
         # load shaders
-        vertexShader = self.shaderFromFile(GL_VERTEX_SHADER, self.__vertexShader)
-        fragmentShader = self.shaderFromFile(GL_FRAGMENT_SHADER, self.__fragmentShader)
+        vertexShader = glutil.shaderFromFile(GL_VERTEX_SHADER, self.__vertexShader, self.__batch.defines())
+        fragmentShader = glutil.shaderFromFile(GL_FRAGMENT_SHADER, self.__fragmentShader)
         self.__shaderProgram = shaders.compileProgram(vertexShader, fragmentShader)
         if not self.__shaderProgram:
             self.close()
 
+        self.__vpLocation = glGetUniformLocation(self.__shaderProgram, 'ViewProjection')
         self.__ubIndex = glGetUniformBlockIndex(self.__shaderProgram, 'Matrices')
         # assign the block binding
         glUniformBlockBinding(self.__shaderProgram, self.__ubIndex, self.__matricesBinding)
 
-        # create uniform buffer
-        self.__ubo = glGenBuffers(1)
-        glBindBuffer(GL_UNIFORM_BUFFER, self.__ubo)
-        glBufferData(GL_UNIFORM_BUFFER, 9 * 4 * 4 * 4, None, GL_DYNAMIC_DRAW)
-
-        # fill the Model matrix array
-        modelMatrices = []
-        modelMatrices.append(glm.translate(glm.mat4(1.0), glm.vec3( 2.0,  2.0,  2.0)))
-        modelMatrices.append(glm.translate(glm.mat4(1.0), glm.vec3( 2.0,  2.0, -2.0)))
-        modelMatrices.append(glm.translate(glm.mat4(1.0), glm.vec3( 2.0, -2.0,  2.0)))
-        modelMatrices.append(glm.translate(glm.mat4(1.0), glm.vec3( 2.0, -2.0, -2.0)))
-        modelMatrices.append(glm.translate(glm.mat4(1.0), glm.vec3(-2.0,  2.0,  2.0)))
-        modelMatrices.append(glm.translate(glm.mat4(1.0), glm.vec3(-2.0,  2.0, -2.0)))
-        modelMatrices.append(glm.translate(glm.mat4(1.0), glm.vec3(-2.0, -2.0,  2.0)))
-        modelMatrices.append(glm.translate(glm.mat4(1.0), glm.vec3(-2.0, -2.0, -2.0)))
-        modelMatrices = np.array(modelMatrices, dtype=np.float32)
-
-        glBufferSubData(GL_UNIFORM_BUFFER, 4 * 4 * 4, modelMatrices.nbytes, modelMatrices)
+        # fill the Model matrix array, the cubes are placed on a grid
+        # 4 units apart, 8 cubes are the corners of a cube
+        positions = gridPositions(self.__instanceCount, 4.0)
+        self.__batch.upload(modelMatrices(positions))
+        self.__distance = 2.5 + 1.25 * float(np.abs(positions).max())
 
         # generate and bind the vao
         self.__vao = glGenVertexArrays(1)
@@ -152,7 +145,7 @@ class Window(object):
                               # face 5:
                               20, 21, 22, # first triangle
                               22, 21, 23, # second triangle
-                              ], dtype=np.uint)
+                              ], dtype=np.uint32)
 
         # fill with data
         glBufferData(GL_ELEMENT_ARRAY_BUFFER, indexData.nbytes, indexData, GL_STATIC_DRAW)
@@ -174,27 +167,26 @@ class Window(object):
         glUseProgram(self.__shaderProgram)
 
         # calculate ViewProjection matrix
-        projection = glm.perspective(90.0, 4.0 / 3.0, .1, 100.0)
+        projection = glm.perspective(90.0, 4.0 / 3.0, .1, max(100.0, 4.0 * self.__distance))
 
         # translate the world/view position
-        view = glm.translate(glm.mat4(1.0), glm.vec3(0.0, 0.0, -5.0))
+        view = glm.translate(glm.mat4(1.0), glm.vec3(0.0, 0.0, -self.__distance))
 
         # make the camera rotate around the origin
         view = glm.rotate(view, 90.0 * t, glm.vec3(1.0, 1.0, 1.0))
 
         viewProjection = np.array(projection * view, dtype=np.float32)
 
-        # set the ViewProjection in the uniform buffer
-        glBindBuffer(GL_UNIFORM_BUFFER, self.__ubo)
-        glBufferSubData(GL_UNIFORM_BUFFER, 0, viewProjection.nbytes, viewProjection)
-        glBindBufferRange(GL_UNIFORM_BUFFER, self.__matricesBinding, self.__ubo, 0, 4 * 4 * 4 * 9)
+        # set the uniform
+        glUniformMatrix4fv(self.__vpLocation, 1, GL_FALSE, viewProjection)
 
         # bind the vao
         glBindVertexArray(self.__vao)
 
         # draw
-        # the additional parameter indicates how many instances to render
-        glDrawElementsInstanced(GL_TRIANGLES, 6 * 6, GL_UNSIGNED_INT, None, 8)
+        # every chunk of the uniform buffer is bound to the block in turn
+        # and its instances are drawn
+        self.__batch.draw(self.__matricesBinding, 6 * 6)
 
         glBindVertexArray(0)
         glUseProgram(0)
@@ -235,7 +227,14 @@ class Window(object):
 
         self.close()
 
+    def release(self):
+        """free the helpers of the window, the window and glfw are kept"""
+        if self.__batch:
+            self.__batch.delete()
+            self.__batch = None
+
     def close(self):
+        self.release()
         glfwDestroyWindow(self.window)
         glfwTerminate()
 
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+# OpenGL example code - Instancing a crowd
+# draw a large number of instances of the cube from the perspective
+# example, 100K by default, up to a million. The per instance data are
+# full model matrices that are built from positions, rotations and
+# scales with numpy (see instancing.py) and read by the vertex shader
+# from a buffer texture, or with storage='ssbo' from a shader storage
+# buffer (OpenGL 4.3). All cubes are drawn with one
+# glDrawElementsInstanced call.
+# With animate=True every cube spins around its own axis, so all model
+# matrices are rebuilt and uploaded every frame. storage='ring' streams
+# them through a persistently mapped ring buffer instead (OpenGL 4.4),
+# they are written straight into the mapped memory and the vertex shader
+# reads them as instanced attribute from the segment of the frame.
+# culling=True tests the bounding spheres of the cubes against the view
+# frustum on the cpu every frame and only uploads and draws the visible
+# ones, cullThreads > 0 spreads the test over a pool of threads (see
+# culling.py). drawnInstances is the number of cubes of the last frame.
+# storage='attributes' reads the matrices as instanced vertex attribute.
+# With the attributes or ring storage instanceFormat='float32', 'snorm16'
+# or '2_10_10_10' uploads position, rotation and scale packed into 32, 16
+# or 12 bytes per cube instead of a 64 byte matrix (see packing.py).
+
+import math
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+from glfw import *
+import glm
+
+from culling import SphereCuller
+import glutil
+from instancing import FORMATS, STORAGES, InstanceManager, axisAngleQuaternions, gridPositions
+import packing
+
+
+class Window(object):
+
+    def __init__(self, width=640, height=480, title='GLFW opengl window', instanceCount=100 * 1000,
+                 storage='texture', animate=True, culling=False, cullThreads=0, instanceFormat='matrix'):
+        self.width = width
+        self.height = height
+        self.title = title
+        self.window = None
+
+        self.__vertexShader = './shaders/%s.vert' % self.title
+        self.__fragmentShader = './shaders/%s.frag' % self.title
+        self.__shaderProgram = None
+        self.__vao = None
+        self.__vpLocation = None
+        self.__modelsLocation = None
+
+        self.__instanceCount = instanceCount
+        # 'texture', 'ssbo', 'attributes' or 'ring'
+        if storage not in STORAGES:
+            raise ValueError('unknown instance storage %r' % storage)
+        self.__storage = storage
+        # 'matrix' or a packed format for the attributes and ring storage
+        if instanceFormat not in FORMATS:
+            raise ValueError('unknown instance format %r' % instanceFormat)
+        if instanceFormat != 'matrix' and storage not in ('attributes', 'ring'):
+            raise ValueError('packed instances are vertex attributes, use the attributes or ring storage')
+        self.__format = instanceFormat
+        self.__instances = None
+        self.__animate = animate
+        # rotation axis and speed of every cube
+        self.__axes = None
+        self.__speeds = None
+        # distance of the camera from the center of the crowd
+        self.__distance = 5.0
+
+        # cull the cubes against the view frustum on the cpu
+        self.__culling = culling
+        self.__cullThreads = cullThreads
+        self.__culler = None
+        # bounding sphere radius of every cube
+        self.__radii = None
+        # number of cubes drawn in the last frame
+        self.drawnInstances = instanceCount
+
+    def initGL(self):
+        """opengl initialization"""
+        # load shaders
+        defines = []
+        if self.__format != 'matrix':
+            vertexShader = './shaders/%s_packed.vert' % self.title
+            defines = packing.defines(self.__format)
+        elif self.__storage in ('attributes', 'ring'):
+            vertexShader = './shaders/%s_attributes.vert' % self.title
+        elif self.__storage == 'ssbo':
+            vertexShader = './shaders/%s_ssbo.vert' % self.title
+        else:
+            vertexShader = self.__vertexShader
+        vertexShader = glutil.shaderFromFile(GL_VERTEX_SHADER, vertexShader, defines)
+        fragmentShader = glutil.shaderFromFile(GL_FRAGMENT_SHADER, self.__fragmentShader)
+        self.__shaderProgram = shaders.compileProgram(vertexShader, fragmentShader)
+        if not self.__shaderProgram:
+            self.close()
+
+        self.__vpLocation = glGetUniformLocation(self.__shaderProgram, 'ViewProjection')
+        self.__modelsLocation = glGetUniformLocation(self.__shaderProgram, 'models')
+
+        # generate and bind the vao
+        self.__vao = glGenVertexArrays(1)
+        glBindVertexArray(self.__vao)
+
+        # generate and bind the buffer object
+        vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+
+        # data for a cube
+        vertexData = np.array([
+                               # x   y    z      U    V
+                               # face 0:
+                                1.0, 1.0, 1.0,       1.0, 0.0, 0.0, # vertex 0
+                               -1.0, 1.0, 1.0,       1.0, 0.0, 0.0, # vertex 1
+                                1.0,-1.0, 1.0,       1.0, 0.0, 0.0, # vertex 2
+                               -1.0,-1.0, 1.0,       1.0, 0.0, 0.0, # vertex 3
+
+                               # face 1:
+                                1.0, 1.0, 1.0,       0.0, 1.0, 0.0, # vertex 0
+                                1.0,-1.0, 1.0,       0.0, 1.0, 0.0, # vertex 1
+                                1.0, 1.0,-1.0,       0.0, 1.0, 0.0, # vertex 2
+                                1.0,-1.0,-1.0,       0.0, 1.0, 0.0, # vertex 3
+
+                               # face 2:
+                                1.0, 1.0, 1.0,       0.0, 0.0, 1.0, # vertex 0
+                                1.0, 1.0,-1.0,       0.0, 0.0, 1.0, # vertex 1
+                               -1.0, 1.0, 1.0,       0.0, 0.0, 1.0, # vertex 2
+                               -1.0, 1.0,-1.0,       0.0, 0.0, 1.0, # vertex 3
+
+                               # face 3:
+                                1.0, 1.0,-1.0,       1.0, 1.0, 0.0, # vertex 0
+                                1.0,-1.0,-1.0,       1.0, 1.0, 0.0, # vertex 1
+                               -1.0, 1.0,-1.0,       1.0, 1.0, 0.0, # vertex 2
+                               -1.0,-1.0,-1.0,       1.0, 1.0, 0.0, # vertex 3
+
+                               # face 4:
+                               -1.0, 1.0, 1.0,       0.0, 1.0, 1.0, # vertex 0
+                               -1.0, 1.0,-1.0,       0.0, 1.0, 1.0, # vertex 1
+                               -1.0,-1.0, 1.0,       0.0, 1.0, 1.0, # vertex 2
+                               -1.0,-1.0,-1.0,       0.0, 1.0, 1.0, # vertex 3
+
+                               # face 5:
+                                1.0,-1.0, 1.0,       1.0, 0.0, 1.0, # vertex 0
+                               -1.0,-1.0, 1.0,       1.0, 0.0, 1.0, # vertex 1
+                                1.0,-1.0,-1.0,       1.0, 0.0, 1.0, # vertex 2
+                               -1.0,-1.0,-1.0,       1.0, 0.0, 1.0, # vertex 3
+                               ], dtype=np.float32)
+
+        # fill with data
+        glBufferData(GL_ARRAY_BUFFER, vertexData.nbytes, vertexData, GL_STATIC_DRAW)
+
+        # set up generic attrib pointers
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * 4, None)
+
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * 4, ctypes.c_void_p(3 * 4))
+
+        ibo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ibo)
+
+        indexData = np.array([
+                              # face 0:
+                              0, 1, 2, # first triangle
+                              2, 1, 3, # second triangle
+                              # face 1:
+                              4, 5, 6, # first triangle
+                              6, 5, 7, # second triangle
+                              # face 2:
+                              8, 9, 10, # first triangle
+                              10, 9, 11, # second triangle
+                              # face 3:
+                              12, 13, 14, # first triangle
+                              14, 13, 15, # second triangle
+                              # face 4:
+                              16, 17, 18, # first triangle
+                              18, 17, 19, # second triangle
+                              # face 5:
+                              20, 21, 22, # first triangle
+                              22, 21, 23, # second triangle
+                              ], dtype=np.uint32)
+
+        # fill with data
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indexData.nbytes, indexData, GL_STATIC_DRAW)
+
+        glBindVertexArray(0)
+
+        # place the cubes on a grid, 4 units apart
+        count = self.__instanceCount
+        positions = gridPositions(count, 4.0)
+
+        # every cube gets its own size, axis and speed of rotation
+        random = np.random.RandomState(0)
+        scales = random.uniform(0.3, 1.0, count)
+        self.__axes = random.normal(size=(count, 3)).astype(np.float32)
+        self.__speeds = random.uniform(-math.pi, math.pi, count).astype(np.float32)
+
+        self.__instances = InstanceManager(count, self.__storage, format=self.__format)
+        self.__instances.store.add(positions, None, scales)
+        if self.__storage in ('attributes', 'ring'):
+            glBindVertexArray(self.__vao)
+            self.__instances.setAttributes(2)
+            glBindVertexArray(0)
+        self.__instances.upload()
+        self.__distance = 2.0 * float(np.abs(positions).max()) + 4.0
+
+        if self.__culling:
+            # the corners of the cubes are sqrt(3) from their center
+            self.__radii = (math.sqrt(3.0) * scales).astype(np.float32)
+            self.__culler = SphereCuller(self.__cullThreads)
+
+        # we are drawing 3d objects so we want depth testing
+        glEnable(GL_DEPTH_TEST)
+
+    def renderGL(self):
+        """opengl render method"""
+        # get the time in seconds
+        t = glfwGetTime()
+
+        # clear first
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        # calculate ViewProjection matrix
+        projection = glm.perspective(90.0, 4.0 / 3.0, 1.0, 4.0 * self.__distance)
+
+        # translate the world/view position
+        view = glm.translate(glm.mat4(1.0), glm.vec3(0.0, 0.0, -self.__distance))
+
+        # make the camera rotate around the origin
+        view = glm.rotate(view, 10.0 * t, glm.vec3(1.0, 1.0, 1.0))
+
+        viewProjection = np.array(projection * view, dtype=np.float32)
+
+        store = self.__instances.store
+        if self.__culler:
+            # only the visible cubes are spun, uploaded and drawn
+            visible = self.__culler.cull(viewProjection, store.positions[:store.count], self.__radii)
+            if self.__animate:
+                store.rotations[visible] = axisAngleQuaternions(self.__axes[visible], self.__speeds[visible] * t)
+            self.drawnInstances = self.__instances.uploadVisible(visible)
+        elif self.__animate:
+            # spin the cubes, all rotations at once
+            store.rotations[:store.count] = axisAngleQuaternions(self.__axes, self.__speeds * t)
+            self.__instances.upload()
+
+        # use the shader program
+        glUseProgram(self.__shaderProgram)
+
+        # set the uniform
+        glUniformMatrix4fv(self.__vpLocation, 1, GL_FALSE, viewProjection)
+
+        # bind the model matrices to texture unit or storage binding 0,
+        # attributes and the ring are read through the vao
+        self.__instances.bind(0)
+        if self.__storage == 'texture':
+            glUniform1i(self.__modelsLocation, 0)
+
+        # bind the vao
+        glBindVertexArray(self.__vao)
+
+        # draw all cubes at once
+        self.__instances.draw(6 * 6, self.drawnInstances)
+
+        glBindVertexArray(0)
+        glUseProgram(0)
+
+    def initWindow(self):
+        """setup window options. etc, opengl version"""
+        # select opengl version
+        glfwWindowHint(GLFW_OPENGL_PROFILE, GLFW_OPENGL_CORE_PROFILE)
+        if self.__storage == 'ring':
+            # persistent mapping needs OpenGL 4.4
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 4)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 4)
+        elif self.__storage == 'ssbo':
+            # shader storage buffers need OpenGL 4.3
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 4)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
+        else:
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 3)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
+
+    def show(self):
+        """create the window and show it"""
+        self.initWindow()
+
+        self.window = glfwCreateWindow(self.width, self.height, self.title, 0, 0)
+        if self.window == 0:
+            glfwTerminate()
+            raise Exception('failed to open window')
+
+        glfwMakeContextCurrent(self.window)
+
+        # initialize opengl
+        self.initGL()
+
+        while not glfwWindowShouldClose(self.window):
+            glfwPollEvents()
+
+            self.renderGL()
+
+            # check for errors
+            error = glGetError()
+            if error != GL_NO_ERROR:
+                raise Exception(error)
+
+            # finally swap buffers
+            glfwSwapBuffers(self.window)
+
+        self.close()
+
+    def release(self):
+        """free the helpers of the window, the window and glfw are kept"""
+        if self.__instances:
+            self.__instances.delete()
+            self.__instances = None
+        if self.__culler:
+            self.__culler.delete()
+            self.__culler = None
+
+    def close(self):
+        self.release()
+        glfwDestroyWindow(self.window)
+        glfwTerminate()
+
+
+
+if __name__ == '__main__':
+    import os.path
+
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    title = os.path.basename(__file__)
+    win = Window(title=title[:-3])
+    win.show()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+# OpenGL example code - Multi draw indirect
+# draw many different meshes, each with its own range of instances,
+# with one glMultiDrawElementsIndirect call (OpenGL 4.3). The meshes are
+# prisms with 3 to 10 sides that share one vertex and one index buffer
+# (see multidraw.py), the model matrices of all instances are instanced
+# vertex attributes that every draw command selects with its base
+# instance.
+# drawMode='loop' draws the meshes with one python draw call each
+# instead, submitTime is the cpu time in milliseconds the draw calls of
+# the last frame took.
+
+import math
+import ctypes
+from timeit import default_timer as timer
+
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+from glfw import *
+import glm
+
+import glutil
+from instancing import InstanceStore, axisAngleQuaternions
+from multidraw import MeshBatch
+
+
+def prism(sides, color):
+    """vertices (position, color) and indices of a prism with sides side
+    faces around the y axis, every face has its own shade of color"""
+    vertices = []
+    indices = []
+    angles = [2.0 * math.pi * k / sides for k in range(sides + 1)]
+    for k in range(sides):
+        # side face, a quad
+        shade = 0.6 + 0.4 * k / sides
+        base = len(vertices)
+        for angle in (angles[k], angles[k + 1]):
+            for y in (1.0, -1.0):
+                vertices.append([math.cos(angle), y, math.sin(angle)] + [shade * c for c in color])
+        indices += [base, base + 1, base + 2, base + 2, base + 1, base + 3]
+
+    for y, shade in ((1.0, 1.0), (-1.0, 0.4)):
+        # cap, a triangle fan around the center
+        center = len(vertices)
+        vertices.append([0.0, y, 0.0] + [shade * c for c in color])
+        for k in range(sides):
+            vertices.append([math.cos(angles[k]), y, math.sin(angles[k])] + [shade * c for c in color])
+        for k in range(sides):
+            indices += [center, center + 1 + k, center + 1 + (k + 1) % sides]
+
+    return np.array(vertices, dtype=np.float32), np.array(indices, dtype=np.uint32)
+
+
+class Window(object):
+
+    def __init__(self, width=640, height=480, title='GLFW opengl window', meshCount=64, instancesPerMesh=256,
+                 drawMode='indirect'):
+        self.width = width
+        self.height = height
+        self.title = title
+        self.window = None
+
+        self.__vertexShader = './shaders/%s.vert' % self.title
+        self.__fragmentShader = './shaders/%s.frag' % self.title
+        self.__shaderProgram = None
+        self.__vao = None
+        self.__vpLocation = None
+        self.__instanceBuffer = None
+
+        self.__meshCount = meshCount
+        self.__instancesPerMesh = instancesPerMesh
+        # 'indirect' or 'loop'
+        if drawMode not in ('indirect', 'loop'):
+            raise ValueError('unknown draw mode %r' % drawMode)
+        self.__drawMode = drawMode
+        self.__batch = None
+        # distance of the camera from the center of the scene
+        self.__distance = 5.0
+        # cpu time of the draw calls of the last frame in milliseconds
+        self.submitTime = 0.0
+
+    def initGL(self):
+        """opengl initialization"""
+        # load shaders
+        vertexShader = glutil.shaderFromFile(GL_VERTEX_SHADER, self.__vertexShader)
+        fragmentShader = glutil.shaderFromFile(GL_FRAGMENT_SHADER, self.__fragmentShader)
+        self.__shaderProgram = shaders.compileProgram(vertexShader, fragmentShader)
+        if not self.__shaderProgram:
+            self.close()
+
+        self.__vpLocation = glGetUniformLocation(self.__shaderProgram, 'ViewProjection')
+
+        # the meshes, each in its own color
+        random = np.random.RandomState(0)
+        meshes = [prism(3 + i % 8, random.uniform(0.3, 1.0, 3).tolist()) for i in range(self.__meshCount)]
+        self.__batch = MeshBatch(meshes)
+
+        # generate and bind the vao
+        self.__vao = glGenVertexArrays(1)
+        glBindVertexArray(self.__vao)
+
+        # set up generic attrib pointers for the shared buffers
+        self.__batch.bind()
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * 4, None)
+
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * 4, ctypes.c_void_p(3 * 4))
+
+        # the instances of every mesh are placed on a grid 4 units apart,
+        # mixed with the other meshes
+        counts = [self.__instancesPerMesh] * self.__meshCount
+        total = self.__batch.setInstances(counts)
+        side = int(math.ceil(total ** (1.0 / 3.0)))
+        cells = np.indices((side, side, side)).reshape(3, -1).T[random.permutation(side ** 3)[:total]]
+        store = InstanceStore(total)
+        store.add(4.0 * (cells - 0.5 * (side - 1)),
+                  axisAngleQuaternions(random.normal(size=(total, 3)), random.uniform(0.0, math.pi, total)),
+                  random.uniform(0.5, 1.0, total))
+        matrices = store.matrices()
+        self.__distance = 4.0 * side
+
+        # the model matrices, one mat4 attribute per instance
+        self.__instanceBuffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.__instanceBuffer)
+        glBufferData(GL_ARRAY_BUFFER, matrices.nbytes, matrices, GL_STATIC_DRAW)
+        for column in range(4):
+            glEnableVertexAttribArray(2 + column)
+            glVertexAttribPointer(2 + column, 4, GL_FLOAT, GL_FALSE, 64, ctypes.c_void_p(16 * column))
+            glVertexAttribDivisor(2 + column, 1)
+
+        glBindVertexArray(0)
+
+        # we are drawing 3d objects so we want depth testing
+        glEnable(GL_DEPTH_TEST)
+
+    def renderGL(self):
+        """opengl render method"""
+        # get the time in seconds
+        t = glfwGetTime()
+
+        # clear first
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        # use the shader program
+        glUseProgram(self.__shaderProgram)
+
+        # calculate ViewProjection matrix
+        projection = glm.perspective(90.0, 4.0 / 3.0, 1.0, 4.0 * self.__distance)
+
+        # translate the world/view position
+        view = glm.translate(glm.mat4(1.0), glm.vec3(0.0, 0.0, -self.__distance))
+
+        # make the camera rotate around the origin
+        view = glm.rotate(view, 10.0 * t, glm.vec3(1.0, 1.0, 1.0))
+
+        viewProjection = np.array(projection * view, dtype=np.float32)
+
+        # set the uniform
+        glUniformMatrix4fv(self.__vpLocation, 1, GL_FALSE, viewProjection)
+
+        # bind the vao
+        glBindVertexArray(self.__vao)
+
+        # draw all meshes
+        start = timer()
+        if self.__drawMode == 'indirect':
+            self.__batch.draw()
+        else:
+            self.__batch.drawLoop()
+        self.submitTime = (timer() - start) * 1000.0
+
+        glBindVertexArray(0)
+        glUseProgram(0)
+
+    def initWindow(self):
+        """setup window options. etc, opengl version"""
+        # select opengl version, multi draw indirect needs 4.3
+        glfwWindowHint(GLFW_OPENGL_PROFILE, GLFW_OPENGL_CORE_PROFILE)
+        glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 4)
+        glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
+
+    def show(self):
+        """create the window and show it"""
+        self.initWindow()
+
+        self.window = glfwCreateWindow(self.width, self.height, self.title, 0, 0)
+        if self.window == 0:
+            glfwTerminate()
+            raise Exception('failed to open window')
+
+        glfwMakeContextCurrent(self.window)
+
+        # initialize opengl
+        self.initGL()
+
+        while not glfwWindowShouldClose(self.window):
+            glfwPollEvents()
+
+            self.renderGL()
+
+            # check for errors
+            error = glGetError()
+            if error != GL_NO_ERROR:
+                raise Exception(error)
+
+            # finally swap buffers
+            glfwSwapBuffers(self.window)
+
+        self.close()
+
+    def release(self):
+        """free the helpers of the window, the window and glfw are kept"""
+        if self.__batch:
+            self.__batch.delete()
+            self.__batch = None
+
+    def close(self):
+        self.release()
+        glfwDestroyWindow(self.window)
+        glfwTerminate()
+
+
+
+if __name__ == '__main__':
+    import os.path
+
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    title = os.path.basename(__file__)
+    win = Window(title=title[:-3])
+    win.show()
@@ -4,22 +4,47 @@
 # Uses a geometry shader to expand points to billboard quads.
 # The billboards are then blended while drawing to create a galaxy
 # made of particles.
+# blending='alpha' draws the particles alpha blended back to front, they
+# are sorted by depth every frame with a gpu radix sort (radixsort.py).
+# targetFrameTime=<ms> adapts the number of active particles, up to
+# particleCount, to the measured frame time (see budget.py).
+# spread shapes the galaxy, arms=<n> gathers the stars around n spiral
+# arms. With galaxyCache=<directory> the generated galaxy is kept in a
+# .npy file there and later runs with the same parameters upload it
+# straight from the memory mapped file.
+# billboards='instanced' or 'points' draws the particles as instanced
+# quads or point sprites instead of with the geometry shader (see
+# billboards.py).
+# lod=True builds an octree over the stars at startup and every frame only
+# draws the nodes that are smaller than lodPixels on screen as one point
+# of summed brightness (see octree.py).
+# splatScale=0.5 or 0.25 blends the particles into a float framebuffer at
+# that fraction of the window resolution and upsamples it to the window
+# with splatFilter='bilinear' or 'bicubic' (see splat.py).
 
 import math
-from random import random as rand
 import ctypes
 
 import numpy as np
 from OpenGL.GL import *
-from OpenGL.GL import shaders
 
 from glfw import *
 import glm
 
+from billboards import BillboardProgram
+from budget import ParticleBudget
+import initializers
+from octree import StarOctree
+from radixsort import RadixSort
+from splat import SplatBuffer
+
 
 class Window(object):
 
-    def __init__(self, width=640, height=480, title='GLFW opengl window'):
+    def __init__(self, width=640, height=480, title='GLFW opengl window', particleCount=128 * 1024,
+                 blending='additive', targetFrameTime=None, arms=None, spread=1.0,
+                 galaxyCache=None, billboards='geometry', lod=False, lodPixels=2.0,
+                 splatScale=1.0, splatFilter='bilinear'):
         self.width = width
         self.height = height
         self.title = title
@@ -30,66 +55,116 @@ class Window(object):
         self.__fragmentShader = './shaders/%s.frag' % self.title
         self.__shaderProgram = None
         self.__vao = None
-
-        self.__viewLocation = None
-        self.__projLocation = None
-
-        self.__particles = 128 * 1024
-
-    def shaderFromFile(self, shaderType, shaderFile):
-        """read shader from file and compile it"""
-        shaderSrc = ''
-        with open(shaderFile) as sf:
-            shaderSrc = sf.read()
-
-        return shaders.compileShader(shaderSrc, shaderType)
+        self.__vbo = None
+
+        # how the points are expanded to quads
+        self.__billboardMode = billboards
+        self.__billboards = None
+
+        self.__particles = particleCount
+        # the first activeParticles are simulated and drawn, with a target
+        # frame time a ParticleBudget adapts them to the machine
+        self.activeParticles = particleCount
+        self.__budget = None
+        if targetFrameTime:
+            self.__budget = ParticleBudget(particleCount, targetFrameTime)
+            self.activeParticles = self.__budget.count
+
+        # 'additive' or 'alpha', alpha blending needs the particles
+        # sorted back to front (OpenGL 4.3)
+        if blending not in ('additive', 'alpha'):
+            raise ValueError('unknown blending %r' % blending)
+        self.__blending = blending
+        self.__sorter = None
+        if blending == 'alpha' and billboards == 'instanced':
+            raise ValueError('alpha blending draws through an index buffer, use geometry or points billboards')
+
+        self.__arms = arms
+        self.__spread = spread
+        self.__galaxyCache = galaxyCache
+
+        # draw a cut through an octree of the stars
+        if lod and (blending == 'alpha' or billboards == 'instanced' or targetFrameTime):
+            raise ValueError('lod draws through its own index buffer and sets the star count itself, '
+                             'it needs additive blending, geometry or points billboards and no targetFrameTime')
+        self.__lod = lod
+        self.__lodPixels = lodPixels
+        self.__octree = None
+        self.__lodIndices = None
+        # number of points drawn in the last frame
+        self.drawnParticles = 0
+
+        # blend into a lower resolution float buffer and upsample it
+        if splatScale != 1.0 and blending != 'additive':
+            raise ValueError('the splat buffer is composited additively, it needs additive blending')
+        self.__splatScale = splatScale
+        self.__splatFilter = splatFilter
+        self.__splat = None
 
     def initGL(self):
         """opengl initialization"""
-        # load shaders
-        vertexShader = self.shaderFromFile(GL_VERTEX_SHADER, self.__vertexShader)
-        geomShader = self.shaderFromFile(GL_GEOMETRY_SHADER, self.__geomShader)
-        fragmentShader = self.shaderFromFile(GL_FRAGMENT_SHADER, self.__fragmentShader)
-        self.__shaderProgram = shaders.compileProgram(vertexShader, geomShader, fragmentShader)
+        # load shaders, the quads are 2 units wide
+        self.__billboards = BillboardProgram(self.__billboardMode, self.__vertexShader, self.__geomShader,
+                                             self.__fragmentShader, 1.0)
+        self.__shaderProgram = self.__billboards.program
         if not self.__shaderProgram:
             self.close()
 
-        # obtain location of projection uniform
-        self.__viewLocation = glGetUniformLocation(self.__shaderProgram, 'View')
-        self.__projLocation = glGetUniformLocation(self.__shaderProgram, 'Projection')
-
         # generate and bind the vao
         self.__vao = glGenVertexArrays(1)
         glBindVertexArray(self.__vao)
 
-        # generate and bind the buffer object
-        vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        # generate the buffer object
+        self.__vbo = glGenBuffers(1)
 
         # create a galaxy like distribution of points
-        vertexData = []
-        for i in xrange(self.__particles):
-            arm = 3 * rand()
-            alpha = 1 / (.1 + math.pow(rand(), .7)) - 1/1.1
-            r = 4.0 * alpha
-            alpha += arm * 2.0 * 3.1416 / 3.0
-
-            x = r * math.sin(alpha)
-            y = 0
-            z = r * math.cos(alpha)
-
-            x += (4.0 - .2 * alpha) * (2 - rand() + rand() + rand() + rand())
-            y += (2.0 - .1 * alpha) * (2 - rand() + rand() + rand() + rand())
-            z += (4.0 - .2 * alpha) * (2 - rand() + rand() + rand() + rand())
-            vertexData.append((x, y, z))
-        vertexData = np.array(vertexData, dtype=np.float32)
-
-        # fill with data
-        glBufferData(GL_ARRAY_BUFFER, vertexData.nbytes, vertexData, GL_STATIC_DRAW)
+        if self.__lod:
+            # the octree nodes and the stars in octree order, with brightness
+            if self.__galaxyCache:
+                points = initializers.cachedGalaxy(self.__galaxyCache, self.__particles,
+                                                   arms=self.__arms, spread=self.__spread)
+            else:
+                points = np.empty((self.__particles, 3), dtype=np.float32)
+                for first, data in initializers.galaxyChunks(self.__particles, arms=self.__arms,
+                                                             spread=self.__spread):
+                    points[first:first + len(data)] = data
+            self.__octree = StarOctree(points)
+            del points
+
+            vertexData = self.__octree.vertices()
+            glBindBuffer(GL_ARRAY_BUFFER, self.__vbo)
+            glBufferData(GL_ARRAY_BUFFER, vertexData.nbytes, vertexData, GL_STATIC_DRAW)
+            del vertexData
+
+            self.__billboards.setAttributes(4)
+            glEnableVertexAttribArray(1)
+            glVertexAttribPointer(1, 1, GL_FLOAT, GL_FALSE, 4 * 4, ctypes.c_void_p(3 * 4))
+
+            # the cut is uploaded to the index buffer every frame
+            self.__lodIndices = glGenBuffers(1)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.__lodIndices)
+        elif self.__galaxyCache:
+            # generated once, then mapped from the cache and uploaded at once
+            vertexData = initializers.cachedGalaxy(self.__galaxyCache, self.__particles,
+                                                   arms=self.__arms, spread=self.__spread)
+            glBindBuffer(GL_ARRAY_BUFFER, self.__vbo)
+            glBufferData(GL_ARRAY_BUFFER, vertexData.nbytes, vertexData, GL_STATIC_DRAW)
+            del vertexData
+        else:
+            # fill the buffer with it chunk by chunk
+            chunks = initializers.galaxyChunks(self.__particles, arms=self.__arms, spread=self.__spread)
+            initializers.fillBuffers([self.__vbo], chunks, self.__particles * 3 * 4)
 
         # set up generic attrib pointers
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3 * 4, None)
+        if not self.__lod:
+            self.__billboards.setAttributes(3)
+            # every star has the same brightness
+            glVertexAttrib1f(1, 1.0)
+
+        if self.__blending == 'alpha':
+            # the sorted particle indices are the index buffer
+            self.__sorter = RadixSort(self.__particles)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.__sorter.values)
 
         glBindVertexArray(0)
 
@@ -98,19 +173,28 @@ class Window(object):
 
         # enable blending
         glEnable(GL_BLEND)
-        # and set the blend function to result = 1 * source + 1 * destination
-        glBlendFunc(GL_ONE, GL_ONE)
+        if self.__blending == 'alpha':
+            # the fragment shader outputs premultiplied colors so the
+            # blend function is result = source + (1 - source alpha) * destination
+            glBlendFunc(GL_ONE, GL_ONE_MINUS_SRC_ALPHA)
+        else:
+            # set the blend function to result = 1 * source + 1 * destination
+            glBlendFunc(GL_ONE, GL_ONE)
+
+        if self.__splatScale != 1.0:
+            self.__splat = SplatBuffer(self.width, self.height, self.__splatScale, self.__splatFilter)
 
     def renderGL(self):
         """opengl render method"""
         # get the time in seconds
         t = glfwGetTime()
+        if self.__budget:
+            self.__budget.begin()
 
         # clear first
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-
-        # use the shader program
-        glUseProgram(self.__shaderProgram)
+        if self.__splat:
+            self.__splat.begin()
 
         # calculate ViewProjection matrix
         projection = glm.perspective(90.0, 4.0 / 3.0, .1, 100.0)
@@ -124,25 +208,62 @@ class Window(object):
         view = glm.rotate(view, -22.5 * t, glm.vec3(0.0, 1.0, 0.0))
         view = np.array(view, dtype=np.float32)
 
-        # set the uniform
-        glUniformMatrix4fv(self.__viewLocation, 1, GL_FALSE, view)
-        glUniformMatrix4fv(self.__projLocation, 1, GL_FALSE, projection)
+        # draw
+        if self.__sorter:
+            # back to front through the sorted index buffer
+            self.__sorter.depthKeys(self.__vbo, self.activeParticles, view, stride=3)
+            self.__sorter.sort(self.activeParticles)
+
+        # the height in pixels of the framebuffer the points are drawn to
+        height = self.__splat.splatHeight if self.__splat else self.height
+
+        # use the shader program and set the uniforms
+        self.__billboards.use(view, projection, height)
 
         # bind the vao
         glBindVertexArray(self.__vao)
 
-        # draw
-        glDrawArrays(GL_POINTS, 0, self.__particles)
+        if self.__octree:
+            # the nodes and stars that cover at least lodPixels on screen
+            camera = np.linalg.inv(view.T)[0:3, 3]
+            indices = self.__octree.cut(np.dot(view, projection), camera, projection[1][1] * height / 2.0,
+                                        self.__lodPixels, math.sqrt(2.0))
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STREAM_DRAW)
+            self.__billboards.drawElements(len(indices))
+            self.drawnParticles = len(indices)
+        elif self.__sorter:
+            self.__billboards.drawElements(self.activeParticles)
+            self.drawnParticles = self.activeParticles
+        else:
+            self.__billboards.draw(self.activeParticles)
+            self.drawnParticles = self.activeParticles
 
         glBindVertexArray(0)
         glUseProgram(0)
 
+        if self.__splat:
+            self.__splat.end()
+
+        if self.__budget:
+            self.setActiveParticles(self.__budget.end())
+
+    def setActiveParticles(self, count):
+        """change the number of simulated and drawn particles"""
+        if count != self.activeParticles:
+            self.activeParticles = count
+            glfwSetWindowTitle(self.window, '%s - %d particles' % (self.title, count))
+
     def initWindow(self):
         """setup window options. etc, opengl version"""
         # select opengl version
         glfwWindowHint(GLFW_OPENGL_PROFILE, GLFW_OPENGL_CORE_PROFILE)
-        glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 3)
-        glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
+        if self.__blending == 'alpha':
+            # compute shaders are needed to sort the particles
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 4)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
+        else:
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 3)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
 
     def show(self):
         """create the window and show it"""
@@ -173,7 +294,20 @@ class Window(object):
 
         self.close()
 
+    def release(self):
+        """free the helpers of the window, the window and glfw are kept"""
+        if self.__budget:
+            self.__budget.delete()
+            self.__budget = None
+        if self.__sorter:
+            self.__sorter.delete()
+            self.__sorter = None
+        if self.__splat:
+            self.__splat.delete()
+            self.__splat = None
+
     def close(self):
+        self.release()
         glfwDestroyWindow(self.window)
         glfwTerminate()
 
@@ -5,23 +5,50 @@
 # The particles are animated on the cpu and uploaded every frame by
 # mapping vbos. Multiple vbos are used to triple buffer the particle
 # data.
+# record=<file>.npy captures the particle state every recordEvery frames,
+# restore=<file>.npy starts from a recorded frame (see checkpoint.py).
+# workers=n splits the simulation over n processes (see particlepool.py).
+# The simulation runs in fixed steps of timestep seconds, as many per
+# frame as real time requires but at most maxSubsteps (see timestep.py).
+# The drawn positions are interpolated between the last two steps.
+# culling=True only draws the particles inside the view frustum, they are
+# found and compacted with a compute shader (culling.py, OpenGL 4.3).
+# targetFrameTime=<ms> adapts the number of active particles, up to
+# particleCount, to the measured frame time (see budget.py).
+# billboards='instanced' or 'points' draws the particles as instanced
+# quads or point sprites instead of with the geometry shader (see
+# billboards.py).
+# splatScale=0.5 or 0.25 blends the particles into a float framebuffer at
+# that fraction of the window resolution and upsamples it to the window
+# with splatFilter='bilinear' or 'bicubic' (see splat.py).
 
-import math
 import ctypes
 from random import randint
-from random import random as rand
 
 import numpy as np
 from OpenGL.GL import *
-from OpenGL.GL import shaders
 
 from glfw import *
 import glm
 
+from billboards import BillboardProgram
+from budget import ParticleBudget
+import initializers
+from checkpoint import ParticleCheckpoint, ParticleRecorder
+from culling import ParticleCuller
+import particles
+from particlepool import ParticlePool
+from splat import SplatBuffer
+from timestep import FixedTimestep
+
 
 class Window(object):
 
-    def __init__(self, width=640, height=480, title='GLFW opengl window'):
+    def __init__(self, width=640, height=480, title='GLFW opengl window', particleCount=128 * 1024,
+                 record=None, recordEvery=10, restore=None, restoreFrame=-1, workers=0,
+                 timestep=1.0 / 60.0, maxSubsteps=4, realtime=True, culling=False,
+                 targetFrameTime=None, billboards='geometry', splatScale=1.0,
+                 splatFilter='bilinear'):
         self.width = width
         self.height = height
         self.title = title
@@ -34,104 +61,107 @@ class Window(object):
         self.__vao = None
         self.__vbo = None
 
-        self.__viewLocation = None
-        self.__projLocation = None
-
-        self.__particles = 128 * 1024
-        self.__tfShader = './shaders/09tfshader.vert'
-        self.__tshaderProgram = None
-        self.__centerLocation = None
-        self.__radiusLocation = None
-        self.__gLocation = None
-        self.__dtLocation = None
-        self.__bounceLocation = None
-        self.__seedLocation = None
+        # how the points are expanded to quads
+        self.__billboardMode = billboards
+        self.__billboards = None
+
+        self.__particles = particleCount
+        # the first activeParticles are simulated and drawn, with a target
+        # frame time a ParticleBudget adapts them to the machine
+        self.activeParticles = particleCount
+        self.__budget = None
+        if targetFrameTime:
+            self.__budget = ParticleBudget(particleCount, targetFrameTime)
+            self.activeParticles = self.__budget.count
+        # particle state on the cpu, interleaved position and velocity
+        self.__state = None
+        # interpolated positions that are uploaded for drawing
+        self.__drawPositions = None
+        # with workers > 0 the simulation is split over that many processes
+        self.__workers = workers
+        self.__pool = None
 
         self.__center = []
         self.__radius = []
         # physical parameters
-        self.__dt = 1.0 / 60.0
+        self.__dt = timestep
         self.__g = glm.vec3(0.0, -9.81, 0.0)
         self.__bounce = 1.2  # inelastic: 1.0, elastic: 2.0
+        # realtime=False runs one step per frame regardless of the time
+        self.__timestep = FixedTimestep(timestep, maxSubsteps, realtime)
 
         self.__currentBuffer = 0
-        self.__bufferCount = 2
-
-    def shaderFromFile(self, shaderType, shaderFile):
-        """read shader from file and compile it"""
-        shaderSrc = ''
-        with open(shaderFile) as sf:
-            shaderSrc = sf.read()
-
-        return shaders.compileShader(shaderSrc, shaderType)
+        self.__bufferCount = 3
+        self.__frame = 0
+
+        # record the particle state to a file every recordEvery frames
+        # and/or start from a frame of a recording
+        self.__recordFile = record
+        self.__recordEvery = recordEvery
+        self.__recorder = None
+        self.__restoreFile = restore
+        self.__restoreFrame = restoreFrame
+
+        # draw only the particles in the view frustum
+        self.__culling = culling
+        self.__culler = None
+        self.__cullVao = None
+
+        # blend into a lower resolution float buffer and upsample it
+        self.__splatScale = splatScale
+        self.__splatFilter = splatFilter
+        self.__splat = None
 
     def initGL(self):
         """opengl initialization"""
-        # load shaders
-        vertexShader = self.shaderFromFile(GL_VERTEX_SHADER, self.__vertexShader)
-        geomShader = self.shaderFromFile(GL_GEOMETRY_SHADER, self.__geomShader)
-        fragmentShader = self.shaderFromFile(GL_FRAGMENT_SHADER, self.__fragmentShader)
-        self.__shaderProgram = shaders.compileProgram(vertexShader, geomShader, fragmentShader)
+        # load shaders, the quads are 0.4 units wide
+        self.__billboards = BillboardProgram(self.__billboardMode, self.__vertexShader, self.__geomShader,
+                                             self.__fragmentShader, 0.2)
+        self.__shaderProgram = self.__billboards.program
         if not self.__shaderProgram:
             self.close()
 
-        # obtain location of projection uniform
-        self.__viewLocation = glGetUniformLocation(self.__shaderProgram, 'View')
-        self.__projLocation = glGetUniformLocation(self.__shaderProgram, 'Projection')
-
-        # transform feedback shader and program
-        tfShader = self.shaderFromFile(GL_VERTEX_SHADER, self.__tfShader)
-        self.__tshaderProgram = glCreateProgram()
-        glAttachShader(self.__tshaderProgram, tfShader)
-
-        # specify transform feedback output
-        varyings = (ctypes.c_char_p * 2)("outposition", "outvelocity")
-        c_array = ctypes.cast(varyings, ctypes.POINTER(ctypes.POINTER(ctypes.c_char)))
-        glTransformFeedbackVaryings(self.__tshaderProgram, len(varyings), c_array, GL_INTERLEAVED_ATTRIBS)
-
-        glLinkProgram(self.__tshaderProgram)
-
-        self.__centerLocation = glGetUniformLocation(self.__tshaderProgram, 'center')
-        self.__radiusLocation = glGetUniformLocation(self.__tshaderProgram, 'radius')
-        self.__gLocation = glGetUniformLocation(self.__tshaderProgram, 'g')
-        self.__dtLocation = glGetUniformLocation(self.__tshaderProgram, 'dt')
-        self.__bounceLocation = glGetUniformLocation(self.__tshaderProgram, 'bounce')
-        self.__seedLocation = glGetUniformLocation(self.__tshaderProgram, 'seed')
-
         # randomly place particles in a cube
-        vertexData = []
-        for i in xrange(self.__particles):
-            # initial position
-            pos = glm.vec3(.5 - rand(),
-                           .5 - rand(),
-                           .5 - rand())
-            vertexData.append(glm.vec3(0.0, 20.0, 0.0) + 5.0 * pos)
+        # the simulation state stays on the cpu
+        self.__state = np.empty((self.__particles, 6), dtype=np.float32)
+        for first, data in initializers.cubeChunks(self.__particles):
+            self.__state[first:first + len(data)] = data
 
-            # initial velocity
-            vertexData.append(glm.vec3(0.0, 0.0, 0.0))
+        if self.__restoreFile:
+            self.restoreCheckpoint(self.__restoreFile, self.__restoreFrame)
+        if self.__recordFile:
+            self.__recorder = ParticleRecorder(self.__recordFile, self.__particles, 6, self.__recordEvery)
 
         # generate vbos and vaos
         self.__vao = glGenVertexArrays(self.__bufferCount)
         self.__vbo = glGenBuffers(self.__bufferCount)
 
-        vertexData = np.array(vertexData, dtype=np.float32)
+        # only the positions are needed for drawing
+        positions = np.ascontiguousarray(self.__state[:, 0:3])
         for i in range(self.__bufferCount):
             glBindVertexArray(self.__vao[i])
 
             glBindBuffer(GL_ARRAY_BUFFER, self.__vbo[i])
 
-            # fill with initial data
-            glBufferData(GL_ARRAY_BUFFER, vertexData.nbytes, vertexData, GL_STATIC_DRAW)
+            # fill with initial data, the buffers are rewritten every frame
+            glBufferData(GL_ARRAY_BUFFER, positions.nbytes, positions, GL_STREAM_DRAW)
 
             # set up generic attrib pointers
-            glEnableVertexAttribArray(0)
-            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * 4, None)
-            # set up generic attrib pointers
-            glEnableVertexAttribArray(1)
-            glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * 4, ctypes.c_void_p(3 * 4))
+            self.__billboards.setAttributes(3)
 
         glBindVertexArray(0)
 
+        if self.__culling:
+            self.__culler = ParticleCuller(self.__particles, 3,
+                                           instanced=self.__billboardMode == 'instanced')
+
+            # the vao of the visible particles
+            self.__cullVao = glGenVertexArrays(1)
+            glBindVertexArray(self.__cullVao)
+            glBindBuffer(GL_ARRAY_BUFFER, self.__culler.particles)
+            self.__billboards.setAttributes(3)
+            glBindVertexArray(0)
+
         # we are blending so no depth testing
         glDisable(GL_DEPTH_TEST)
 
@@ -140,6 +170,9 @@ class Window(object):
         # and set the blend function to result = 1 * source + 1 * destination
         glBlendFunc(GL_ONE, GL_ONE)
 
+        if self.__splatScale != 1.0:
+            self.__splat = SplatBuffer(self.width, self.height, self.__splatScale, self.__splatFilter)
+
         # define sphere for the particles to bounce off
         center = []
         radius = []
@@ -153,48 +186,84 @@ class Window(object):
         self.__radius = np.array(radius, dtype=np.float32)
 
         # physical parameters
-        self.__dt = 1.0 / 60.0
         self.__g = np.array((0.0, -9.81, 0.0), dtype=np.float32)
         self.__bounce = 1.2
 
+        if self.__workers:
+            # move the state to the shared memory of the worker processes
+            self.__pool = ParticlePool(self.__particles, self.__center, self.__radius, self.__g,
+                                       self.__dt, self.__bounce, self.__workers)
+            self.__pool.state[...] = self.__state
+            self.__state = self.__pool.state
+
+        self.__drawPositions = np.empty((self.__particles, 3), dtype=np.float32)
+        self.__timestep.reset()
         self.__currentBuffer = 0
 
+    def restoreCheckpoint(self, path, frame=-1):
+        """load the particles of a recorded frame, -1 is the last one"""
+        checkpoint = ParticleCheckpoint(path)
+        if checkpoint.data.shape[1:] != (self.__particles, 6):
+            raise ValueError('%s holds %d particles, not %d' % (path, checkpoint.data.shape[1], self.__particles))
+
+        i = len(checkpoint) - 1 if frame < 0 else checkpoint.find(frame)
+        self.__state[...] = checkpoint.frame(i)
+        # continue with the frame after the recorded one
+        self.__frame = int(checkpoint.index['frame'][i]) + 1
+
+    def mapBuffer(self, vbo, count):
+        """map the first count particles of a vbo for writing and wrap them in a numpy array"""
+        size = count * 3 * 4
+
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        # invalidate: the old content is not needed anymore
+        # unsynchronized: the gpu is done with this buffer since it was
+        # last used __bufferCount frames ago, so don't wait for it
+        ptr = glMapBufferRange(GL_ARRAY_BUFFER, 0, size,
+                               GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT | GL_MAP_UNSYNCHRONIZED_BIT)
+        ptr = ctypes.cast(ptr, ctypes.POINTER(ctypes.c_float))
+        return np.ctypeslib.as_array(ptr, shape=(count, 3))
+
+    def simulate(self, t):
+        """advance the particles on the cpu by one timestep"""
+        seed = randint(0, 0x7fff)
+        if self.__pool:
+            self.__pool.step(seed, self.activeParticles)
+        else:
+            particles.step(self.__state[:self.activeParticles], self.__center, self.__radius, self.__g,
+                           self.__dt, self.__bounce, seed)
+
+        # the state is on the cpu already, record it directly
+        if self.__recorder and self.__recorder.wants(self.__frame):
+            self.__recorder.append(self.__state, self.__frame, t)
+        self.__frame += 1
+
     def renderGL(self):
         """opengl render method"""
         # get the time in seconds
         t = glfwGetTime()
+        if self.__budget:
+            self.__budget.begin()
 
-        # use the transform shader program
-        glUseProgram(self.__tshaderProgram)
-
-        # set the uniforms
-        glUniform3fv(self.__centerLocation, 3, self.__center)
-        glUniform1fv(self.__radiusLocation, 3, self.__radius)
-        glUniform3fv(self.__gLocation, 1, self.__g)
-        glUniform1f(self.__dtLocation, self.__dt)
-        glUniform1f(self.__bounceLocation, self.__bounce)
-        glUniform1i(self.__seedLocation, randint(0, 0x7fff))
-
-        # bind the current vao
-        glBindVertexArray(self.__vao[(self.__currentBuffer + 1) % self.__bufferCount])
+        # run as many timesteps as have passed since the last frame
+        for i in range(self.__timestep.advance(t)):
+            self.simulate(t)
 
-        # bind transform feedback target
-        glBindBufferBase(GL_TRANSFORM_FEEDBACK_BUFFER, 0, self.__vbo[self.__currentBuffer])
+        # interpolate between the last two steps: position - lag * velocity
+        n = self.activeParticles
+        np.multiply(self.__state[:n, 3:6], -self.__timestep.lag(), out=self.__drawPositions[:n])
+        self.__drawPositions[:n] += self.__state[:n, 0:3]
 
-        glEnable(GL_RASTERIZER_DISCARD)
-
-        # perform transform feedback
-        glBeginTransformFeedback(GL_POINTS)
-        glDrawArrays(GL_POINTS, 0, self.__particles)
-        glEndTransformFeedback()
-
-        glDisable(GL_RASTERIZER_DISCARD)
+        # stream the new positions into the next buffer of the ring
+        mapped = self.mapBuffer(self.__vbo[self.__currentBuffer], n)
+        np.copyto(mapped, self.__drawPositions[:n])
+        glUnmapBuffer(GL_ARRAY_BUFFER)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
 
         # clear first
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-
-        # use the shader program
-        glUseProgram(self.__shaderProgram)
+        if self.__splat:
+            self.__splat.begin()
 
         # calculate ViewProjection matrix
         projection = glm.perspective(90.0, 4.0 / 3.0, .1, 100.0)
@@ -208,28 +277,50 @@ class Window(object):
         view = glm.rotate(view, -22.5 * t, glm.vec3(0.0, 1.0, 0.0))
         view = np.array(view, dtype=np.float32)
 
-        # set the uniform
-        glUniformMatrix4fv(self.__viewLocation, 1, GL_FALSE, view)
-        glUniformMatrix4fv(self.__projLocation, 1, GL_FALSE, projection)
+        # draw
+        if self.__culler:
+            # the billboards are only built for the visible particles
+            self.__culler.cull(self.__vbo[self.__currentBuffer], self.activeParticles, np.dot(view, projection))
 
-        # bind the vao
-        glBindVertexArray(self.__vao[self.__currentBuffer])
+        # use the shader program and set the uniforms
+        self.__billboards.use(view, projection, self.__splat.splatHeight if self.__splat else self.height)
 
-        # draw
-        glDrawArrays(GL_POINTS, 0, self.__particles)
+        if self.__culler:
+            glBindVertexArray(self.__cullVao)
+            self.__billboards.drawCulled(self.__culler)
+        else:
+            glBindVertexArray(self.__vao[self.__currentBuffer])
+            self.__billboards.draw(self.activeParticles)
 
         glBindVertexArray(0)
         glUseProgram(0)
 
+        if self.__splat:
+            self.__splat.end()
+
         # advance buffer index
         self.__currentBuffer = (self.__currentBuffer + 1) % self.__bufferCount
 
+        if self.__budget:
+            self.setActiveParticles(self.__budget.end())
+
+    def setActiveParticles(self, count):
+        """change the number of simulated and drawn particles"""
+        if count != self.activeParticles:
+            self.activeParticles = count
+            glfwSetWindowTitle(self.window, '%s - %d particles' % (self.title, count))
+
     def initWindow(self):
         """setup window options. etc, opengl version"""
         # select opengl version
         glfwWindowHint(GLFW_OPENGL_PROFILE, GLFW_OPENGL_CORE_PROFILE)
-        glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 3)
-        glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
+        if self.__culling:
+            # compute shaders are needed to cull the particles
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 4)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
+        else:
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 3)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
 
     def show(self):
         """create the window and show it"""
@@ -260,7 +351,27 @@ class Window(object):
 
         self.close()
 
+    def release(self):
+        """free the helpers of the window, the window and glfw are kept"""
+        if self.__budget:
+            self.__budget.delete()
+            self.__budget = None
+        if self.__recorder:
+            self.__recorder.close()
+            self.__recorder = None
+        if self.__pool:
+            self.__state = None
+            self.__pool.close()
+            self.__pool = None
+        if self.__culler:
+            self.__culler.delete()
+            self.__culler = None
+        if self.__splat:
+            self.__splat.delete()
+            self.__splat = None
+
     def close(self):
+        self.release()
         glfwDestroyWindow(self.window)
         glfwTerminate()
 
@@ -4,11 +4,38 @@
 # This example simulates the same particle system as the buffer mapping
 # example. Instead of updating particles on the cpu and uploading
 # the update is done on the gpu with transform feedback.
+# With collisions=True the particles also collide with each other,
+# the neighbors are found through a spatial hash grid that is built
+# with compute shaders (OpenGL 4.3).
+# The particles bounce off a ColliderSet (colliders.py) of spheres and
+# boxes that is traversed through a bvh, so large collider sets are cheap.
+# record=<file>.npy captures the particle state every recordEvery frames,
+# restore=<file>.npy starts from a recorded frame (see checkpoint.py).
+# updateMode='compute' updates the particles in place with a compute
+# shader instead (OpenGL 4.3), space switches between the two update
+# paths at runtime. Both share the physics in shaders/09physics.glsl.
+# The simulation runs in fixed steps of timestep seconds, as many per
+# frame as real time requires but at most maxSubsteps (see timestep.py).
+# The vertex shader interpolates the drawn positions between the steps.
+# blending='alpha' draws the particles alpha blended back to front, they
+# are sorted by depth every frame with a gpu radix sort (radixsort.py).
+# culling=True only draws the particles inside the view frustum, they are
+# found and compacted with a compute shader (culling.py).
+# targetFrameTime=<ms> adapts the number of active particles, up to
+# particleCount, to the measured frame time (see budget.py).
+# emitters=True (or a list of emitters.Emitter) replaces the fixed
+# population with particles that are spawned by emitters and die after
+# their lifetime (OpenGL 4.0). The dead particles are dropped by a
+# geometry shader and the new ones appended in the same transform
+# feedback pass, glDrawTransformFeedback draws however many there are
+# without the cpu ever reading the count.
+# splatScale=0.5 or 0.25 blends the particles into a float framebuffer at
+# that fraction of the window resolution and upsamples it to the window
+# with splatFilter='bilinear' or 'bicubic' (see splat.py).
 
 import math
 import ctypes
 from random import randint
-from random import random as rand
 
 import numpy as np
 from OpenGL.GL import *
@@ -17,10 +44,27 @@ from OpenGL.GL import shaders
 from glfw import *
 import glm
 
+from budget import ParticleBudget
+import initializers
+from checkpoint import ParticleCheckpoint, ParticleRecorder
+from colliders import ColliderSet
+from culling import ParticleCuller
+import emitters as emittersModule
+import glutil
+from radixsort import RadixSort
+from spatialhash import SpatialHashGrid
+from splat import SplatBuffer
+from timestep import FixedTimestep
+
 
 class Window(object):
 
-    def __init__(self, width=640, height=480, title='GLFW opengl window'):
+    def __init__(self, width=640, height=480, title='GLFW opengl window', particleCount=128 * 1024,
+                 collisions=False, colliders=None, record=None, recordEvery=10,
+                 restore=None, restoreFrame=-1, updateMode='feedback',
+                 timestep=1.0 / 60.0, maxSubsteps=4, realtime=True, blending='additive',
+                 culling=False, targetFrameTime=None, emitters=None, splatScale=1.0,
+                 splatFilter='bilinear'):
         self.width = width
         self.height = height
         self.title = title
@@ -35,34 +79,114 @@ class Window(object):
 
         self.__viewLocation = None
         self.__projLocation = None
-
-        self.__particles = 128 * 1024
+        self.__lagLocation = None
+
+        self.__particles = particleCount
+        # the first activeParticles are simulated and drawn, with a target
+        # frame time a ParticleBudget adapts them to the machine
+        self.activeParticles = particleCount
+        self.__budget = None
+        if targetFrameTime:
+            self.__budget = ParticleBudget(particleCount, targetFrameTime)
+            self.activeParticles = self.__budget.count
         self.__tfShader = './shaders/09tfshader.vert'
         self.__tshaderProgram = None
-        self.__centerLocation = None
-        self.__radiusLocation = None
-        self.__gLocation = None
-        self.__dtLocation = None
-        self.__bounceLocation = None
-        self.__seedLocation = None
-
-        self.__center = []
-        self.__radius = []
+        self.__computeShader = './shaders/09particles.comp'
+        self.__cshaderProgram = None
+        self.__countLocation = None
+        # uniform locations of 09physics.glsl per update program
+        self.__physicsLocations = {}
+
+        # 'feedback' or 'compute', space toggles between them
+        if updateMode not in ('feedback', 'compute'):
+            raise ValueError('unknown update mode %r' % updateMode)
+        if updateMode == 'compute' and collisions:
+            raise ValueError('particle collisions need the feedback update mode')
+        self.__updateMode = updateMode
+        self.__space_down = False
+
+        # 'additive' or 'alpha', alpha blending needs the particles
+        # sorted back to front (OpenGL 4.3)
+        if blending not in ('additive', 'alpha'):
+            raise ValueError('unknown blending %r' % blending)
+        self.__blending = blending
+        self.__sorter = None
+
+        # draw only the particles in the view frustum (OpenGL 4.3)
+        if culling and blending == 'alpha':
+            raise ValueError('culling does not keep the sorted order of alpha blending')
+        self.__culling = culling
+        self.__culler = None
+        self.__cullVao = None
+
+        # blend into a lower resolution float buffer and upsample it
+        if splatScale != 1.0 and blending != 'additive':
+            raise ValueError('the splat buffer is composited additively, it needs additive blending')
+        self.__splatScale = splatScale
+        self.__splatFilter = splatFilter
+        self.__splat = None
+
+        # particles with lifetimes spawned by emitters, the population
+        # is kept in transform feedback objects (OpenGL 4.0)
+        if emitters is True:
+            emitters = emittersModule.defaultEmitters()
+        if emitters and (collisions or culling or record or restore or targetFrameTime or
+                         updateMode != 'feedback' or blending != 'additive'):
+            raise ValueError('emitters only work with the plain transform feedback update')
+        self.__emitters = emitters
+        self.__emitShader = './shaders/09emit.vert'
+        self.__emitGeomShader = './shaders/09emit.geom'
+        self.__eshaderProgram = None
+        self.__emitLocations = None
+        self.__tfo = None
+        self.__emptyVao = None
+        # the transform feedback objects only have a count once written to
+        self.__captured = [False, False]
+        # GL_TRANSFORM_FEEDBACK_PRIMITIVES_WRITTEN query of the population,
+        # read whenever the result is available
+        self.__populationQuery = None
+        self.__populationPending = False
+
+        # the ColliderSet the particles bounce off
+        self.__colliders = colliders
         # physical parameters
-        self.__dt = 1.0 / 60.0
+        self.__dt = timestep
         self.__g = glm.vec3(0.0, -9.81, 0.0)
         self.__bounce = 1.2  # inelastic: 1.0, elastic: 2.0
+        # realtime=False runs one step per frame regardless of the time
+        self.__timestep = FixedTimestep(timestep, maxSubsteps, realtime)
 
         self.__currentBuffer = 0
         self.__bufferCount = 2
-
-    def shaderFromFile(self, shaderType, shaderFile):
-        """read shader from file and compile it"""
-        shaderSrc = ''
-        with open(shaderFile) as sf:
-            shaderSrc = sf.read()
-
-        return shaders.compileShader(shaderSrc, shaderType)
+        self.__frame = 0
+
+        # record the particle state to a file every recordEvery frames
+        # and/or start from a frame of a recording
+        self.__recordFile = record
+        self.__recordEvery = recordEvery
+        self.__recorder = None
+        self.__restoreFile = restore
+        self.__restoreFrame = restoreFrame
+
+        # particle-particle collisions through a spatial hash grid,
+        # the grid is built with compute shaders (OpenGL 4.3)
+        self.__collisions = collisions
+        self.__grid = None
+        self.__particleTextures = None
+        self.__particleRadius = 0.05
+        self.__stiffness = 400.0
+        self.__damping = 4.0
+
+    def shaderFromFile(self, shaderType, shaderFile, defines=()):
+        """read shader from file and compile it
+        defines are inserted as #define lines after the #version line
+        and #include lines are resolved (see glutil.py)"""
+        return glutil.shaderFromFile(shaderType, shaderFile, defines)
+
+    def physicsLocations(self, program):
+        """look up the uniforms of 09physics.glsl in program"""
+        names = ('nodeCount', 'g', 'dt', 'bounce', 'seed')
+        return dict((name, glGetUniformLocation(program, name)) for name in names)
 
     def initGL(self):
         """opengl initialization"""
@@ -77,120 +201,359 @@ class Window(object):
         # obtain location of projection uniform
         self.__viewLocation = glGetUniformLocation(self.__shaderProgram, 'View')
         self.__projLocation = glGetUniformLocation(self.__shaderProgram, 'Projection')
+        self.__lagLocation = glGetUniformLocation(self.__shaderProgram, 'lag')
 
         # transform feedback shader and program
-        tfShader = self.shaderFromFile(GL_VERTEX_SHADER, self.__tfShader)
+        defines = ['PARTICLE_COLLISIONS'] if self.__collisions else []
+        tfShader = self.shaderFromFile(GL_VERTEX_SHADER, self.__tfShader, defines)
         self.__tshaderProgram = glCreateProgram()
         glAttachShader(self.__tshaderProgram, tfShader)
 
         # specify transform feedback output
-        varyings = (ctypes.c_char_p * 2)("outposition", "outvelocity")
+        varyings = (ctypes.c_char_p * 2)(b"outposition", b"outvelocity")
         c_array = ctypes.cast(varyings, ctypes.POINTER(ctypes.POINTER(ctypes.c_char)))
         glTransformFeedbackVaryings(self.__tshaderProgram, len(varyings), c_array, GL_INTERLEAVED_ATTRIBS)
 
         glLinkProgram(self.__tshaderProgram)
+        self.__physicsLocations[self.__tshaderProgram] = self.physicsLocations(self.__tshaderProgram)
 
-        self.__centerLocation = glGetUniformLocation(self.__tshaderProgram, 'center')
-        self.__radiusLocation = glGetUniformLocation(self.__tshaderProgram, 'radius')
-        self.__gLocation = glGetUniformLocation(self.__tshaderProgram, 'g')
-        self.__dtLocation = glGetUniformLocation(self.__tshaderProgram, 'dt')
-        self.__bounceLocation = glGetUniformLocation(self.__tshaderProgram, 'bounce')
-        self.__seedLocation = glGetUniformLocation(self.__tshaderProgram, 'seed')
-
-        # randomly place particles in a cube
-        vertexData = []
-        for i in xrange(self.__particles):
-            # initial position
-            pos = glm.vec3(.5 - rand(),
-                           .5 - rand(),
-                           .5 - rand())
-            vertexData.append(glm.vec3(0.0, 20.0, 0.0) + 5.0 * pos)
-
-            # initial velocity
-            vertexData.append(glm.vec3(0.0, 0.0, 0.0))
+        # the compute shader update needs OpenGL 4.3, without it
+        # only the transform feedback path is available
+        if (glGetIntegerv(GL_MAJOR_VERSION), glGetIntegerv(GL_MINOR_VERSION)) >= (4, 3):
+            self.__cshaderProgram = glutil.computeProgram(self.__computeShader)
+            self.__countLocation = glGetUniformLocation(self.__cshaderProgram, 'count')
+            self.__physicsLocations[self.__cshaderProgram] = self.physicsLocations(self.__cshaderProgram)
+        elif self.__updateMode == 'compute':
+            raise Exception('the compute update mode needs OpenGL 4.3')
 
         # generate vbos and vaos
         self.__vao = glGenVertexArrays(self.__bufferCount)
         self.__vbo = glGenBuffers(self.__bufferCount)
 
-        vertexData = np.array(vertexData, dtype=np.float32)
+        # position, velocity and with emitters the remaining lifetime
+        floats = 7 if self.__emitters else 6
+
+        if self.__emitters:
+            self.initEmitters()
+        else:
+            # randomly place particles in a cube and fill
+            # the buffers with it chunk by chunk
+            initializers.fillBuffers(self.__vbo, initializers.cubeChunks(self.__particles),
+                                     self.__particles * 6 * 4)
+
+        if self.__restoreFile:
+            self.restoreCheckpoint(self.__restoreFile, self.__restoreFrame)
+        if self.__recordFile:
+            self.__recorder = ParticleRecorder(self.__recordFile, self.__particles, 6, self.__recordEvery)
+
         for i in range(self.__bufferCount):
             glBindVertexArray(self.__vao[i])
 
             glBindBuffer(GL_ARRAY_BUFFER, self.__vbo[i])
 
-            # fill with initial data
-            glBufferData(GL_ARRAY_BUFFER, vertexData.nbytes, vertexData, GL_STATIC_DRAW)
-
             # set up generic attrib pointers
             glEnableVertexAttribArray(0)
-            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * 4, None)
+            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, floats * 4, None)
             # set up generic attrib pointers
             glEnableVertexAttribArray(1)
-            glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * 4, ctypes.c_void_p(3 * 4))
+            glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, floats * 4, ctypes.c_void_p(3 * 4))
+            if self.__emitters:
+                glEnableVertexAttribArray(2)
+                glVertexAttribPointer(2, 1, GL_FLOAT, GL_FALSE, floats * 4, ctypes.c_void_p(6 * 4))
 
         glBindVertexArray(0)
 
+        if self.__culling:
+            # the particles are drawn a bit behind the simulation and they
+            # move less than a unit in that time
+            self.__culler = ParticleCuller(self.__particles, 6, radius=1.0)
+
+            # the vao of the visible particles
+            self.__cullVao = glGenVertexArrays(1)
+            glBindVertexArray(self.__cullVao)
+            glBindBuffer(GL_ARRAY_BUFFER, self.__culler.particles)
+            glEnableVertexAttribArray(0)
+            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * 4, None)
+            glEnableVertexAttribArray(1)
+            glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * 4, ctypes.c_void_p(3 * 4))
+            glBindVertexArray(0)
+
+        if self.__collisions:
+            # cells are as big as a particle so touching particles
+            # are always in neighboring cells
+            self.__grid = SpatialHashGrid(self.__particles, 2.0 * self.__particleRadius)
+
+            # buffer textures to read the neighbors from the source vbo
+            self.__particleTextures = glGenTextures(self.__bufferCount)
+            for i in range(self.__bufferCount):
+                glBindTexture(GL_TEXTURE_BUFFER, self.__particleTextures[i])
+                glTexBuffer(GL_TEXTURE_BUFFER, GL_RGB32F, self.__vbo[i])
+            glBindTexture(GL_TEXTURE_BUFFER, 0)
+
+            # these uniforms never change
+            glUseProgram(self.__tshaderProgram)
+            glUniform1i(glGetUniformLocation(self.__tshaderProgram, 'particles'), 0)
+            glUniform1i(glGetUniformLocation(self.__tshaderProgram, 'cellStart'), 1)
+            glUniform1i(glGetUniformLocation(self.__tshaderProgram, 'sortedIndex'), 2)
+            glUniform1f(glGetUniformLocation(self.__tshaderProgram, 'cellSize'), self.__grid.cellSize)
+            glUniform1i(glGetUniformLocation(self.__tshaderProgram, 'tableSize'), self.__grid.tableSize)
+            glUniform1f(glGetUniformLocation(self.__tshaderProgram, 'particleRadius'), self.__particleRadius)
+            glUniform1f(glGetUniformLocation(self.__tshaderProgram, 'stiffness'), self.__stiffness)
+            glUniform1f(glGetUniformLocation(self.__tshaderProgram, 'damping'), self.__damping)
+            glUseProgram(0)
+
         # we are blending so no depth testing
         glDisable(GL_DEPTH_TEST)
 
         # enable blending
         glEnable(GL_BLEND)
-        # and set the blend function to result = 1 * source + 1 * destination
-        glBlendFunc(GL_ONE, GL_ONE)
+        if self.__blending == 'alpha':
+            # the fragment shader outputs premultiplied colors so the
+            # blend function is result = source + (1 - source alpha) * destination
+            glBlendFunc(GL_ONE, GL_ONE_MINUS_SRC_ALPHA)
+
+            # the sorted particle indices are the index buffer of both vaos
+            self.__sorter = RadixSort(self.__particles)
+            for vao in self.__vao:
+                glBindVertexArray(vao)
+                glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.__sorter.values)
+            glBindVertexArray(0)
+        else:
+            # set the blend function to result = 1 * source + 1 * destination
+            glBlendFunc(GL_ONE, GL_ONE)
+
+        if self.__splatScale != 1.0:
+            self.__splat = SplatBuffer(self.width, self.height, self.__splatScale, self.__splatFilter)
 
         # define sphere for the particles to bounce off
-        center = []
-        radius = []
-        center.append((0.0, 12.0, 1.0))
-        radius.append(3)
-        center.append((-3.0, 0.0, 0.0))
-        radius.append(7)
-        center.append((5.0, -10.0, 0.0))
-        radius.append(12)
-        self.__center = np.array(center, dtype=np.float32)
-        self.__radius = np.array(radius, dtype=np.float32)
+        if self.__colliders is None:
+            self.__colliders = ColliderSet()
+            self.__colliders.addSpheres(((0.0, 12.0, 1.0),
+                                         (-3.0, 0.0, 0.0),
+                                         (5.0, -10.0, 0.0)),
+                                        (3, 7, 12))
+
+        # the colliders are read from buffer textures on units 3-5
+        for program in self.__physicsLocations:
+            glUseProgram(program)
+            glUniform1i(glGetUniformLocation(program, 'colliders'), 3)
+            glUniform1i(glGetUniformLocation(program, 'nodeBounds'), 4)
+            glUniform1i(glGetUniformLocation(program, 'nodeLinks'), 5)
+        glUseProgram(0)
 
         # physical parameters
-        self.__dt = 1.0 / 60.0
         self.__g = np.array((0.0, -9.81, 0.0), dtype=np.float32)
         self.__bounce = 1.2
 
+        # the newest particles are in __currentBuffer
         self.__currentBuffer = 0
-
-    def renderGL(self):
-        """opengl render method"""
-        # get the time in seconds
-        t = glfwGetTime()
+        self.__timestep.reset()
+
+    def initEmitters(self):
+        """program, buffers and transform feedback objects of the emitters"""
+        vertexShader = self.shaderFromFile(GL_VERTEX_SHADER, self.__emitShader)
+        geomShader = self.shaderFromFile(GL_GEOMETRY_SHADER, self.__emitGeomShader)
+        self.__eshaderProgram = glCreateProgram()
+        glAttachShader(self.__eshaderProgram, vertexShader)
+        glAttachShader(self.__eshaderProgram, geomShader)
+
+        # the geometry shader output is captured
+        varyings = (ctypes.c_char_p * 3)(b"outposition", b"outvelocity", b"outlife")
+        c_array = ctypes.cast(varyings, ctypes.POINTER(ctypes.POINTER(ctypes.c_char)))
+        glTransformFeedbackVaryings(self.__eshaderProgram, len(varyings), c_array, GL_INTERLEAVED_ATTRIBS)
+
+        glLinkProgram(self.__eshaderProgram)
+        self.__physicsLocations[self.__eshaderProgram] = self.physicsLocations(self.__eshaderProgram)
+        names = ('spawn', 'emitterPosition', 'emitterVelocity', 'emitterSpread',
+                 'emitterSpeedSpread', 'emitterLife')
+        self.__emitLocations = dict((name, glGetUniformLocation(self.__eshaderProgram, name)) for name in names)
+
+        # the population starts empty, the buffers are the capacity
+        for vbo in self.__vbo:
+            glBindBuffer(GL_ARRAY_BUFFER, vbo)
+            glBufferData(GL_ARRAY_BUFFER, self.__particles * 7 * 4, None, GL_DYNAMIC_COPY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        # a transform feedback object per buffer remembers how many
+        # particles were written to it
+        self.__tfo = glGenTransformFeedbacks(self.__bufferCount)
+        for i in range(self.__bufferCount):
+            glBindTransformFeedback(GL_TRANSFORM_FEEDBACK, self.__tfo[i])
+            glBindBufferBase(GL_TRANSFORM_FEEDBACK_BUFFER, 0, self.__vbo[i])
+        glBindTransformFeedback(GL_TRANSFORM_FEEDBACK, 0)
+
+        # spawning reads no vertex attributes
+        self.__emptyVao = glGenVertexArrays(1)
+
+        self.__populationQuery = glGenQueries(1)[0]
+        self.activeParticles = 0
+
+    def restoreCheckpoint(self, path, frame=-1):
+        """load the particles of a recorded frame, -1 is the last one"""
+        checkpoint = ParticleCheckpoint(path)
+        if checkpoint.data.shape[1:] != (self.__particles, 6):
+            raise ValueError('%s holds %d particles, not %d' % (path, checkpoint.data.shape[1], self.__particles))
+
+        i = len(checkpoint) - 1 if frame < 0 else checkpoint.find(frame)
+        for vbo in self.__vbo:
+            checkpoint.upload(vbo, i)
+        # continue with the frame after the recorded one
+        self.__frame = int(checkpoint.index['frame'][i]) + 1
+
+    def setPhysicsUniforms(self, program):
+        """set the uniforms of 09physics.glsl, program must be in use"""
+        locations = self.__physicsLocations[program]
+
+        # the colliders are only uploaded again when they changed
+        self.__colliders.upload()
+        self.__colliders.bindTextures(3, 4, 5)
+        glUniform1i(locations['nodeCount'], self.__colliders.nodeCount)
+
+        glUniform3fv(locations['g'], 1, self.__g)
+        glUniform1f(locations['dt'], self.__dt)
+        glUniform1f(locations['bounce'], self.__bounce)
+        glUniform1i(locations['seed'], randint(0, 0x7fff))
+
+    def updateFeedback(self, source, target):
+        """advance the particles from vbo source into vbo target"""
+        if self.__collisions:
+            # sort the particles into the grid and make the
+            # source particles and the grid visible to the shader
+            self.__grid.build(self.__vbo[source], self.activeParticles)
+            self.__grid.bindTextures(1, 2)
+            glActiveTexture(GL_TEXTURE0)
+            glBindTexture(GL_TEXTURE_BUFFER, self.__particleTextures[source])
 
         # use the transform shader program
         glUseProgram(self.__tshaderProgram)
-
-        # set the uniforms
-        glUniform3fv(self.__centerLocation, 3, self.__center)
-        glUniform1fv(self.__radiusLocation, 3, self.__radius)
-        glUniform3fv(self.__gLocation, 1, self.__g)
-        glUniform1f(self.__dtLocation, self.__dt)
-        glUniform1f(self.__bounceLocation, self.__bounce)
-        glUniform1i(self.__seedLocation, randint(0, 0x7fff))
+        self.setPhysicsUniforms(self.__tshaderProgram)
 
         # bind the current vao
-        glBindVertexArray(self.__vao[(self.__currentBuffer + 1) % self.__bufferCount])
+        glBindVertexArray(self.__vao[source])
 
         # bind transform feedback target
-        glBindBufferBase(GL_TRANSFORM_FEEDBACK_BUFFER, 0, self.__vbo[self.__currentBuffer])
+        glBindBufferBase(GL_TRANSFORM_FEEDBACK_BUFFER, 0, self.__vbo[target])
 
         glEnable(GL_RASTERIZER_DISCARD)
 
         # perform transform feedback
         glBeginTransformFeedback(GL_POINTS)
-        glDrawArrays(GL_POINTS, 0, self.__particles)
+        glDrawArrays(GL_POINTS, 0, self.activeParticles)
         glEndTransformFeedback()
 
         glDisable(GL_RASTERIZER_DISCARD)
+        glBindVertexArray(0)
+
+    def updateEmitters(self, source, target):
+        """advance the living particles from vbo source into vbo target
+        and append the newly spawned particles"""
+        glUseProgram(self.__eshaderProgram)
+        self.setPhysicsUniforms(self.__eshaderProgram)
+        locations = self.__emitLocations
+
+        glBindTransformFeedback(GL_TRANSFORM_FEEDBACK, self.__tfo[target])
+        glEnable(GL_RASTERIZER_DISCARD)
+
+        # count the population, but only when the last count was read
+        if not self.__populationPending:
+            glBeginQuery(GL_TRANSFORM_FEEDBACK_PRIMITIVES_WRITTEN, self.__populationQuery)
+
+        glBeginTransformFeedback(GL_POINTS)
+
+        # the survivors, the count of the last pass stays on the gpu
+        if self.__captured[source]:
+            glUniform1i(locations['spawn'], 0)
+            glBindVertexArray(self.__vao[source])
+            glDrawTransformFeedback(GL_POINTS, self.__tfo[source])
+
+        # new particles, the ones that don't fit anymore are dropped
+        glUniform1i(locations['spawn'], 1)
+        glBindVertexArray(self.__emptyVao)
+        for emitter in self.__emitters:
+            count = emitter.spawnCount(self.__dt)
+            if count:
+                glUniform3fv(locations['emitterPosition'], 1, emitter.position)
+                glUniform3fv(locations['emitterVelocity'], 1, emitter.velocity)
+                glUniform1f(locations['emitterSpread'], emitter.spread)
+                glUniform1f(locations['emitterSpeedSpread'], emitter.speedSpread)
+                glUniform2fv(locations['emitterLife'], 1, emitter.life)
+                glUniform1i(self.__physicsLocations[self.__eshaderProgram]['seed'], randint(0, 0x7fff))
+                glDrawArrays(GL_POINTS, 0, count)
+
+        glEndTransformFeedback()
+
+        if not self.__populationPending:
+            glEndQuery(GL_TRANSFORM_FEEDBACK_PRIMITIVES_WRITTEN)
+            self.__populationPending = True
+
+        glDisable(GL_RASTERIZER_DISCARD)
+        glBindVertexArray(0)
+        glBindTransformFeedback(GL_TRANSFORM_FEEDBACK, 0)
+        self.__captured[target] = True
+
+    def pollPopulation(self):
+        """update activeParticles once the population count arrived"""
+        if self.__populationPending and glGetQueryObjectuiv(self.__populationQuery, GL_QUERY_RESULT_AVAILABLE):
+            self.__populationPending = False
+            self.setActiveParticles(int(glGetQueryObjectuiv(self.__populationQuery, GL_QUERY_RESULT)))
+
+    def updateCompute(self, target):
+        """advance the particles in vbo target in place"""
+        glUseProgram(self.__cshaderProgram)
+        self.setPhysicsUniforms(self.__cshaderProgram)
+        glUniform1i(self.__countLocation, self.activeParticles)
+
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, self.__vbo[target])
+        glDispatchCompute(glutil.workGroups(self.activeParticles, 256), 1, 1)
+        # the buffer is read as vertex attributes and copied by the recorder next
+        glMemoryBarrier(GL_VERTEX_ATTRIB_ARRAY_BARRIER_BIT | GL_BUFFER_UPDATE_BARRIER_BIT)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, 0)
+
+    def simulate(self, t):
+        """advance the particles by one timestep"""
+        if self.__emitters:
+            target = (self.__currentBuffer + 1) % self.__bufferCount
+            self.updateEmitters(self.__currentBuffer, target)
+            self.__currentBuffer = target
+        elif self.__updateMode == 'compute':
+            # update in place
+            self.updateCompute(self.__currentBuffer)
+        else:
+            # ping pong between the buffers
+            target = (self.__currentBuffer + 1) % self.__bufferCount
+            self.updateFeedback(self.__currentBuffer, target)
+            self.__currentBuffer = target
+
+        # record the new state, the recorder reads it back asynchronously
+        if self.__recorder and self.__recorder.wants(self.__frame):
+            self.__recorder.capture(self.__vbo[self.__currentBuffer], self.__frame, t)
+        self.__frame += 1
+
+    def renderGL(self):
+        """opengl render method"""
+        # get the time in seconds
+        t = glfwGetTime()
+        if self.__budget:
+            self.__budget.begin()
+
+        # switch the update path with space
+        if glfwGetKey(self.window, GLFW_KEY_SPACE) and not self.__space_down:
+            if self.__cshaderProgram and not self.__collisions:
+                self.__updateMode = 'compute' if self.__updateMode == 'feedback' else 'feedback'
+        self.__space_down = glfwGetKey(self.window, GLFW_KEY_SPACE)
+
+        # run as many timesteps as have passed since the last frame
+        for i in range(self.__timestep.advance(t)):
+            self.simulate(t)
+        if self.__recorder:
+            self.__recorder.poll()
+        if self.__emitters:
+            self.pollPopulation()
 
         # clear first
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        if self.__splat:
+            self.__splat.begin()
 
         # use the shader program
         glUseProgram(self.__shaderProgram)
@@ -210,25 +573,65 @@ class Window(object):
         # set the uniform
         glUniformMatrix4fv(self.__viewLocation, 1, GL_FALSE, view)
         glUniformMatrix4fv(self.__projLocation, 1, GL_FALSE, projection)
+        # interpolate between the last two steps
+        glUniform1f(self.__lagLocation, self.__timestep.lag())
 
         # bind the vao
         glBindVertexArray(self.__vao[self.__currentBuffer])
 
         # draw
-        glDrawArrays(GL_POINTS, 0, self.__particles)
+        if self.__sorter:
+            # back to front through the sorted index buffer, the sort
+            # ignores the interpolation which moves particles very little
+            self.__sorter.depthKeys(self.__vbo[self.__currentBuffer], self.activeParticles, view)
+            self.__sorter.sort(self.activeParticles)
+            glUseProgram(self.__shaderProgram)
+            glDrawElements(GL_POINTS, self.activeParticles, GL_UNSIGNED_INT, None)
+        elif self.__emitters:
+            # as many particles as were written by the last update
+            if self.__captured[self.__currentBuffer]:
+                glDrawTransformFeedback(GL_POINTS, self.__tfo[self.__currentBuffer])
+        elif self.__culler:
+            # the geometry shader only runs for the visible particles
+            self.__culler.cull(self.__vbo[self.__currentBuffer], self.activeParticles, np.dot(view, projection))
+            glUseProgram(self.__shaderProgram)
+            glBindVertexArray(self.__cullVao)
+            self.__culler.draw()
+        else:
+            glDrawArrays(GL_POINTS, 0, self.activeParticles)
 
         glBindVertexArray(0)
         glUseProgram(0)
 
-        # advance buffer index
-        self.__currentBuffer = (self.__currentBuffer + 1) % self.__bufferCount
+        if self.__splat:
+            self.__splat.end()
+
+        if self.__budget:
+            self.setActiveParticles(self.__budget.end())
+
+    def setActiveParticles(self, count):
+        """change the number of simulated and drawn particles"""
+        if count != self.activeParticles:
+            self.activeParticles = count
+            glfwSetWindowTitle(self.window, '%s - %d particles' % (self.title, count))
 
     def initWindow(self):
         """setup window options. etc, opengl version"""
         # select opengl version
         glfwWindowHint(GLFW_OPENGL_PROFILE, GLFW_OPENGL_CORE_PROFILE)
-        glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 3)
-        glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
+        if (self.__collisions or self.__updateMode == 'compute' or
+                self.__blending == 'alpha' or self.__culling):
+            # compute shaders are needed to build the grid,
+            # to update, sort or cull the particles
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 4)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
+        elif self.__emitters:
+            # transform feedback objects are needed to draw the population
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 4)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 0)
+        else:
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, 3)
+            glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, 3)
 
     def show(self):
         """create the window and show it"""
@@ -259,7 +662,23 @@ class Window(object):
 
         self.close()
 
+    def release(self):
+        """free the helpers of the window, the window and glfw are kept"""
+        if self.__budget:
+            self.__budget.delete()
+            self.__budget = None
+        if self.__recorder:
+            self.__recorder.close()
+            self.__recorder = None
+        for helper in (self.__culler, self.__grid, self.__sorter, self.__splat):
+            if helper:
+                helper.delete()
+        self.__culler = self.__grid = self.__sorter = self.__splat = None
+        if self.__colliders is not None:
+            self.__colliders.delete()
+
     def close(self):
+        self.release()
         glfwDestroyWindow(self.window)
         glfwTerminate()
 
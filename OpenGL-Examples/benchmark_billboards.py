@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - billboard strategies
+# Draws the galaxy of the geometry shader example and the particles of
+# the buffer mapping example with each billboard mode of billboards.py
+# (geometry shader, instanced quads, point sprites) at several particle
+# counts and reports the time per frame.
+# Under Mesa llvmpipe (LIBGL_ALWAYS_SOFTWARE=1) all shaders run on the
+# cpu, the renderer is printed so the results can be told apart.
+#
+# usage: python benchmark_billboards.py [particle counts...]
+
+import sys
+
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+from billboards import MODES
+
+
+# (label, example, window arguments)
+SAMPLES = (('07', '07geometry_shader_blending', {}),
+           ('08', '08map_buffer', {'realtime': False}))
+COUNTS = (128 * 1024, 512 * 1024, 1024 * 1024, 4096 * 1024)
+
+
+def main(counts=COUNTS, frames=30):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    headers = ['particles']
+    for label, sample, kwargs in SAMPLES:
+        headers += ['%s %s ms' % (label, mode) for mode in MODES]
+
+    renderer = None
+    rows = []
+    for count in counts:
+        row = [count]
+        for label, sample, kwargs in SAMPLES:
+            for mode in MODES:
+                win = benchutil.createWindow(sample, particleCount=count, billboards=mode, **kwargs)
+                renderer = glGetString(GL_RENDERER)
+                row.append(benchutil.median(benchutil.timeFrames(win, frames)))
+                benchutil.destroyWindow(win)
+        rows.append(row)
+
+    glfwTerminate()
+
+    print('renderer: %s' % renderer.decode())
+    benchutil.printTable(headers, rows)
+
+
+if __name__ == '__main__':
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    main(counts)
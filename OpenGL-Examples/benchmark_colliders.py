@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - collider bvh of the particle examples
+# Places random spheres and boxes (colliders.py) in a cube full of
+# particles and runs the particle update of 09tfshader.vert over them
+# with transform feedback, without gravity and particle collisions, so
+# the velocity only changes by the bounces found by the bvh traversal in
+# 09physics.glsl. The velocities are checked against the brute force
+# ColliderSet.bounceVelocity and the time of both is reported for
+# several collider counts. A particle on the surface of a collider up to
+# rounding may be inside on one side only, such particles are counted
+# instead of failing.
+#
+# usage: python benchmark_colliders.py [collider counts...]
+
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+from colliders import ColliderSet
+
+
+COUNTS = (3, 64, 1024)
+PARTICLES = 256 * 1024
+SIZE = 20.0
+BOUNCE = 1.2
+TOLERANCE = 1e-4
+# particles this close to a collider surface may bounce on one side only
+BORDERLINE = 1e-5
+
+
+def randomColliders(count, seed=0):
+    """count spheres and boxes, half each, spread over the cube and
+    overlapping each other"""
+    rng = np.random.default_rng(seed)
+    colliders = ColliderSet()
+    spheres = count // 2
+    scale = SIZE / max(1.0, count ** (1.0 / 3.0))
+    colliders.addSpheres(rng.uniform(-0.5 * SIZE, 0.5 * SIZE, (spheres, 3)),
+                         rng.uniform(0.2, 1.0, spheres) * scale)
+    colliders.addBoxes(rng.uniform(-0.5 * SIZE, 0.5 * SIZE, (count - spheres, 3)),
+                       rng.uniform(0.1, 0.6, (count - spheres, 3)) * scale)
+    return colliders
+
+
+def nearSurface(colliders, position):
+    """True for the positions within BORDERLINE of a collider surface"""
+    lower, upper = colliders.bounds()
+    center = 0.5 * (lower + upper)
+    extent = 0.5 * (upper - lower)
+    near = np.zeros(len(position), dtype=bool)
+    for c, e in zip(center.astype(np.float64), extent.astype(np.float64)):
+        diff = position - c
+        # spheres have equal extents, boxes are told apart by the
+        # distance to their faces
+        sphere = np.abs(np.sqrt((diff * diff).sum(axis=1)) - e[0])
+        box = np.abs(e - np.abs(diff)).min(axis=1)
+        near |= (sphere < BORDERLINE) | (box < BORDERLINE)
+    return near
+
+
+def feedbackProgram():
+    """the particle update of 09transform_feedback without gravity and
+    integration, so it only adds the bounces"""
+    program = benchutil.feedbackProgram('./shaders/09tfshader.vert')
+    glUseProgram(program)
+    glUniform1i(glGetUniformLocation(program, 'colliders'), 3)
+    glUniform1i(glGetUniformLocation(program, 'nodeBounds'), 4)
+    glUniform1i(glGetUniformLocation(program, 'nodeLinks'), 5)
+    glUniform3f(glGetUniformLocation(program, 'g'), 0.0, 0.0, 0.0)
+    glUniform1f(glGetUniformLocation(program, 'dt'), 0.0)
+    glUniform1f(glGetUniformLocation(program, 'bounce'), BOUNCE)
+    glUseProgram(0)
+    return program
+
+
+def checkColliders(count, program, state, vbo):
+    """time the bvh traversal and brute force and compare them
+    returns a row of the table"""
+    colliders = randomColliders(count)
+    colliders.upload()
+    colliders.bindTextures(3, 4, 5)
+    glUseProgram(program)
+    glUniform1i(glGetUniformLocation(program, 'nodeCount'), colliders.nodeCount)
+
+    glFinish()
+    start = timer()
+    result = benchutil.runFeedback(program, vbo, len(state))
+    gpuMs = (timer() - start) * 1000.0
+
+    start = timer()
+    dv = colliders.bounceVelocity(state[:, 0:3], state[:, 3:6], BOUNCE)
+    numpyMs = (timer() - start) * 1000.0
+
+    error = np.abs(result[:, 3:6] - state[:, 3:6] - dv).max(axis=1)
+    differ = np.flatnonzero(error >= TOLERANCE)
+    velocitiesMatch = bool(nearSurface(colliders, state[differ, 0:3].astype(np.float64)).all())
+    bounced = int(np.count_nonzero(np.abs(dv).max(axis=1) > 0.0))
+    return [count, colliders.nodeCount, bounced, gpuMs, numpyMs, len(differ), velocitiesMatch]
+
+
+def main(counts=COUNTS):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+    window = benchutil.createContext(4, 3)
+    renderer = glGetString(GL_RENDERER).decode()
+
+    # particles in the collider cube, far above the respawn height
+    rng = np.random.default_rng(1)
+    state = np.empty((PARTICLES, 6), dtype=np.float32)
+    state[:, 0:3] = rng.uniform(-0.5 * SIZE, 0.5 * SIZE, (PARTICLES, 3))
+    state[:, 3:6] = rng.standard_normal((PARTICLES, 3))
+    vbo = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, vbo)
+    glBufferData(GL_ARRAY_BUFFER, state.nbytes, state, GL_STATIC_DRAW)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    program = feedbackProgram()
+    rows = [checkColliders(count, program, state, vbo) for count in counts]
+    glDeleteProgram(program)
+    glDeleteBuffers(1, [vbo])
+
+    glfwDestroyWindow(window)
+    glfwTerminate()
+
+    print('renderer: %s' % renderer)
+    print('%d particles' % PARTICLES)
+    benchutil.printTable(['colliders', 'bvh nodes', 'bounced', 'bvh feedback ms', 'brute force numpy ms',
+                          'surface particles', 'matches numpy'], rows)
+
+
+if __name__ == '__main__':
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    main(counts)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - scaling of the multi process cpu particle simulation
+# Advances the particle system of the buffer mapping example with
+# particles.step in this process and with a ParticlePool for a growing
+# number of worker processes. Reports the time per step, the speedup
+# and whether the result is bit identical to the single process one.
+#
+# usage: python benchmark_cpusim.py [particle counts...]
+
+import multiprocessing as mp
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+import benchutil
+import initializers
+import particles
+from particlepool import ParticlePool
+
+
+COUNTS = (1024 * 1024, 4096 * 1024)
+STEPS = 50
+
+# the scene of the particle examples
+CENTER = ((0.0, 12.0, 1.0), (-3.0, 0.0, 0.0), (5.0, -10.0, 0.0))
+RADIUS = (3.0, 7.0, 12.0)
+G = (0.0, -9.81, 0.0)
+DT = 1.0 / 60.0
+BOUNCE = 1.2
+
+
+def workerCounts():
+    """1, 2, 4, ... up to the number of cores"""
+    counts = [1]
+    while counts[-1] * 2 <= mp.cpu_count():
+        counts.append(counts[-1] * 2)
+    if counts[-1] != mp.cpu_count():
+        counts.append(mp.cpu_count())
+    return counts
+
+
+def initialState(count):
+    state = np.empty((count, 6), dtype=np.float32)
+    for first, data in initializers.cubeChunks(count):
+        state[first:first + len(data)] = data
+    return state
+
+
+def main(counts=COUNTS, steps=STEPS):
+    rows = []
+    for count in counts:
+        reference = initialState(count)
+        start = timer()
+        for i in range(steps):
+            particles.step(reference, CENTER, RADIUS, G, DT, BOUNCE, i)
+        single = (timer() - start) * 1000.0 / steps
+        rows.append([count, 'single', single, 1.0, 'reference'])
+
+        for workers in workerCounts():
+            pool = ParticlePool(count, CENTER, RADIUS, G, DT, BOUNCE, workers)
+            pool.state[...] = initialState(count)
+
+            start = timer()
+            for i in range(steps):
+                pool.step(i)
+            ms = (timer() - start) * 1000.0 / steps
+
+            identical = np.array_equal(pool.state, reference)
+            pool.close()
+            rows.append([count, workers, ms, single / ms, 'yes' if identical else 'NO'])
+
+    benchutil.printTable(['particles', 'workers', 'ms/step', 'speedup', 'bit identical'], rows)
+
+
+if __name__ == '__main__':
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    main(counts)
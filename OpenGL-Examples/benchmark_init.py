@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - startup time of the galaxy and particle examples
+# Compares the original per particle python loops with the chunked
+# numpy initializers, reporting generation time and peak host memory,
+# then measures the complete initGL of the examples, for the galaxy
+# example also when it is loaded from the galaxy cache.
+#
+# usage: python benchmark_init.py [particle counts...]
+
+import math
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from random import random as rand
+from timeit import default_timer as timer
+
+import numpy as np
+from OpenGL.GL import *
+
+from glfw import *
+import glm
+
+import benchutil
+import initializers
+
+
+COUNTS = (128 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+# the python loops take minutes beyond this
+LOOP_LIMIT = 1024 * 1024
+
+
+def loopCube(count):
+    """the original particle initialization"""
+    vertexData = []
+    for i in range(count):
+        pos = glm.vec3(.5 - rand(),
+                       .5 - rand(),
+                       .5 - rand())
+        vertexData.append(glm.vec3(0.0, 20.0, 0.0) + 5.0 * pos)
+        vertexData.append(glm.vec3(0.0, 0.0, 0.0))
+    return np.array(vertexData, dtype=np.float32)
+
+
+def loopGalaxy(count):
+    """the original galaxy initialization"""
+    vertexData = []
+    for i in range(count):
+        arm = 3 * rand()
+        alpha = 1 / (.1 + math.pow(rand(), .7)) - 1/1.1
+        r = 4.0 * alpha
+        alpha += arm * 2.0 * 3.1416 / 3.0
+
+        x = r * math.sin(alpha)
+        y = 0
+        z = r * math.cos(alpha)
+
+        x += (4.0 - .2 * alpha) * (2 - rand() + rand() + rand() + rand())
+        y += (2.0 - .1 * alpha) * (2 - rand() + rand() + rand() + rand())
+        z += (4.0 - .2 * alpha) * (2 - rand() + rand() + rand() + rand())
+        vertexData.append((x, y, z))
+    return np.array(vertexData, dtype=np.float32)
+
+
+def consume(chunks):
+    """run a chunk generator the way fillBuffers does, dropping every chunk"""
+    for first, data in chunks:
+        pass
+
+
+def measure(func, *args):
+    """returns (seconds, peak MB) of a call"""
+    tracemalloc.start()
+    start = timer()
+    func(*args)
+    seconds = timer() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / (1024.0 * 1024.0)
+
+
+def generation(counts):
+    rows = []
+    for count in counts:
+        for name, loop, chunks in (('cube', loopCube, initializers.cubeChunks),
+                                   ('galaxy', loopGalaxy, initializers.galaxyChunks)):
+            row = [name, count]
+            if count <= LOOP_LIMIT:
+                row += list(measure(loop, count))
+            else:
+                row += ['-', '-']
+            row += list(measure(consume, chunks(count)))
+            rows.append(row)
+
+    benchutil.printTable(['data', 'particles', 'loop s', 'loop MB', 'numpy s', 'numpy MB'], rows)
+
+
+def initTime(sample, **kwargs):
+    """seconds to create and initialize the window of an example"""
+    start = timer()
+    win = benchutil.createWindow(sample, **kwargs)
+    glFinish()
+    seconds = timer() - start
+    benchutil.destroyWindow(win)
+    return seconds
+
+
+def startup(counts):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    cache = tempfile.mkdtemp()
+    rows = []
+    try:
+        for count in counts:
+            row = [count]
+            for sample in ('07geometry_shader_blending', '08map_buffer', '09transform_feedback'):
+                row.append(initTime(sample, particleCount=count))
+
+            # the first run writes the cache, the second one maps it
+            initTime('07geometry_shader_blending', particleCount=count, galaxyCache=cache)
+            row.append(initTime('07geometry_shader_blending', particleCount=count, galaxyCache=cache))
+            rows.append(row)
+    finally:
+        shutil.rmtree(cache)
+
+    glfwTerminate()
+
+    benchutil.printTable(['particles', '07 init s', '08 init s', '09 init s', '07 cached init s'], rows)
+
+
+if __name__ == '__main__':
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    generation(counts)
+    print('')
+    startup(counts)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - per instance data paths
+# Draws the same grid of cubes with the three instancing examples:
+#   06instancing1                  offsets as vertex attribute with divisor
+#   06instancing2_buffer_texture   offsets read from a buffer texture
+#   06instancing3_uniform_buffer   model matrices in uniform buffer chunks
+# at several instance counts and reports the median cpu time renderGL
+# takes to submit a frame and the median gpu time of a frame measured
+# with a GL_TIME_ELAPSED timer query. The per frame times of every run
+# are written to a JSON file, the medians are printed as table.
+# Under Mesa llvmpipe (LIBGL_ALWAYS_SOFTWARE=1) all shaders run on the
+# cpu, the renderer is printed so the results can be told apart.
+#
+# usage: python benchmark_instancing.py [json file] [instance counts...]
+
+import json
+import sys
+
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+
+
+# (label, example)
+SAMPLES = (('attrib divisor', '06instancing1'),
+           ('buffer texture', '06instancing2_buffer_texture'),
+           ('uniform buffer', '06instancing3_uniform_buffer'))
+COUNTS = (8, 1000, 100 * 1000, 1000 * 1000)
+
+
+def main(jsonFile='benchmark_instancing.json', counts=COUNTS, frames=20):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    renderer = None
+    results = []
+    for count in counts:
+        for label, sample in SAMPLES:
+            win = benchutil.createWindow(sample, instanceCount=count)
+            renderer = glGetString(GL_RENDERER).decode()
+            submit, gpu = benchutil.timeFramesGPU(win, frames)
+            benchutil.destroyWindow(win)
+
+            results.append({'example': sample, 'path': label, 'instances': count,
+                            'submit ms': submit, 'gpu ms': gpu})
+
+    glfwTerminate()
+
+    with open(jsonFile, 'w') as f:
+        json.dump({'renderer': renderer, 'frames': frames, 'results': results}, f, indent=1)
+
+    rows = []
+    for result in results:
+        rows.append([result['path'], result['instances'], benchutil.median(result['submit ms']),
+                     benchutil.median(result['gpu ms'])])
+
+    print('renderer: %s' % renderer)
+    benchutil.printTable(['data path', 'instances', 'submit ms', 'gpu ms'], rows)
+    print('per frame times written to %s' % jsonFile)
+
+
+if __name__ == '__main__':
+    jsonFile = sys.argv[1] if len(sys.argv) > 1 else 'benchmark_instancing.json'
+    counts = [int(c) for c in sys.argv[2:]] or COUNTS
+    main(jsonFile, counts)
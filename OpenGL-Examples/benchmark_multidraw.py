@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - draw call overhead
+# Draws the scene of the multi draw indirect example with different
+# numbers of meshes, once with one glMultiDrawElementsIndirect call and
+# once with one python draw call per mesh, and reports the time per
+# frame and the cpu time spent submitting the draw calls. Every mesh has
+# few instances, so the gpu work stays small and the cost of the draw
+# calls shows.
+# Under Mesa llvmpipe (LIBGL_ALWAYS_SOFTWARE=1) all shaders run on the
+# cpu, the renderer is printed so the results can be told apart.
+#
+# usage: python benchmark_multidraw.py [mesh counts...]
+
+import sys
+
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+
+
+SAMPLE = '06instancing5_multidraw'
+MODES = ('indirect', 'loop')
+COUNTS = (16, 256, 1024, 4096)
+INSTANCES = 4
+
+
+def main(counts=COUNTS, frames=30):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    headers = ['meshes']
+    for mode in MODES:
+        headers += ['%s ms' % mode, '%s submit ms' % mode]
+
+    renderer = None
+    rows = []
+    for count in counts:
+        row = [count]
+        for mode in MODES:
+            win = benchutil.createWindow(SAMPLE, meshCount=count, instancesPerMesh=INSTANCES, drawMode=mode)
+            renderer = glGetString(GL_RENDERER)
+
+            # the submit time of every timed frame
+            submit = []
+            render = win.renderGL
+
+            def renderGL():
+                render()
+                submit.append(win.submitTime)
+            win.renderGL = renderGL
+
+            row.append(benchutil.median(benchutil.timeFrames(win, frames)))
+            row.append(benchutil.median(submit[-frames:]))
+            benchutil.destroyWindow(win)
+        rows.append(row)
+
+    glfwTerminate()
+
+    print('renderer: %s' % renderer.decode())
+    benchutil.printTable(headers, rows)
+
+
+if __name__ == '__main__':
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    main(counts)
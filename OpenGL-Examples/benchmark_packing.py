@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - packed instance data
+# Draws the spinning crowd of the instancing example with the instance
+# transforms as float32 matrices and in the packed formats of packing.py
+# and reports the bytes per instance, the size of the instance buffer,
+# the cpu time to build the data of all instances (matrices or packing)
+# and the time per frame. Every frame rebuilds and uploads all instances.
+# Under Mesa llvmpipe (LIBGL_ALWAYS_SOFTWARE=1) all shaders run on the
+# cpu, the renderer is printed so the results can be told apart.
+#
+# usage: python benchmark_packing.py [instance counts...]
+
+import math
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+from instancing import InstanceStore, axisAngleQuaternions, gridPositions, modelMatrices
+import packing
+
+
+SAMPLE = '06instancing4_crowd'
+# (label, window arguments)
+VARIANTS = (('matrix texture', {'storage': 'texture'}),
+            ('matrix attributes', {'storage': 'attributes'}),
+            ('float32', {'storage': 'attributes', 'instanceFormat': 'float32'}),
+            ('snorm16', {'storage': 'attributes', 'instanceFormat': 'snorm16'}),
+            ('2_10_10_10', {'storage': 'attributes', 'instanceFormat': '2_10_10_10'}))
+COUNTS = (100 * 1000, 1000 * 1000)
+
+
+def buildTime(count, format, repeat=5):
+    """median cpu time in milliseconds to build the data of count instances"""
+    store = InstanceStore(count)
+    random = np.random.RandomState(0)
+    store.add(gridPositions(count), axisAngleQuaternions(random.normal(size=(count, 3)),
+                                                         random.uniform(0.0, math.pi, count)),
+              random.uniform(0.3, 1.0, count))
+    if format == 'matrix':
+        out = np.empty((count, 4, 4), dtype=np.float32)
+    else:
+        out = np.empty(count, dtype=packing.DTYPES[format])
+
+    times = []
+    for i in range(repeat):
+        start = timer()
+        if format == 'matrix':
+            modelMatrices(store.positions, store.rotations, store.scales, out)
+        else:
+            packing.packInstances(store.positions, store.rotations, store.scales[:, 0], format, out)
+        times.append((timer() - start) * 1000.0)
+    return benchutil.median(times), out.nbytes // count
+
+
+def main(counts=COUNTS, frames=10):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    renderer = None
+    rows = []
+    for count in counts:
+        for label, kwargs in VARIANTS:
+            build, itemSize = buildTime(count, kwargs.get('instanceFormat', 'matrix'))
+
+            win = benchutil.createWindow(SAMPLE, instanceCount=count, **kwargs)
+            renderer = glGetString(GL_RENDERER)
+            ms = benchutil.median(benchutil.timeFrames(win, frames, 2))
+            benchutil.destroyWindow(win)
+
+            rows.append([label, count, itemSize, itemSize * count / float(1 << 20), build, ms])
+
+    glfwTerminate()
+
+    print('renderer: %s' % renderer.decode())
+    benchutil.printTable(['format', 'instances', 'bytes', 'buffer MB', 'build ms', 'frame ms'], rows)
+
+
+if __name__ == '__main__':
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    main(counts)
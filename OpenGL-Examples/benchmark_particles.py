@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - cpu simulation and streaming vs transform feedback
+# Runs the particle system of the buffer mapping example (numpy
+# integrator, uploaded through mapped vbos) and of the transform
+# feedback example (updated on the gpu, with and without particle
+# collisions) at several particle counts and reports the time per
+# frame and the particle throughput. The transform feedback example is
+# also run with its compute shader update path, which updates the
+# particles in place in a storage buffer, and with frustum culling
+# before the geometry shader.
+# Under Mesa llvmpipe (LIBGL_ALWAYS_SOFTWARE=1) all shaders run on the
+# cpu, the renderer is printed so the results can be told apart.
+#
+# usage: python benchmark_particles.py [particle counts...]
+
+import sys
+
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+
+
+# (label, example, window arguments)
+SAMPLES = (('08 cpu', '08map_buffer', {}),
+           ('09 tf', '09transform_feedback', {}),
+           ('09 tf collisions', '09transform_feedback', {'collisions': True}),
+           ('09 compute', '09transform_feedback', {'updateMode': 'compute'}),
+           ('09 tf culled', '09transform_feedback', {'culling': True}))
+COUNTS = (128 * 1024, 512 * 1024, 1024 * 1024, 4096 * 1024)
+
+
+def main(counts=COUNTS, frames=60):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    headers = ['particles']
+    for label, sample, kwargs in SAMPLES:
+        headers += ['%s ms' % label, 'Mparticles/s']
+
+    renderer = None
+    rows = []
+    for count in counts:
+        row = [count]
+        for label, sample, kwargs in SAMPLES:
+            # one simulation step per frame, however long the frame takes
+            win = benchutil.createWindow(sample, particleCount=count, realtime=False, **kwargs)
+            renderer = glGetString(GL_RENDERER)
+            ms = benchutil.median(benchutil.timeFrames(win, frames))
+            benchutil.destroyWindow(win)
+
+            row += [ms, count / ms / 1000.0]
+        rows.append(row)
+
+    glfwTerminate()
+
+    print('renderer: %s' % renderer.decode())
+    benchutil.printTable(headers, rows)
+
+
+if __name__ == '__main__':
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    main(counts)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - gpu radix sort
+# Sorts random float keys with an index payload with RadixSort
+# (radixsort.py) at several key counts, checks the result against
+# numpy's stable argsort and reports the time per sort. Also times
+# depthKeys + sort for particles, which is what the alpha blended
+# examples do every frame.
+#
+# usage: python benchmark_radixsort.py [key counts...]
+
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+import radixsort
+from radixsort import RadixSort
+
+
+COUNTS = (64 * 1024, 256 * 1024, 1024 * 1024, 4096 * 1024)
+REPEATS = 10
+
+
+def upload(buf, data):
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, buf)
+    glBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, data.nbytes, data)
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+
+def download(buf, count):
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, buf)
+    data = glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, count * 4)
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+    return np.frombuffer(data, dtype=np.uint32)
+
+
+def timeSort(sorter, count, keys):
+    """sort keys REPEATS times, returns the times in ms and the last result"""
+    indices = np.arange(count, dtype=np.uint32)
+    times = []
+    for i in range(REPEATS):
+        upload(sorter.keys, keys)
+        upload(sorter.values, indices)
+        glFinish()
+
+        start = timer()
+        sorter.sort(count)
+        glFinish()
+        times.append((timer() - start) * 1000.0)
+
+    return times, download(sorter.keys, count), download(sorter.values, count)
+
+
+def timeDepthSort(sorter, count, view):
+    """depth keys of count particles and their sort, time in ms"""
+    particles = np.random.uniform(-20.0, 20.0, (count, 6)).astype(np.float32)
+    vbo = glGenBuffers(1)
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, vbo)
+    glBufferData(GL_SHADER_STORAGE_BUFFER, particles.nbytes, particles, GL_STATIC_DRAW)
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+    times = []
+    for i in range(REPEATS):
+        glFinish()
+        start = timer()
+        sorter.depthKeys(vbo, count, view)
+        sorter.sort(count)
+        glFinish()
+        times.append((timer() - start) * 1000.0)
+
+    # back to front: the view space z goes up
+    depth = np.dot(particles[:, 0:3], view[0:3, 2]) + view[3, 2]
+    order = download(sorter.values, count)
+    correct = np.array_equal(order, radixsort.sortReference(radixsort.floatKeys(depth)))
+
+    glDeleteBuffers(1, [vbo])
+    return times, correct
+
+
+def main(counts=COUNTS):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+    window = benchutil.createContext(4, 3)
+    renderer = glGetString(GL_RENDERER).decode()
+
+    # a camera 30 units away, view[i] is column i
+    view = np.identity(4, dtype=np.float32)
+    view[3, 2] = -30.0
+
+    sorter = RadixSort(max(counts))
+    headers = ['keys', 'sort ms', 'Mkeys/s', 'matches argsort', 'depth + sort ms', 'matches argsort']
+    rows = []
+    for count in counts:
+        keys = radixsort.floatKeys(np.random.standard_normal(count) * 100.0)
+        times, sortedKeys, values = timeSort(sorter, count, keys)
+        order = radixsort.sortReference(keys)
+        correct = np.array_equal(values, order) and np.array_equal(sortedKeys, keys[order])
+        ms = benchutil.median(times)
+
+        depthTimes, depthCorrect = timeDepthSort(sorter, count, view)
+        rows.append([count, ms, count / ms / 1000.0, correct, benchutil.median(depthTimes), depthCorrect])
+
+    glfwDestroyWindow(window)
+    glfwTerminate()
+
+    print('renderer: %s' % renderer)
+    benchutil.printTable(headers, rows)
+
+
+if __name__ == '__main__':
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    main(counts)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - asynchronous readback
+# Reads every frame back to the cpu while rendering and reports the
+# frame times. The fbo example reads its color texture back through a
+# ReadbackRing (readback.py), compared with no readback and with a
+# synchronous glReadPixels after every frame. The transform feedback
+# example records its particle buffer every frame (checkpoint.py).
+# The frames are timed like a render loop without glFinish after each
+# one, so a readback that waits for the gpu shows up as a slower frame
+# while the ring should keep the frame time flat.
+#
+# usage: python benchmark_readback.py [frames]
+
+import os
+import shutil
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+import numpy as np
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+
+
+class Counter(object):
+    """readback callback that counts the frames and touches the data"""
+
+    def __init__(self):
+        self.frames = 0
+        self.checksum = 0
+
+    def __call__(self, data, tag):
+        self.frames += 1
+        self.checksum += int(data[0, 0, 0])
+
+
+WARMUP = 5
+
+
+def timePipelined(win, frames, after=None):
+    """render frames without waiting for the gpu in between, returns the
+    time of each in milliseconds. after(win) is called after every frame"""
+    for i in range(WARMUP):
+        win.renderGL()
+        if after:
+            after(win)
+    glFinish()
+
+    times = []
+    for i in range(frames):
+        start = timer()
+        win.renderGL()
+        if after:
+            after(win)
+        glFlush()
+        times.append((timer() - start) * 1000.0)
+
+        # check for errors
+        error = glGetError()
+        if error != GL_NO_ERROR:
+            raise Exception(error)
+
+    glFinish()
+    return times
+
+
+def readPixelsSync(win):
+    """read the whole frame into a numpy array, waits for the gpu"""
+    data = glReadPixels(0, 0, win.width, win.height, GL_RGBA, GL_UNSIGNED_BYTE)
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def main(frames=300):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    tmp = tempfile.mkdtemp()
+    counter = Counter()
+    # (example, readback, window arguments, called after every frame)
+    runs = (('05fbo_fxaa', 'off', {}, None),
+            ('05fbo_fxaa', 'ring', {'readbackCallback': counter}, None),
+            ('05fbo_fxaa', 'glReadPixels', {}, readPixelsSync),
+            ('09transform_feedback', 'off', {'realtime': False}, None),
+            ('09transform_feedback', 'ring', {'realtime': False, 'recordEvery': 1,
+                                              'record': os.path.join(tmp, 'record.npy')}, None))
+
+    headers = ['example', 'readback', 'median ms', '95% ms', 'max ms']
+    renderer = None
+    rows = []
+    try:
+        for sample, label, kwargs, after in runs:
+            win = benchutil.createWindow(sample, **kwargs)
+            renderer = glGetString(GL_RENDERER)
+            times = timePipelined(win, frames, after)
+            benchutil.destroyWindow(win)
+
+            rows.append([sample, label, benchutil.median(times), percentile(times, 95), max(times)])
+    finally:
+        shutil.rmtree(tmp)
+
+    glfwTerminate()
+
+    print('renderer: %s' % renderer.decode())
+    benchutil.printTable(headers, rows)
+    # copies still in flight when the window is destroyed are dropped
+    print('ring readbacks: %d of %d frames' % (counter.frames, frames + WARMUP))
+
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    main(frames)
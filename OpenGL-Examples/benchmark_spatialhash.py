@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - spatial hash grid for particle collisions
+# Builds the grid of SpatialHashGrid (spatialhash.py) for random
+# particles in a cube at several particle counts and reports the time
+# per build next to the numpy reference buildGrid. Checks the gpu grid
+# against the reference: cellStart has to be equal and every hash table
+# entry has to hold the same particles (the gpu does not keep their
+# order). Then runs the collision pass of 09tfshader.vert over the grid
+# and checks the velocities against the reference collide, which is in
+# turn checked against a brute force O(n^2) reference on few particles.
+# A pair at a distance of exactly two radii may touch on one side and
+# not on the other, such particles are counted instead of failing.
+#
+# usage: python benchmark_spatialhash.py [particle counts...]
+
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+import spatialhash
+from spatialhash import SpatialHashGrid
+
+
+COUNTS = (16 * 1024, 128 * 1024, 1024 * 1024)
+REPEATS = 10
+BRUTE_FORCE_COUNT = 3000
+
+# the collision parameters of 09transform_feedback
+RADIUS = 0.05
+STIFFNESS = 400.0
+DAMPING = 4.0
+DT = 0.01
+# the velocities are sums in different orders
+TOLERANCE = 1e-4
+# pairs this close to touching may touch on the gpu and not in numpy
+BORDERLINE = 1e-6
+
+
+def randomParticles(count, seed=0):
+    """(count, 6) particles in a cube as dense as in the examples, 5
+    units wide for 1M particles, with random velocities"""
+    rng = np.random.default_rng(seed)
+    size = 5.0 * (count / (1024.0 * 1024.0)) ** (1.0 / 3.0)
+    state = np.empty((count, 6), dtype=np.float32)
+    state[:, 0:3] = rng.uniform(-0.5 * size, 0.5 * size, (count, 3))
+    state[:, 3:6] = rng.standard_normal((count, 3))
+    return state
+
+
+def bruteForce(state, radius, stiffness, damping, dt):
+    """velocity change of collide from all pairs of particles"""
+    pos = state[:, 0:3].astype(np.float64)
+    vel = state[:, 3:6].astype(np.float64)
+    diff = pos[:, None] - pos[None]
+    dist2 = np.einsum('ijk,ijk->ij', diff, diff)
+    touch = (dist2 < (2.0 * radius) ** 2) & (dist2 > 0.0)
+    dist = np.sqrt(np.where(touch, dist2, 1.0))
+    n = diff / dist[:, :, None]
+    vn = np.einsum('ijk,ijk->ij', vel[:, None] - vel[None], n)
+    force = np.where(touch, stiffness * (2.0 * radius - dist) - damping * vn, 0.0)
+    return dt * np.einsum('ij,ijk->ik', force, n)
+
+
+def borderline(state, i, radius):
+    """True if particle i has a neighbor at a distance of 2 * radius up
+    to rounding, the damping makes its velocity jump there"""
+    pos = state[:, 0:3].astype(np.float64)
+    dist = np.sqrt(((pos - pos[i]) ** 2).sum(axis=1))
+    return bool((np.abs(dist - 2.0 * radius) < BORDERLINE).any())
+
+
+def download(buf, count):
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, buf)
+    data = glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, count * 4)
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+    return np.frombuffer(data, dtype=np.uint32)
+
+
+def sameCells(sortedIndex, reference, cellStart):
+    """True if every hash table entry holds the same particles"""
+    # sorting inside every entry makes the orders comparable
+    entry = np.repeat(np.arange(len(cellStart) - 1), np.diff(cellStart.astype(np.int64)))
+    a = sortedIndex[np.lexsort((sortedIndex, entry))]
+    b = reference[np.lexsort((reference, entry))]
+    return np.array_equal(a, b)
+
+
+def collisionProgram():
+    """the particle update of 09transform_feedback with collisions, no
+    gravity and no colliders, so it only adds the contact forces"""
+    program = benchutil.feedbackProgram('./shaders/09tfshader.vert', ['PARTICLE_COLLISIONS'])
+    glUseProgram(program)
+    # every sampler type on a unit of its own
+    for name, unit in (('particles', 0), ('cellStart', 1), ('sortedIndex', 2),
+                       ('colliders', 3), ('nodeBounds', 4), ('nodeLinks', 5)):
+        glUniform1i(glGetUniformLocation(program, name), unit)
+    glUniform1i(glGetUniformLocation(program, 'nodeCount'), 0)
+    glUniform3f(glGetUniformLocation(program, 'g'), 0.0, 0.0, 0.0)
+    glUniform1f(glGetUniformLocation(program, 'dt'), DT)
+    glUniform1f(glGetUniformLocation(program, 'particleRadius'), RADIUS)
+    glUniform1f(glGetUniformLocation(program, 'stiffness'), STIFFNESS)
+    glUniform1f(glGetUniformLocation(program, 'damping'), DAMPING)
+    glUseProgram(0)
+    return program
+
+
+def checkGrid(count, program):
+    """time the gpu grid and check it and the collisions against numpy
+    returns a row of the table"""
+    state = randomParticles(count)
+    grid = SpatialHashGrid(count, 2.0 * RADIUS)
+
+    vbo = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, vbo)
+    glBufferData(GL_ARRAY_BUFFER, state.nbytes, state, GL_STATIC_DRAW)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    times = []
+    for i in range(REPEATS):
+        glFinish()
+        start = timer()
+        grid.build(vbo, count)
+        glFinish()
+        times.append((timer() - start) * 1000.0)
+
+    start = timer()
+    reference = spatialhash.buildGrid(state[:, 0:3], grid.cellSize, grid.tableSize)
+    numpyMs = (timer() - start) * 1000.0
+
+    cellStart = download(grid.cellStart, grid.tableSize + 1)
+    sortedIndex = download(grid.sortedIndex, count)
+    startsMatch = np.array_equal(cellStart, reference[1])
+    cellsMatch = startsMatch and sameCells(sortedIndex, reference[0], cellStart)
+
+    # the collision pass reads the particles through a buffer texture
+    texture = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_BUFFER, texture)
+    glTexBuffer(GL_TEXTURE_BUFFER, GL_RGB32F, vbo)
+    glBindTexture(GL_TEXTURE_BUFFER, 0)
+    glUseProgram(program)
+    glUniform1f(glGetUniformLocation(program, 'cellSize'), grid.cellSize)
+    glUniform1i(glGetUniformLocation(program, 'tableSize'), grid.tableSize)
+    grid.bindTextures(1, 2)
+    glActiveTexture(GL_TEXTURE0)
+    glBindTexture(GL_TEXTURE_BUFFER, texture)
+    result = benchutil.runFeedback(program, vbo, count)
+
+    dv = spatialhash.collide(state, reference, grid.cellSize, grid.tableSize, RADIUS, STIFFNESS, DAMPING, DT)
+    error = np.abs(result[:, 3:6] - state[:, 3:6] - dv).max(axis=1)
+    differ = np.flatnonzero(error >= TOLERANCE)
+    # the few differing particles, if any, have to sit on a contact
+    # border, brute force over all particles is cheap for them
+    velocitiesMatch = all(borderline(state, i, RADIUS) for i in differ)
+
+    glDeleteTextures([texture])
+    glDeleteBuffers(1, [vbo])
+    return [count, benchutil.median(times), numpyMs, startsMatch, cellsMatch, len(differ), velocitiesMatch]
+
+
+def main(counts=COUNTS):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+    window = benchutil.createContext(4, 3)
+    renderer = glGetString(GL_RENDERER).decode()
+
+    # the reference itself, on few particles and several table sizes
+    state = randomParticles(BRUTE_FORCE_COUNT)
+    exact = bruteForce(state, RADIUS, STIFFNESS, DAMPING, DT)
+    bruteRows = []
+    for tableSize in (1024, 4096, 1 << 16):
+        grid = spatialhash.buildGrid(state[:, 0:3], 2.0 * RADIUS, tableSize)
+        dv = spatialhash.collide(state, grid, 2.0 * RADIUS, tableSize, RADIUS, STIFFNESS, DAMPING, DT)
+        error = float(np.abs(dv - exact).max())
+        bruteRows.append([BRUTE_FORCE_COUNT, tableSize, error, error < TOLERANCE])
+
+    program = collisionProgram()
+    rows = [checkGrid(count, program) for count in counts]
+    glDeleteProgram(program)
+
+    glfwDestroyWindow(window)
+    glfwTerminate()
+
+    print('renderer: %s' % renderer)
+    benchutil.printTable(['particles', 'table size', 'collide max error', 'matches brute force'], bruteRows)
+    print('')
+    benchutil.printTable(['particles', 'build ms', 'numpy build ms', 'cellStart matches', 'cells match',
+                          'borderline particles', 'matches collide'], rows)
+
+
+if __name__ == '__main__':
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    main(counts)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# benchmark - low resolution splat buffer
+# Renders the galaxy and the transform feedback particles at full
+# resolution and through a SplatBuffer (splat.py) at 1/2 and 1/4 of the
+# window resolution with bilinear and bicubic upsampling. Reports the
+# time per frame and how much the image differs from the full
+# resolution one: the mean absolute difference of the 8 bit color
+# channels and the PSNR. The compared images are rendered at the same
+# time so the camera is in the same place.
+# Under Mesa llvmpipe (LIBGL_ALWAYS_SOFTWARE=1) all shaders run on the
+# cpu, the renderer is printed so the results can be told apart.
+#
+# usage: python benchmark_splat.py [frames]
+
+import math
+import sys
+
+import numpy as np
+from OpenGL.GL import *
+
+from glfw import *
+
+import benchutil
+
+
+# (label, example, window arguments)
+SAMPLES = (('07 galaxy', '07geometry_shader_blending', {}),
+           ('09 particles', '09transform_feedback', {'realtime': False}))
+# (scale, filter)
+SPLATS = ((1.0, 'bilinear'), (0.5, 'bilinear'), (0.5, 'bicubic'), (0.25, 'bilinear'), (0.25, 'bicubic'))
+# the time the compared images are rendered at
+IMAGE_TIME = 10.0
+
+
+def frameImage(win):
+    """render a frame at IMAGE_TIME and read it back as (h, w, 3) uint8"""
+    glfwSetTime(IMAGE_TIME)
+    win.renderGL()
+    data = glReadPixels(0, 0, win.width, win.height, GL_RGB, GL_UNSIGNED_BYTE)
+    return np.frombuffer(data, dtype=np.uint8).reshape(win.height, win.width, 3)
+
+
+def difference(image, reference):
+    """mean absolute difference and PSNR in dB of two 8 bit images"""
+    diff = image.astype(np.float64) - reference
+    mse = (diff ** 2).mean()
+    psnr = 10.0 * math.log10(255.0 ** 2 / mse) if mse > 0.0 else float('inf')
+    return np.abs(diff).mean(), psnr
+
+
+def main(frames=30):
+    if glfwInit() == GL_FALSE:
+        raise Exception('failed to init GLFW')
+
+    renderer = None
+    rows = []
+    for label, sample, kwargs in SAMPLES:
+        reference = None
+        for scale, filter in SPLATS:
+            win = benchutil.createWindow(sample, splatScale=scale, splatFilter=filter, **kwargs)
+            renderer = glGetString(GL_RENDERER)
+            glPixelStorei(GL_PACK_ALIGNMENT, 1)
+
+            image = frameImage(win)
+            if reference is None:
+                reference = image
+            ms = benchutil.median(benchutil.timeFrames(win, frames))
+            benchutil.destroyWindow(win)
+
+            mean, psnr = difference(image, reference)
+            rows.append([label, scale, filter if scale != 1.0 else '-', ms, mean, psnr])
+
+    glfwTerminate()
+
+    print('renderer: %s' % renderer.decode())
+    benchutil.printTable(['example', 'scale', 'filter', 'ms', 'mean diff', 'PSNR dB'], rows)
+
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    main(frames)
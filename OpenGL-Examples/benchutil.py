@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+# helpers shared by the benchmark scripts
+# The examples are driven through their own Window classes in a hidden
+# glfw window, so the benchmarks measure exactly the code the examples
+# show. Run the benchmarks from the OpenGL-Examples directory so the
+# shaders are found.
+
+import ctypes
+import importlib
+from timeit import default_timer as timer
+
+import numpy as np
+from OpenGL.GL import *
+
+from glfw import *
+
+import glutil
+from timing import queryResult64
+
+
+def createWindow(sample, **kwargs):
+    """create the window of an example hidden and initialize it
+    sample is the file name of the example without .py"""
+    module = importlib.import_module(sample)
+    win = module.Window(title=sample, **kwargs)
+
+    win.initWindow()
+    glfwWindowHint(GLFW_VISIBLE, GL_FALSE)
+
+    win.window = glfwCreateWindow(win.width, win.height, win.title, 0, 0)
+    if win.window == 0:
+        raise Exception('failed to open window')
+
+    glfwMakeContextCurrent(win.window)
+
+    win.initGL()
+    return win
+
+
+def createContext(major=4, minor=3):
+    """create a hidden window with a core profile context of at least
+    the given version for benchmarks of the reusable components"""
+    glfwWindowHint(GLFW_OPENGL_PROFILE, GLFW_OPENGL_CORE_PROFILE)
+    glfwWindowHint(GLFW_CONTEXT_VERSION_MAJOR, major)
+    glfwWindowHint(GLFW_CONTEXT_VERSION_MINOR, minor)
+    glfwWindowHint(GLFW_VISIBLE, GL_FALSE)
+
+    window = glfwCreateWindow(64, 64, 'benchmark', 0, 0)
+    if window == 0:
+        raise Exception('failed to open window')
+
+    glfwMakeContextCurrent(window)
+    return window
+
+
+def destroyWindow(win):
+    """free the helpers of a window created by createWindow and destroy
+    it, glfw is kept for the next window"""
+    if hasattr(win, 'release'):
+        win.release()
+    glfwDestroyWindow(win.window)
+    win.window = None
+
+
+def feedbackProgram(shaderFile, defines=()):
+    """program of a particle update vertex shader writing outposition and
+    outvelocity with transform feedback, like the one of 09transform_feedback"""
+    program = glCreateProgram()
+    glAttachShader(program, glutil.shaderFromFile(GL_VERTEX_SHADER, shaderFile, defines))
+    varyings = (ctypes.c_char_p * 2)(b'outposition', b'outvelocity')
+    glTransformFeedbackVaryings(program, 2, ctypes.cast(varyings, ctypes.POINTER(ctypes.POINTER(ctypes.c_char))),
+                                GL_INTERLEAVED_ATTRIBS)
+    glLinkProgram(program)
+    if not glGetProgramiv(program, GL_LINK_STATUS):
+        raise Exception(glGetProgramInfoLog(program))
+    return program
+
+
+def runFeedback(program, particleBuffer, count):
+    """run a feedback program over the first count (position, velocity)
+    particles of a buffer, its uniforms have to be set
+    returns the (count, 6) float32 particles it wrote"""
+    vao = glGenVertexArrays(1)
+    glBindVertexArray(vao)
+    glBindBuffer(GL_ARRAY_BUFFER, particleBuffer)
+    glEnableVertexAttribArray(0)
+    glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * 4, None)
+    glEnableVertexAttribArray(1)
+    glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * 4, ctypes.c_void_p(3 * 4))
+
+    target = glGenBuffers(1)
+    glBindBuffer(GL_TRANSFORM_FEEDBACK_BUFFER, target)
+    glBufferData(GL_TRANSFORM_FEEDBACK_BUFFER, count * 6 * 4, None, GL_STREAM_READ)
+    glBindBufferBase(GL_TRANSFORM_FEEDBACK_BUFFER, 0, target)
+
+    glUseProgram(program)
+    glEnable(GL_RASTERIZER_DISCARD)
+    glBeginTransformFeedback(GL_POINTS)
+    glDrawArrays(GL_POINTS, 0, count)
+    glEndTransformFeedback()
+    glDisable(GL_RASTERIZER_DISCARD)
+    glUseProgram(0)
+    glBindVertexArray(0)
+
+    result = np.empty((count, 6), dtype=np.float32)
+    glGetBufferSubData(GL_TRANSFORM_FEEDBACK_BUFFER, 0, result.nbytes, result.ctypes.data_as(ctypes.c_void_p))
+    glBindBufferBase(GL_TRANSFORM_FEEDBACK_BUFFER, 0, 0)
+    glDeleteBuffers(1, [target])
+    glDeleteVertexArrays(1, [vao])
+    return result
+
+
+def timeFrames(win, frames=60, warmup=5):
+    """render frames and return the time of each in milliseconds
+    glFinish is called after every frame so the gpu work is included"""
+    for i in range(warmup):
+        win.renderGL()
+    glFinish()
+
+    times = []
+    for i in range(frames):
+        start = timer()
+        win.renderGL()
+        glFinish()
+        times.append((timer() - start) * 1000.0)
+
+        # check for errors
+        error = glGetError()
+        if error != GL_NO_ERROR:
+            raise Exception(error)
+
+    return times
+
+
+def timeFramesGPU(win, frames=60, warmup=5):
+    """render frames and return the cpu time renderGL takes to submit
+    each frame and the gpu time of each from a timer query, both in
+    milliseconds. The frames are not pipelined, every query result is
+    waited for before the next frame"""
+    query = glGenQueries(1)[0]
+
+    submit = []
+    gpu = []
+    for i in range(warmup + frames):
+        glBeginQuery(GL_TIME_ELAPSED, query)
+        start = timer()
+        win.renderGL()
+        end = timer()
+        glEndQuery(GL_TIME_ELAPSED)
+        ns = queryResult64(query)
+
+        # check for errors
+        error = glGetError()
+        if error != GL_NO_ERROR:
+            raise Exception(error)
+
+        # the first query of some drivers is invalid, the warmup frames
+        # are measured too but not returned
+        if i >= warmup:
+            submit.append((end - start) * 1000.0)
+            gpu.append(ns / 1000000.0)
+
+    glDeleteQueries(1, [query])
+    return submit, gpu
+
+
+def median(values):
+    """median of a list of numbers"""
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return 0.5 * (values[mid - 1] + values[mid])
+
+
+def printTable(headers, rows):
+    """print rows as a plain text table"""
+    cells = [[str(c) for c in headers]]
+    for row in rows:
+        cells.append([('%.3f' % c) if isinstance(c, float) else str(c) for c in row])
+
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    for n, row in enumerate(cells):
+        print('  '.join(c.rjust(w) for c, w in zip(row, widths)))
+        if n == 0:
+            print('  '.join('-' * w for w in widths))
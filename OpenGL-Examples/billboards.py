@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# billboard drawing strategies for particles
+# The particle examples draw every particle as a camera facing quad.
+# BillboardProgram builds the quads in one of three ways:
+#   'geometry'   a geometry shader expands every point to a quad
+#   'instanced'  a 4 vertex triangle strip is drawn once per particle,
+#                the particle position is a per instance attribute
+#   'points'     point sprites, the vertex shader sets gl_PointSize to
+#                the projected size of the quad
+# Geometry shaders are slow on many software rasterizers and tiling
+# gpus, the other two modes avoid them. All three draw the same image,
+# except that point sprites whose center leaves the screen are clipped
+# as a whole and that their size is limited by the implementation
+# (GL_POINT_SIZE_RANGE), so particles right in front of the camera can
+# be drawn smaller.
+#
+# The fragment shader reads the quad coordinates from 'in vec2 txcoord',
+# for point sprites it is compiled with POINT_SPRITE defined and has to
+# derive them from gl_PointCoord instead.
+
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+import glutil
+
+
+MODES = ('geometry', 'instanced', 'points')
+
+
+class BillboardProgram(object):
+
+    def __init__(self, mode, vertexShader, geomShader, fragmentShader, size=1.0):
+        """vertexShader and geomShader are the shaders of the 'geometry'
+        mode, size is the half width of the quads in view space as used
+        by the geometry shader"""
+        if mode not in MODES:
+            raise ValueError('unknown billboard mode %r' % mode)
+        self.mode = mode
+        self.size = size
+
+        if mode == 'geometry':
+            self.program = shaders.compileProgram(
+                glutil.shaderFromFile(GL_VERTEX_SHADER, vertexShader),
+                glutil.shaderFromFile(GL_GEOMETRY_SHADER, geomShader),
+                glutil.shaderFromFile(GL_FRAGMENT_SHADER, fragmentShader))
+        elif mode == 'instanced':
+            self.program = shaders.compileProgram(
+                glutil.shaderFromFile(GL_VERTEX_SHADER, './shaders/billboard_instanced.vert'),
+                glutil.shaderFromFile(GL_FRAGMENT_SHADER, fragmentShader))
+        else:
+            self.program = shaders.compileProgram(
+                glutil.shaderFromFile(GL_VERTEX_SHADER, './shaders/billboard_points.vert'),
+                glutil.shaderFromFile(GL_FRAGMENT_SHADER, fragmentShader, ['POINT_SPRITE']))
+
+        self.__viewLocation = glGetUniformLocation(self.program, 'View')
+        self.__projLocation = glGetUniformLocation(self.program, 'Projection')
+        self.__sizeLocation = glGetUniformLocation(self.program, 'size')
+        self.__heightLocation = glGetUniformLocation(self.program, 'viewportHeight')
+
+    def setAttributes(self, stride=3):
+        """set up the position attribute of the bound vao from the bound
+        array buffer, stride is the number of floats per particle"""
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, stride * 4, None)
+        # one position per quad instead of per vertex
+        glVertexAttribDivisor(0, 1 if self.mode == 'instanced' else 0)
+
+    def use(self, view, projection, viewportHeight):
+        """use the program and set its uniforms"""
+        glUseProgram(self.program)
+        glUniformMatrix4fv(self.__viewLocation, 1, GL_FALSE, view)
+        glUniformMatrix4fv(self.__projLocation, 1, GL_FALSE, projection)
+        if self.mode == 'geometry':
+            return
+
+        glUniform1f(self.__sizeLocation, self.size)
+        if self.mode == 'points':
+            glUniform1f(self.__heightLocation, viewportHeight)
+            glEnable(GL_PROGRAM_POINT_SIZE)
+
+    def draw(self, count):
+        """draw count particles with the vao bound"""
+        if self.mode == 'instanced':
+            glDrawArraysInstanced(GL_TRIANGLE_STRIP, 0, 4, count)
+        else:
+            glDrawArrays(GL_POINTS, 0, count)
+
+    def drawElements(self, count):
+        """draw count particles in the order of the bound index buffer"""
+        if self.mode == 'instanced':
+            raise ValueError('instanced billboards can not be drawn through an index buffer')
+        glDrawElements(GL_POINTS, count, GL_UNSIGNED_INT, None)
+
+    def drawCulled(self, culler):
+        """draw the visible particles of a ParticleCuller with its vao bound,
+        the culler needs instanced=True for instanced billboards"""
+        if culler.instanced != (self.mode == 'instanced'):
+            raise ValueError('the culler does not match the billboard mode %r' % self.mode)
+        if self.mode == 'instanced':
+            culler.draw(GL_TRIANGLE_STRIP)
+        else:
+            culler.draw(GL_POINTS)
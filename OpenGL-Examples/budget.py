@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# adaptive particle count
+# ParticleBudget measures the cpu and gpu time of every frame and grows or
+# shrinks the number of active particles so the frame time stays near a
+# target. The particle buffers are allocated for maxCount particles up
+# front, only the first count of them are simulated and drawn.
+# Changes only happen when the smoothed frame time leaves a band of
+# +-hysteresis around the target, and after every change the controller
+# waits for the new measurements before changing again, so the count
+# doesn't oscillate.
+
+from timeit import default_timer as timer
+
+from timing import GPUTimer
+
+
+class ParticleBudget(object):
+
+    def __init__(self, maxCount, targetMs, minCount=1024, count=None, granularity=1024,
+                 hysteresis=0.15, smoothing=0.2, settleFrames=8):
+        self.maxCount = maxCount
+        self.minCount = min(minCount, maxCount)
+        self.targetMs = targetMs
+        self.granularity = granularity
+        self.hysteresis = hysteresis
+        self.smoothing = smoothing
+        self.settleFrames = settleFrames
+
+        # the active particle count, start small and grow
+        self.count = self.clamp(count if count is not None else maxCount // 4)
+
+        # smoothed frame time and the times of the last frame
+        self.frameMs = None
+        self.cpuMs = 0.0
+        self.gpuMs = 0.0
+
+        self.__timer = None
+        self.__start = 0.0
+        self.__settle = settleFrames
+
+    def clamp(self, count):
+        """round count to the granularity and keep it in [minCount, maxCount]"""
+        count = int(round(count / float(self.granularity))) * self.granularity
+        return max(self.minCount, min(self.maxCount, count))
+
+    def begin(self):
+        """call at the start of a frame, needs an OpenGL 3.3 context"""
+        if self.__timer is None:
+            self.__timer = GPUTimer()
+        self.__start = timer()
+        self.__timer.begin()
+
+    def end(self):
+        """call at the end of a frame, returns the particle count for the next one"""
+        self.__timer.end()
+        self.cpuMs = (timer() - self.__start) * 1000.0
+
+        # the gpu time arrives a few frames late
+        gpuMs = self.__timer.poll()
+        if gpuMs is not None:
+            self.gpuMs = gpuMs
+
+        # cpu and gpu work in parallel, the slower one sets the frame time
+        return self.update(max(self.cpuMs, self.gpuMs))
+
+    def update(self, frameMs):
+        """feed the time of a frame, returns the new particle count"""
+        if self.frameMs is None:
+            self.frameMs = frameMs
+        else:
+            self.frameMs += self.smoothing * (frameMs - self.frameMs)
+
+        if self.__settle > 0:
+            self.__settle -= 1
+            return self.count
+
+        ratio = self.targetMs / max(self.frameMs, 1e-3)
+        if abs(ratio - 1.0) <= self.hysteresis:
+            return self.count
+
+        # only part of the frame time scales with the particles,
+        # go half the way and at most double or halve
+        factor = min(2.0, max(0.5, 1.0 + 0.5 * (ratio - 1.0)))
+        count = self.clamp(self.count * factor)
+        if count != self.count:
+            self.count = count
+            # the smoothed time is from the old count
+            self.frameMs = None
+            self.__settle = self.settleFrames
+        return self.count
+
+    def delete(self):
+        if self.__timer:
+            self.__timer.delete()
+            self.__timer = None
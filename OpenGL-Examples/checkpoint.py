@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# particle state checkpoints in memory mapped files
+# ParticleRecorder appends frames of particle state to a .npy file that
+# grows while recording. Vertex buffers are read back asynchronously with
+# a ReadbackRing, so recording never stalls the render loop. The frame
+# numbers and times of the recorded frames are kept in an index file
+# next to it. The file is allocated ahead in growing steps, but the
+# headers of both files are rewritten with the number of recorded frames
+# on every append() and poll(), so a recording cut short by a crash is
+# still a valid checkpoint up to the last of them.
+# ParticleCheckpoint memory maps a recording, any frame can be uploaded
+# straight from the mapped file.
+#
+# files:
+#   <name>.npy        float32 (frames, particles, floats per particle)
+#   <name>.index.npy  (frames,) with fields frame (int64), time (float64)
+
+import struct
+
+import numpy as np
+from OpenGL.GL import *
+
+from readback import ReadbackRing
+
+
+# fixed header size, the header is rewritten in place when the file grows
+HEADER_SIZE = 128
+
+INDEX_DTYPE = np.dtype([('frame', np.int64), ('time', np.float64)])
+
+
+def indexPath(path):
+    """file name of the frame index of a recording"""
+    if path.endswith('.npy'):
+        path = path[:-4]
+    return path + '.index.npy'
+
+
+def writeHeader(f, shape, dtype=np.float32):
+    """write a .npy version 1.0 header padded to HEADER_SIZE bytes"""
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   'fortran_order': False,
+                   'shape': tuple(shape)})
+    # magic, version and the header length take 10 bytes
+    header = header.ljust(HEADER_SIZE - 10 - 1) + '\n'
+    f.seek(0)
+    f.write(np.lib.format.magic(1, 0) + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+
+class ParticleRecorder(object):
+
+    def __init__(self, path, particleCount, floats=6, every=1, readbackBuffers=3):
+        self.path = path
+        # record every n-th frame
+        self.every = every
+        self.count = 0
+
+        self.__shape = (particleCount, floats)
+        self.__frameBytes = particleCount * floats * 4
+
+        self.__file = open(path, 'w+b')
+        self.__capacity = 0
+        self.__data = None
+        writeHeader(self.__file, (0,) + self.__shape)
+
+        # index entries not in the index file yet
+        self.__index = []
+        self.__indexFile = open(indexPath(path), 'w+b')
+        writeHeader(self.__indexFile, (0,), INDEX_DTYPE)
+        self.__written = 0
+
+        # captures are appended by the readback ring once the gpu has finished them
+        self.__readback = ReadbackRing(self.__frameBytes, self.__received, readbackBuffers)
+
+    def __grow(self):
+        """double the capacity of the file"""
+        if self.__data is not None:
+            self.__data.flush()
+            self.__data = None
+
+        self.__capacity = max(16, 2 * self.__capacity)
+        self.__sync()
+        self.__file.truncate(HEADER_SIZE + self.__capacity * self.__frameBytes)
+        self.__file.flush()
+
+        self.__data = np.memmap(self.__file, dtype=np.float32, mode='r+', offset=HEADER_SIZE,
+                                shape=(self.__capacity,) + self.__shape)
+
+    def wants(self, frame):
+        """True if frame is one of the recorded frames"""
+        return frame % self.every == 0
+
+    def append(self, data, frame, time=0.0):
+        """append a frame of particle state from a host array"""
+        self.__write(data, frame, time)
+        self.__sync()
+
+    def __write(self, data, frame, time):
+        if self.count == self.__capacity:
+            self.__grow()
+
+        self.__data[self.count] = data
+        self.__index.append((frame, time))
+        self.count += 1
+
+    def __sync(self):
+        """append the new index entries to the index file and rewrite the
+        headers of both files with the number of recorded frames. The data
+        itself is in the shared mapping, it reaches the file even if the
+        process dies"""
+        if self.__index:
+            index = np.array(self.__index, dtype=INDEX_DTYPE)
+            self.__indexFile.seek(HEADER_SIZE + self.__written * INDEX_DTYPE.itemsize)
+            self.__indexFile.write(index.tobytes())
+            self.__written += len(index)
+            self.__index = []
+        writeHeader(self.__indexFile, (self.__written,), INDEX_DTYPE)
+        self.__indexFile.flush()
+        writeHeader(self.__file, (self.count,) + self.__shape)
+        self.__file.flush()
+
+    def capture(self, buffer, frame, time=0.0):
+        """queue a copy of a particle vertex buffer for recording"""
+        self.__readback.copyBuffer(buffer, self.__shape, np.float32, (frame, time))
+
+    def poll(self):
+        """write the captures the gpu has finished to the file, never waits"""
+        self.__readback.poll()
+        self.__sync()
+
+    def __received(self, data, tag):
+        frame, time = tag
+        self.__write(data, frame, time)
+
+    def close(self):
+        """write the outstanding captures and finish the files"""
+        self.__readback.flush()
+
+        if self.__data is not None:
+            self.__data.flush()
+            self.__data = None
+
+        # shrink the file to the recorded frames
+        self.__sync()
+        self.__file.truncate(HEADER_SIZE + self.count * self.__frameBytes)
+        self.__file.close()
+        self.__indexFile.close()
+
+        self.__readback.delete()
+
+
+class ParticleCheckpoint(object):
+
+    def __init__(self, path):
+        self.data = np.load(path, mmap_mode='r')
+        self.index = np.load(indexPath(path))
+        # a recording cut short between the writes of the two headers
+        count = min(len(self.data), len(self.index))
+        self.data = self.data[:count]
+        self.index = self.index[:count]
+
+    def __len__(self):
+        return len(self.index)
+
+    def find(self, frame):
+        """position of the last recorded frame at or before frame"""
+        return max(0, np.searchsorted(self.index['frame'], frame, side='right') - 1)
+
+    def frame(self, i):
+        """particle state of recorded frame i as a view of the mapped file"""
+        return self.data[i]
+
+    def upload(self, buffer, i, target=GL_ARRAY_BUFFER):
+        """write recorded frame i to a vertex buffer"""
+        data = self.data[i]
+        glBindBuffer(target, buffer)
+        glBufferSubData(target, 0, data.nbytes, data)
+        glBindBuffer(target, 0)
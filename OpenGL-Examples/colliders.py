@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# sphere and box colliders for the particle examples
+# The colliders are kept in buffer textures together with a bounding
+# volume hierarchy built on the cpu with numpy. The hierarchy is stored
+# in depth first order with a skip index per node, so the shader walks
+# it without a stack: on a hit it goes to the next node, on a miss it
+# skips the subtree. A particle only visits the nodes containing it,
+# about log(colliders) of them.
+#
+# texture layouts:
+#   colliders  RGBA32F  2 texels per collider: (center, type), (size, 0)
+#              size is (radius, 0, 0) for spheres and the half extents
+#              for axis aligned boxes
+#   nodeBounds RGBA32F  2 texels per node: (min, 0), (max, 0)
+#   nodeLinks  RGBA32I  1 texel per node: (skip, first, count, 0)
+#              first/count is the collider range of a leaf, count is 0
+#              for inner nodes
+
+import numpy as np
+from OpenGL.GL import *
+
+
+SPHERE = 0
+BOX = 1
+
+# colliders per leaf
+LEAF_SIZE = 4
+
+
+def buildBVH(lower, upper, leafSize=LEAF_SIZE):
+    """bounding volume hierarchy over (n, 3) boxes
+    returns (order, bounds, links): order is the collider order the leaf
+    ranges refer to, bounds the (nodes, 2, 3) min/max of every node and
+    links the (nodes, 4) int32 (skip, first, count, 0) of every node"""
+    count = len(lower)
+    order = np.arange(count)
+    centers = 0.5 * (lower + upper)
+
+    bounds = []
+    links = []
+
+    # nodes are written depth first, once the subtree of a node is
+    # written its skip index is known
+    stack = [(0, count)] if count else []
+    while stack:
+        first, last = stack.pop()
+        if first is None:
+            # end of subtree marker
+            links[last][0] = len(links)
+            continue
+
+        ids = order[first:last]
+        node = len(links)
+        bounds.append((lower[ids].min(axis=0), upper[ids].max(axis=0)))
+
+        if last - first <= leafSize:
+            links.append([node + 1, first, last - first, 0])
+            continue
+
+        links.append([0, 0, 0, 0])
+
+        # split at the median of the longest axis
+        axis = np.argmax(bounds[-1][1] - bounds[-1][0])
+        mid = (last - first) // 2
+        part = np.argpartition(centers[ids, axis], mid)
+        order[first:last] = ids[part]
+
+        # children are popped in reverse order
+        stack.append((None, node))
+        stack.append((first + mid, last))
+        stack.append((first, first + mid))
+
+    bounds = np.array(bounds, dtype=np.float32).reshape(-1, 2, 3)
+    return order, bounds, np.array(links, dtype=np.int32).reshape(-1, 4)
+
+
+class ColliderSet(object):
+
+    def __init__(self):
+        self.__center = np.zeros((0, 3), dtype=np.float32)
+        self.__size = np.zeros((0, 3), dtype=np.float32)
+        self.__type = np.zeros(0, dtype=np.int32)
+
+        self.__dirty = True
+        self.nodeCount = 0
+
+        self.__buffers = None
+        self.__textures = None
+
+    def __len__(self):
+        return len(self.__type)
+
+    def __add(self, center, size, kind):
+        center = np.asarray(center, dtype=np.float32).reshape(-1, 3)
+        size = np.asarray(size, dtype=np.float32).reshape(len(center), -1)
+        size = np.pad(size, ((0, 0), (0, 3 - size.shape[1])), 'constant')
+
+        self.__center = np.concatenate((self.__center, center))
+        self.__size = np.concatenate((self.__size, size))
+        self.__type = np.concatenate((self.__type, np.full(len(center), kind, dtype=np.int32)))
+        self.__dirty = True
+
+    def addSpheres(self, center, radius):
+        """add spheres, center is (n, 3) and radius (n,)"""
+        self.__add(center, radius, SPHERE)
+
+    def addBoxes(self, center, halfSize):
+        """add axis aligned boxes, center and halfSize are (n, 3)"""
+        self.__add(center, halfSize, BOX)
+
+    def clear(self):
+        """remove all colliders"""
+        self.__center = self.__center[:0]
+        self.__size = self.__size[:0]
+        self.__type = self.__type[:0]
+        self.__dirty = True
+
+    def bounds(self):
+        """(lower, upper) corners of the collider bounding boxes"""
+        extent = np.where((self.__type == SPHERE)[:, None], self.__size[:, 0:1], self.__size)
+        return self.__center - extent, self.__center + extent
+
+    def bounceVelocity(self, position, velocity, bounce):
+        """velocity change from bouncing off the colliders, brute force
+        over all colliders. This is the reference for the shader."""
+        dv = np.zeros_like(velocity)
+        for center, size, kind in zip(self.__center, self.__size, self.__type):
+            diff = position - center
+            if kind == SPHERE:
+                dist2 = np.einsum('ij,ij->i', diff, diff)
+                vdot = np.einsum('ij,ij->i', diff, velocity)
+                hit = np.flatnonzero((dist2 < size[0] * size[0]) & (vdot < 0.0))
+                dv[hit] -= np.float32(bounce) * diff[hit] * (vdot[hit] / dist2[hit])[:, None]
+            else:
+                depth = size - np.abs(diff)
+                # push out along the axis of least penetration
+                rows = np.arange(len(diff))
+                axis = np.argmin(depth, axis=1)
+                normal = np.zeros_like(diff)
+                normal[rows, axis] = np.where(diff[rows, axis] < 0.0, -1.0, 1.0)
+                vdot = np.einsum('ij,ij->i', normal, velocity)
+                hit = np.flatnonzero((depth > 0.0).all(axis=1) & (vdot < 0.0))
+                dv[hit] -= np.float32(bounce) * normal[hit] * vdot[hit, None]
+        return dv
+
+    def upload(self):
+        """build the bvh and upload everything if the colliders changed
+        returns True when something was uploaded"""
+        if not self.__dirty:
+            return False
+
+        if self.__buffers is None:
+            self.__buffers = glGenBuffers(3)
+            self.__textures = glGenTextures(3)
+
+        lower, upper = self.bounds()
+        order, bounds, links = buildBVH(lower, upper)
+
+        colliders = np.zeros((len(order), 2, 4), dtype=np.float32)
+        colliders[:, 0, 0:3] = self.__center[order]
+        colliders[:, 0, 3] = self.__type[order]
+        colliders[:, 1, 0:3] = self.__size[order]
+
+        nodeBounds = np.zeros((len(bounds), 2, 4), dtype=np.float32)
+        nodeBounds[:, :, 0:3] = bounds
+
+        for buf, tex, fmt, data in zip(self.__buffers, self.__textures,
+                                       (GL_RGBA32F, GL_RGBA32F, GL_RGBA32I),
+                                       (colliders, nodeBounds, links)):
+            glBindBuffer(GL_TEXTURE_BUFFER, buf)
+            # never allocate an empty buffer
+            glBufferData(GL_TEXTURE_BUFFER, max(data.nbytes, 16), data if data.size else None, GL_STATIC_DRAW)
+            glBindTexture(GL_TEXTURE_BUFFER, tex)
+            glTexBuffer(GL_TEXTURE_BUFFER, fmt, buf)
+
+        glBindTexture(GL_TEXTURE_BUFFER, 0)
+        glBindBuffer(GL_TEXTURE_BUFFER, 0)
+
+        self.nodeCount = len(links)
+        self.__dirty = False
+        return True
+
+    def bindTextures(self, collidersUnit, nodeBoundsUnit, nodeLinksUnit):
+        """bind the collider and bvh buffer textures to texture units"""
+        for unit, tex in zip((collidersUnit, nodeBoundsUnit, nodeLinksUnit), self.__textures):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_BUFFER, tex)
+        glActiveTexture(GL_TEXTURE0)
+
+    def delete(self):
+        """free the gpu buffers, the colliders are uploaded again by the
+        next upload"""
+        if self.__buffers is not None:
+            glDeleteTextures(self.__textures)
+            glDeleteBuffers(3, self.__buffers)
+            self.__buffers = None
+            self.__textures = None
+        self.__dirty = True
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# view frustum culling of particles on the gpu (OpenGL 4.3)
+# ParticleCuller tests every particle against the planes of the view
+# frustum with a compute shader and copies the visible ones compactly
+# into its own vertex buffer. The number of visible particles is counted
+# with an atomic counter directly in a DrawArraysIndirectCommand, so the
+# draw call never waits for the cpu to know how many there are.
+# With instanced=True the visible particles are counted as instances of
+# a 4 vertex quad instead (instanced billboards, see billboards.py).
+#
+# SphereCuller culls instances on the cpu: it tests bounding spheres
+# against the frustum planes with numpy and returns the indices of the
+# visible ones, so only their data are uploaded and drawn (see
+# InstanceManager.uploadVisible). The spheres are tested in chunks that
+# stay in the cache, optionally on a pool of threads, numpy releases the
+# GIL while it computes.
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from OpenGL.GL import *
+
+import glutil
+
+
+def frustumPlanes(viewProjection):
+    """the 6 planes (left, right, bottom, top, near, far) of the frustum of
+    a column major (numpy array of a glm mat4) view projection matrix as
+    (6, 4) float32 array. The planes are normalized and point inwards:
+    a point p is inside if dot(plane[:3], p) + plane[3] >= 0 for all."""
+    m = np.asarray(viewProjection, dtype=np.float64).reshape(4, 4).T
+    planes = np.array((m[3] + m[0], m[3] - m[0],
+                       m[3] + m[1], m[3] - m[1],
+                       m[3] + m[2], m[3] - m[2]))
+    planes /= np.linalg.norm(planes[:, 0:3], axis=1)[:, None]
+    return planes.astype(np.float32)
+
+
+def sphereVisibility(planes, centers, radii, out=None):
+    """bool array, True for the spheres with (n, 3) centers and (n,) or
+    scalar radii that are at least partly inside all (6, 4) planes"""
+    n = len(centers)
+    if out is None:
+        out = np.empty(n, dtype=bool)
+
+    # the coordinates as contiguous rows
+    x, y, z = np.ascontiguousarray(np.asarray(centers, dtype=np.float32).T)
+    reach = np.negative(radii, dtype=np.float32)
+    distance = np.empty(n, dtype=np.float32)
+    term = np.empty(n, dtype=np.float32)
+    inside = np.empty(n, dtype=bool)
+
+    out[:] = True
+    for a, b, c, d in planes:
+        np.multiply(x, a, out=distance)
+        np.multiply(y, b, out=term)
+        distance += term
+        np.multiply(z, c, out=term)
+        distance += term
+        distance += d
+        np.greater_equal(distance, reach, out=inside)
+        out &= inside
+    return out
+
+
+class SphereCuller(object):
+    """frustum culling of bounding spheres on the cpu"""
+
+    def __init__(self, threads=0, chunkSize=64 * 1024):
+        """with threads > 0 the chunks are tested on a pool of threads"""
+        self.chunkSize = chunkSize
+        self.__pool = ThreadPoolExecutor(threads) if threads > 0 else None
+
+    def cull(self, viewProjection, centers, radii):
+        """indices of the spheres that are at least partly inside the view
+        frustum, centers are (n, 3), radii (n,) or one radius for all
+        viewProjection is the column major view projection matrix"""
+        planes = frustumPlanes(viewProjection)
+        n = len(centers)
+        visible = np.empty(n, dtype=bool)
+        scalar = np.ndim(radii) == 0
+
+        def cullChunk(first):
+            last = min(n, first + self.chunkSize)
+            sphereVisibility(planes, centers[first:last], radii if scalar else radii[first:last],
+                             visible[first:last])
+
+        chunks = range(0, n, self.chunkSize)
+        if self.__pool:
+            list(self.__pool.map(cullChunk, chunks))
+        else:
+            for first in chunks:
+                cullChunk(first)
+        return np.flatnonzero(visible)
+
+    def delete(self):
+        if self.__pool:
+            self.__pool.shutdown()
+
+
+class ParticleCuller(object):
+    """copies the particles of a vertex buffer with stride floats per
+    particle and the position first that are inside the view frustum.
+    radius is the size of a particle as drawn."""
+
+    def __init__(self, maxCount, stride=6, radius=0.2 * math.sqrt(2.0), instanced=False):
+        self.maxCount = maxCount
+        self.stride = stride
+        self.radius = radius
+        self.instanced = instanced
+
+        self.__program = glutil.computeProgram('./shaders/culling.comp',
+                                               ['INSTANCED'] if instanced else [])
+        self.__countLocation = glGetUniformLocation(self.__program, 'count')
+        self.__strideLocation = glGetUniformLocation(self.__program, 'stride')
+        self.__radiusLocation = glGetUniformLocation(self.__program, 'radius')
+        self.__planesLocation = glGetUniformLocation(self.__program, 'planes')
+
+        # the visible particles, used as vertex buffer
+        self.particles = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.particles)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, maxCount * stride * 4, None, GL_DYNAMIC_COPY)
+
+        # count, instance count, first, base instance
+        # the visible particles are counted in count or in instance count
+        if instanced:
+            self.__command = np.array((4, 0, 0, 0), dtype=np.uint32)
+        else:
+            self.__command = np.array((0, 1, 0, 0), dtype=np.uint32)
+        self.indirect = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.indirect)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, self.__command.nbytes, self.__command, GL_DYNAMIC_COPY)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+    def cull(self, particleBuffer, count, viewProjection):
+        """copy the visible particles of the first count in particleBuffer
+        viewProjection is the column major view projection matrix"""
+        if count > self.maxCount:
+            raise ValueError('culling %d particles, the maximum is %d' % (count, self.maxCount))
+
+        # reset the counter of the draw command
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.indirect)
+        glBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, self.__command.nbytes, self.__command)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+        glUseProgram(self.__program)
+        glUniform1ui(self.__countLocation, count)
+        glUniform1ui(self.__strideLocation, self.stride)
+        glUniform1f(self.__radiusLocation, self.radius)
+        glUniform4fv(self.__planesLocation, 6, frustumPlanes(viewProjection))
+
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, particleBuffer)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, self.particles)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 2, self.indirect)
+        glDispatchCompute(glutil.workGroups(count, 256), 1, 1)
+
+        # the results are read as vertices and draw command
+        glMemoryBarrier(GL_VERTEX_ATTRIB_ARRAY_BARRIER_BIT | GL_COMMAND_BARRIER_BIT)
+        glUseProgram(0)
+
+    def draw(self, mode=GL_POINTS):
+        """draw the visible particles with the vao of self.particles bound"""
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.indirect)
+        glDrawArraysIndirect(mode, None)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+
+    def visibleCount(self):
+        """number of visible particles of the last cull, waits for the gpu"""
+        offset = 4 if self.instanced else 0
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.indirect)
+        count = np.frombuffer(glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, offset, 4), dtype=np.uint32)[0]
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+        return int(count)
+
+    def delete(self):
+        glDeleteBuffers(2, [self.particles, self.indirect])
+        glDeleteProgram(self.__program)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# particle emitters
+# An Emitter spawns particles with a limited lifetime at a steady rate
+# and/or in bursts. The emitters only decide how many particles to spawn
+# per timestep, the particles themselves are created on the gpu by
+# shaders/09emit.vert from the emitter parameters.
+
+
+class Emitter(object):
+
+    def __init__(self, position, velocity=(0.0, 0.0, 0.0), spread=1.0, speedSpread=1.0,
+                 rate=0.0, life=(2.0, 4.0), burstCount=0, burstEvery=0.0):
+        """position and velocity of new particles are randomized by up to
+        +-spread/2 and +-speedSpread/2 per axis, life is the (min, max)
+        lifetime in seconds. rate particles are spawned per second and
+        burstCount particles every burstEvery seconds"""
+        self.position = tuple(position)
+        self.velocity = tuple(velocity)
+        self.spread = spread
+        self.speedSpread = speedSpread
+        self.rate = rate
+        self.life = tuple(life)
+        self.burstCount = burstCount
+        self.burstEvery = burstEvery
+
+        # fractional particles left over from the rate
+        self.__carry = 0.0
+        self.__sinceBurst = burstEvery
+        self.__queued = 0
+
+    def burst(self, count):
+        """spawn count particles in the next timestep"""
+        self.__queued += count
+
+    def spawnCount(self, dt):
+        """number of particles to spawn in a timestep of dt seconds"""
+        self.__carry += self.rate * dt
+        count = int(self.__carry)
+        self.__carry -= count
+
+        if self.burstCount and self.burstEvery > 0.0:
+            self.__sinceBurst += dt
+            if self.__sinceBurst >= self.burstEvery:
+                self.__sinceBurst -= self.burstEvery
+                count += self.burstCount
+
+        count += self.__queued
+        self.__queued = 0
+        return count
+
+
+def defaultEmitters():
+    """a fountain above the spheres and a burst emitter beside it"""
+    return [Emitter((0.0, 20.0, 0.0), velocity=(0.0, 8.0, 0.0), spread=1.0, speedSpread=6.0,
+                    rate=30000.0, life=(3.0, 6.0)),
+            Emitter((6.0, 16.0, 4.0), velocity=(-4.0, 4.0, 0.0), spread=0.5, speedSpread=10.0,
+                    life=(1.0, 3.0), burstCount=20000, burstEvery=2.0)]
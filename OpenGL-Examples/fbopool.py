@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+# pool of offscreen render targets
+# Post effects and multi pass renderers need intermediate framebuffers
+# whose size follows the window. Creating them every frame is slow and
+# creating them once breaks on resize, so FramebufferPool hands out
+# RenderTargets keyed by (width, height, format, samples):
+#   target = pool.acquire(width, height)
+#   target.bind()
+#   ... render, then sample target.texture in the next pass ...
+#   pool.release(target)
+# A released target goes back to the pool and is handed out again by the
+# next acquire of the same key, in this or a later frame. After a resize
+# the targets of the old size are no longer asked for, endFrame() deletes
+# free targets that were not used for maxIdleFrames frames. If the free
+# and used targets together take more than budget bytes of gpu memory,
+# the least recently used free targets are deleted right away.
+# allocatedBytes is the estimated gpu memory of all targets.
+
+from collections import OrderedDict
+
+from OpenGL.GL import *
+
+
+# bytes per pixel of the color and depth formats
+FORMAT_BYTES = {GL_R8: 1, GL_RG8: 2, GL_RGBA8: 4, GL_SRGB8_ALPHA8: 4, GL_RGB10_A2: 4,
+                GL_R11F_G11F_B10F: 4, GL_R16F: 2, GL_RG16F: 4, GL_RGBA16F: 8,
+                GL_R32F: 4, GL_RG32F: 8, GL_RGBA32F: 16,
+                GL_DEPTH_COMPONENT16: 2, GL_DEPTH_COMPONENT24: 4, GL_DEPTH_COMPONENT32F: 4,
+                GL_DEPTH24_STENCIL8: 4, GL_DEPTH32F_STENCIL8: 8}
+
+
+class RenderTarget(object):
+
+    def __init__(self, width, height, format=GL_RGBA8, samples=0, depthFormat=GL_DEPTH_COMPONENT24):
+        """framebuffer with a color texture of format and, unless depthFormat
+        is None, a depth renderbuffer. With samples > 0 the texture is a
+        GL_TEXTURE_2D_MULTISAMPLE"""
+        if format not in FORMAT_BYTES:
+            raise ValueError('unknown render target format %r' % format)
+        if depthFormat is not None and depthFormat not in FORMAT_BYTES:
+            raise ValueError('unknown render target depth format %r' % depthFormat)
+        self.width = width
+        self.height = height
+        self.format = format
+        self.samples = samples
+        self.key = (width, height, format, samples)
+
+        pixelBytes = FORMAT_BYTES[format] + (FORMAT_BYTES[depthFormat] if depthFormat is not None else 0)
+        self.bytes = width * height * max(1, samples) * pixelBytes
+
+        self.texture = glGenTextures(1)
+        if samples:
+            self.target = GL_TEXTURE_2D_MULTISAMPLE
+            glBindTexture(self.target, self.texture)
+            glTexImage2DMultisample(self.target, samples, format, width, height, GL_TRUE)
+        else:
+            self.target = GL_TEXTURE_2D
+            glBindTexture(self.target, self.texture)
+            glTexParameteri(self.target, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            glTexParameteri(self.target, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glTexParameteri(self.target, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            glTexParameteri(self.target, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+            # any pixel transfer format will do, there is no data
+            glTexImage2D(self.target, 0, format, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(self.target, 0)
+
+        self.depth = None
+        if depthFormat is not None:
+            self.depth = glGenRenderbuffers(1)
+            glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+            if samples:
+                glRenderbufferStorageMultisample(GL_RENDERBUFFER, samples, depthFormat, width, height)
+            else:
+                glRenderbufferStorage(GL_RENDERBUFFER, depthFormat, width, height)
+            glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, self.target, self.texture, 0)
+        if self.depth is not None:
+            attachment = GL_DEPTH_STENCIL_ATTACHMENT if depthFormat in (GL_DEPTH24_STENCIL8, GL_DEPTH32F_STENCIL8) \
+                else GL_DEPTH_ATTACHMENT
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, self.depth)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            self.delete()
+            raise Exception('render target %r is not complete' % (self.key,))
+
+        # frame number of the last acquire, set by the pool
+        self.lastUsed = 0
+
+    def bind(self):
+        """render to the target from here on"""
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def delete(self):
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteTextures([self.texture])
+        if self.depth is not None:
+            glDeleteRenderbuffers(1, [self.depth])
+
+
+class FramebufferPool(object):
+
+    def __init__(self, budget=256 * 1024 * 1024, maxIdleFrames=3, depthFormat=GL_DEPTH_COMPONENT24):
+        """budget is the gpu memory in bytes above which free targets are
+        deleted, depthFormat of the depth buffer of every target or None"""
+        self.budget = budget
+        self.maxIdleFrames = maxIdleFrames
+        self.depthFormat = depthFormat
+        self.frame = 0
+        # estimated gpu memory of all targets, free or in use
+        self.allocatedBytes = 0
+        # targets created and deleted, acquires served from the pool
+        self.created = 0
+        self.evicted = 0
+        self.reused = 0
+
+        # free targets, least recently used first
+        self.__free = OrderedDict()
+        self.__used = set()
+
+    def acquire(self, width, height, format=GL_RGBA8, samples=0):
+        """a render target of the key, reused if a free one exists. It
+        belongs to the caller until it is released"""
+        key = (width, height, format, samples)
+        for target in self.__free.values():
+            if target.key == key:
+                del self.__free[target.fbo]
+                self.reused += 1
+                break
+        else:
+            target = RenderTarget(width, height, format, samples, self.depthFormat)
+            self.allocatedBytes += target.bytes
+            self.created += 1
+        target.lastUsed = self.frame
+        self.__used.add(target)
+        self.__evict(self.budget)
+        return target
+
+    def release(self, target):
+        """give a target back to the pool, its content is kept until it is
+        acquired again"""
+        self.__used.remove(target)
+        self.__free[target.fbo] = target
+
+    def endFrame(self):
+        """delete the free targets not used for maxIdleFrames frames, call
+        once at the end of every frame"""
+        self.frame += 1
+        for fbo, target in list(self.__free.items()):
+            if self.frame - target.lastUsed > self.maxIdleFrames:
+                self.__delete(fbo)
+
+    def freeBytes(self):
+        """gpu memory of the targets that are not in use"""
+        return sum(target.bytes for target in self.__free.values())
+
+    def __evict(self, budget):
+        """delete free targets, least recently used first, until the pool
+        fits into budget bytes or no free target is left"""
+        while self.allocatedBytes > budget and self.__free:
+            self.__delete(next(iter(self.__free)))
+
+    def __delete(self, fbo):
+        target = self.__free.pop(fbo)
+        self.allocatedBytes -= target.bytes
+        self.evicted += 1
+        target.delete()
+
+    def clear(self):
+        """delete all free targets"""
+        self.__evict(-1)
+
+    def delete(self):
+        """delete all targets, the ones in use included"""
+        self.clear()
+        for target in self.__used:
+            self.allocatedBytes -= target.bytes
+            target.delete()
+        self.__used.clear()
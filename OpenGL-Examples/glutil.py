@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+# small opengl helpers shared by the reusable components and the
+# examples, only the basic examples 01 to 06instancing2 still read their
+# shaders with a shaderFromFile of their own
+
+import os.path
+
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+
+def includeFiles(shaderSrc, directory):
+    """replace #include "file" lines with the content of file
+    the file names are relative to directory, includes can be nested"""
+    lines = []
+    for line in shaderSrc.split('\n'):
+        if line.startswith('#include'):
+            includeFile = os.path.join(directory, line.split('"')[1])
+            with open(includeFile) as sf:
+                line = includeFiles(sf.read(), os.path.dirname(includeFile))
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def shaderFromFile(shaderType, shaderFile, defines=()):
+    """read shader from file and compile it
+    defines are inserted as #define lines right after the #version line,
+    #include "file" lines are resolved relative to the shader file"""
+    shaderSrc = ''
+    with open(shaderFile) as sf:
+        shaderSrc = includeFiles(sf.read(), os.path.dirname(shaderFile))
+
+    if defines:
+        version, rest = shaderSrc.split('\n', 1)
+        lines = ['#define %s' % d for d in defines]
+        shaderSrc = '\n'.join([version] + lines + [rest])
+
+    return shaders.compileShader(shaderSrc, shaderType)
+
+
+def computeProgram(shaderFile, defines=()):
+    """compile and link a compute shader program"""
+    return shaders.compileProgram(shaderFromFile(GL_COMPUTE_SHADER, shaderFile, defines))
+
+
+def workGroups(count, size):
+    """number of work groups of size needed to cover count invocations"""
+    return (count + size - 1) // size
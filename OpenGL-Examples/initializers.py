@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# initial data for the galaxy and particle examples
+# The data is generated with numpy from a seeded random generator in
+# chunks of fixed size. Each chunk can be uploaded with glBufferSubData
+# and dropped, so the peak host memory does not depend on the number
+# of particles.
+# A galaxy can also be cached in a .npy file, starting the example again
+# then only maps the file and uploads it in one call.
+
+import hashlib
+import os
+
+import numpy as np
+from OpenGL.GL import *
+
+
+CHUNK_SIZE = 64 * 1024
+
+# change when the galaxy generator changes so old caches are not used
+GALAXY_VERSION = 4
+
+
+def _chunks(count, chunkSize):
+    """yield (first, n) for chunks covering count elements"""
+    for first in range(0, count, chunkSize):
+        yield first, min(chunkSize, count - first)
+
+
+def cubeChunks(count, seed=0, chunkSize=CHUNK_SIZE, center=(0.0, 20.0, 0.0), size=5.0):
+    """particles at rest randomly placed in a cube
+    yields (first, data) with data a (n, 6) float32 array of
+    interleaved position and velocity"""
+    rng = np.random.default_rng(seed)
+    center = np.asarray(center, dtype=np.float32)
+    size = np.float32(size)
+
+    for first, n in _chunks(count, chunkSize):
+        data = np.zeros((n, 6), dtype=np.float32)
+        pos = data[:, 0:3]
+        pos[...] = rng.random((n, 3), dtype=np.float32)
+        np.subtract(np.float32(0.5), pos, out=pos)
+        pos *= size
+        pos += center
+        yield first, data
+
+
+def galaxyChunks(count, seed=0, chunkSize=CHUNK_SIZE, arms=None, spread=1.0):
+    """a galaxy like distribution of points, spread scales the random
+    scatter of the points. With a number of arms the points lie around
+    that many spiral arms, with None they are spread over all angles
+    like in the original example
+    yields (first, data) with data a (n, 3) float32 array of positions"""
+    rng = np.random.default_rng(seed)
+    spread = np.float32(spread)
+
+    for first, n in _chunks(count, chunkSize):
+        rand = rng.random((n, 14), dtype=np.float32)
+
+        alpha = 1 / (np.float32(.1) + rand[:, 1] ** np.float32(.7)) - np.float32(1 / 1.1)
+        r = 4 * alpha
+        if arms:
+            alpha += np.floor(arms * rand[:, 0]) * np.float32(2.0 * 3.1416 / arms)
+        else:
+            alpha += rand[:, 0] * np.float32(2.0 * 3.1416)
+
+        # 2 - rand() + rand() + rand() + rand() for every coordinate
+        scatter = 2 - rand[:, 2:5] + rand[:, 5:8] + rand[:, 8:11] + rand[:, 11:14]
+        scatter *= spread
+
+        data = np.empty((n, 3), dtype=np.float32)
+        data[:, 0] = r * np.sin(alpha) + (4 - np.float32(.2) * alpha) * scatter[:, 0]
+        data[:, 1] = (2 - np.float32(.1) * alpha) * scatter[:, 1]
+        data[:, 2] = r * np.cos(alpha) + (4 - np.float32(.2) * alpha) * scatter[:, 2]
+        yield first, data
+
+
+def galaxyCachePath(cacheDir, count, seed=0, arms=None, spread=1.0):
+    """file name of a cached galaxy, keyed by a hash of its parameters"""
+    key = repr((GALAXY_VERSION, int(count), int(seed), int(arms or 0), float(spread)))
+    return os.path.join(cacheDir, 'galaxy_%s.npy' % hashlib.sha1(key.encode('ascii')).hexdigest()[:16])
+
+
+def cachedGalaxy(cacheDir, count, seed=0, arms=None, spread=1.0, chunkSize=CHUNK_SIZE):
+    """the (count, 3) float32 positions of galaxyChunks memory mapped from
+    a .npy file in cacheDir, the file is generated chunk by chunk on the
+    first call with a set of parameters"""
+    path = galaxyCachePath(cacheDir, count, seed, arms, spread)
+    if not os.path.exists(path):
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+        # write to a temporary file first so an interrupted run leaves no
+        # broken cache behind
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        data = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=(count, 3))
+        for first, chunk in galaxyChunks(count, seed, chunkSize, arms, spread):
+            data[first:first + len(chunk)] = chunk
+        data.flush()
+        del data
+        os.rename(tmp, path)
+
+    return np.load(path, mmap_mode='r')
+
+
+def fillBuffers(buffers, chunks, nbytes, usage=GL_STATIC_DRAW, target=GL_ARRAY_BUFFER):
+    """allocate buffer objects with nbytes and stream the chunks into them
+    every chunk is written to all of the buffers, the last buffer is left
+    bound to target"""
+    for buf in buffers:
+        glBindBuffer(target, buf)
+        glBufferData(target, nbytes, None, usage)
+
+    for first, data in chunks:
+        offset = first * data.strides[0]
+        for buf in buffers:
+            glBindBuffer(target, buf)
+            glBufferSubData(target, offset, data.nbytes, data)
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+# instancing for large numbers of instances
+# InstanceStore keeps the transforms of the instances as structure of
+# arrays: positions, rotation quaternions and scales in separate numpy
+# arrays, so whole crowds are moved with a few array operations.
+# modelMatrices builds the (n, 4, 4) model matrices from them without a
+# python loop. InstanceManager uploads the matrices into a buffer object
+# that the vertex shader reads by gl_InstanceID, either as buffer
+# texture (OpenGL 3.3) or as shader storage buffer (OpenGL 4.3), and
+# draws all instances with one glDrawElementsInstanced.
+# The third storage, 'ring', streams the matrices through a persistently
+# mapped ring buffer (ringbuffer.py, OpenGL 4.4) for instances that move
+# every frame: they are built right into the mapped segment of the frame
+# and read as instanced mat4 vertex attribute, the segment is selected
+# with the base instance of the draw. 'attributes' reads a plain buffer
+# as instanced vertex attributes (OpenGL 3.3).
+# Instead of matrices the attribute storages can hold the transforms in
+# one of the packed formats of packing.py, 12 to 32 instead of 64 bytes
+# per instance, the vertex shader builds the transform itself.
+#
+# The matrices are column major like glm's, matrices[i][column][row].
+
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+import packing
+from ringbuffer import PersistentRing
+
+
+STORAGES = ('texture', 'ssbo', 'attributes', 'ring')
+FORMATS = ('matrix',) + packing.FORMATS
+
+
+def gridPositions(count, spacing=4.0):
+    """(count, 3) float32 positions on the smallest cubic grid with at
+    least count cells, spacing apart and centered at the origin"""
+    side = int(round(count ** (1.0 / 3.0)))
+    if side ** 3 < count:
+        side += 1
+    cells = np.indices((side, side, side)).reshape(3, -1).T[:count]
+    return (spacing * (cells - 0.5 * (side - 1))).astype(np.float32)
+
+
+def axisAngleQuaternions(axes, angles):
+    """(n, 4) float32 quaternions (x, y, z, w) of rotations by angles in
+    radians around axes, axes is (n, 3) or one axis for all"""
+    axes = np.asarray(axes, dtype=np.float32)
+    angles = np.asarray(angles, dtype=np.float32)
+    axes = axes / np.sqrt((axes * axes).sum(axis=-1))[..., None]
+
+    half = 0.5 * angles
+    quaternions = np.empty(np.broadcast(axes[..., 0], half).shape + (4,), dtype=np.float32)
+    quaternions[..., 0:3] = axes * np.sin(half)[..., None]
+    quaternions[..., 3] = np.cos(half)
+    return quaternions
+
+
+def modelMatrices(positions, rotations=None, scales=None, out=None):
+    """(n, 4, 4) float32 column major model matrices that scale, rotate
+    and translate, in that order. positions is (n, 3), rotations (n, 4)
+    unit quaternions (x, y, z, w), scales (n, 3) or (n,), None means no
+    rotation or scale"""
+    positions = np.asarray(positions, dtype=np.float32)
+    n = len(positions)
+    if out is None:
+        out = np.empty((n, 4, 4), dtype=np.float32)
+
+    # built as [column][row][instance] so every element is written as
+    # one contiguous array, then transposed into out at once
+    m = np.empty((4, 4, n), dtype=np.float32)
+    if rotations is None:
+        m[0:3, 0:3] = np.eye(3, dtype=np.float32)[:, :, None]
+    else:
+        x, y, z, w = np.asarray(rotations, dtype=np.float32).T
+        x2, y2, z2 = x + x, y + y, z + z
+        xx, yy, zz = x * x2, y * y2, z * z2
+        xy, xz, yz = x * y2, x * z2, y * z2
+        wx, wy, wz = w * x2, w * y2, w * z2
+
+        m[0, 0] = 1.0 - (yy + zz)
+        m[0, 1] = xy + wz
+        m[0, 2] = xz - wy
+        m[1, 0] = xy - wz
+        m[1, 1] = 1.0 - (xx + zz)
+        m[1, 2] = yz + wx
+        m[2, 0] = xz + wy
+        m[2, 1] = yz - wx
+        m[2, 2] = 1.0 - (xx + yy)
+
+    if scales is not None:
+        scales = np.asarray(scales, dtype=np.float32)
+        if scales.ndim == 1:
+            m[0:3, 0:3] *= scales
+        else:
+            # scale the columns
+            m[0:3, 0:3] *= scales.T[:, None, :]
+
+    m[0:3, 3] = 0.0
+    m[3, 0:3] = positions.T
+    m[3, 3] = 1.0
+    out[:] = m.transpose(2, 0, 1)
+    return out
+
+
+class InstanceStore(object):
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+
+        self.positions = np.zeros((capacity, 3), dtype=np.float32)
+        self.rotations = np.zeros((capacity, 4), dtype=np.float32)
+        self.rotations[:, 3] = 1.0
+        self.scales = np.ones((capacity, 3), dtype=np.float32)
+
+    def add(self, positions, rotations=None, scales=None):
+        """append instances, returns the index of the first one"""
+        positions = np.asarray(positions, dtype=np.float32)
+        first = self.count
+        last = first + len(positions)
+        if last > self.capacity:
+            raise ValueError('%d instances do not fit, the capacity is %d' % (last, self.capacity))
+
+        self.positions[first:last] = positions
+        self.rotations[first:last] = (0.0, 0.0, 0.0, 1.0) if rotations is None else rotations
+        self.scales[first:last] = 1.0 if scales is None else np.reshape(scales, (len(positions), -1))
+        self.count = last
+        return first
+
+    def clear(self):
+        self.count = 0
+
+    def matrices(self, first=0, count=None, out=None):
+        """model matrices of count instances from first"""
+        last = self.count if count is None else first + count
+        return modelMatrices(self.positions[first:last], self.rotations[first:last],
+                             self.scales[first:last], out)
+
+
+class InstanceManager(object):
+
+    def __init__(self, capacity, storage='texture', segments=3, format='matrix'):
+        """storage is 'texture' for a buffer texture, 'ssbo' for a shader
+        storage buffer (OpenGL 4.3), 'attributes' for a buffer read as
+        instanced vertex attributes or 'ring' for a ring buffer of segments
+        that are read as vertex attributes (OpenGL 4.4).
+        format is 'matrix' for model matrices or a packed format of
+        packing.py, packed instances are read as vertex attributes"""
+        if storage not in STORAGES:
+            raise ValueError('unknown instance storage %r' % storage)
+        if format not in FORMATS:
+            raise ValueError('unknown instance format %r' % format)
+        if format != 'matrix' and storage not in ('attributes', 'ring'):
+            raise ValueError('packed instances are vertex attributes, use the attributes or ring storage')
+        self.storage = storage
+        self.format = format
+        self.store = InstanceStore(capacity)
+        self.texture = None
+        # first instance of the draw, the segment of the ring
+        self.baseInstance = 0
+
+        # the data of one instance
+        if format == 'matrix':
+            self.__dtype = np.dtype((np.float32, (4, 4)))
+        else:
+            self.__dtype = packing.DTYPES[format]
+        self.itemSize = self.__dtype.itemsize
+
+        self.__ring = None
+        if storage == 'ring':
+            # the segments are whole instances apart
+            self.__ring = PersistentRing(capacity * self.itemSize, segments, 64 * self.itemSize)
+            self.buffer = self.__ring.buffer
+            return
+
+        # host copy of the data that is uploaded
+        self.__data = np.empty(capacity, dtype=self.__dtype)
+
+        self.buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+        glBufferData(GL_ARRAY_BUFFER, self.__data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        if storage == 'texture':
+            # every matrix is 4 RGBA32F texels, one per column
+            self.texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_BUFFER, self.texture)
+            glTexBuffer(GL_TEXTURE_BUFFER, GL_RGBA32F, self.buffer)
+            glBindTexture(GL_TEXTURE_BUFFER, 0)
+
+    def __build(self, out, positions, rotations, scales):
+        """write the matrices or packed data of the instances to out"""
+        if self.format == 'matrix':
+            return modelMatrices(positions, rotations, scales, out)
+        # the packed formats have a uniform scale
+        return packing.packInstances(positions, rotations, scales[:, 0], self.format, out)
+
+    def __target(self, first, count):
+        """the array the data of count instances from first are built in"""
+        if self.__ring:
+            out = self.__ring.begin(self.__dtype.base, (count,) + self.__dtype.shape)
+            self.baseInstance = self.__ring.offset // self.itemSize
+            return out
+        return self.__data[first:first + count]
+
+    def __write(self, first, data):
+        """upload the built data, the ring is written to directly"""
+        if not self.__ring:
+            glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+            glBufferSubData(GL_ARRAY_BUFFER, first * self.itemSize, data.nbytes, data)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def upload(self, first=0, count=None):
+        """build the model matrices or packed data of the instances from
+        first on and write them to the buffer"""
+        store = self.store
+        if count is None:
+            count = store.count - first
+        if count <= 0:
+            return
+        if self.__ring and first != 0:
+            # the segment of the frame holds all instances
+            raise ValueError('the ring is written whole, first has to be 0')
+
+        last = first + count
+        data = self.__build(self.__target(first, count), store.positions[first:last],
+                            store.rotations[first:last], store.scales[first:last])
+        self.__write(first, data)
+
+    def uploadVisible(self, indices):
+        """build the data of the instances at indices, e.g. the visible ones
+        of a SphereCuller, and write them compactly to the start of the
+        buffer. Returns their number, the count to draw"""
+        store = self.store
+        count = len(indices)
+        if count == 0:
+            return 0
+
+        data = self.__build(self.__target(0, count), store.positions[indices],
+                            store.rotations[indices], store.scales[indices])
+        self.__write(0, data)
+        return count
+
+    def setAttributes(self, location=2):
+        """set up the instanced attributes of the bound vao for the
+        'attributes' and 'ring' storage: the model matrix as mat4 at
+        location to location + 3 or the packed position and scale at
+        location and rotation at location + 1"""
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+        if self.format == 'matrix':
+            for column in range(4):
+                glEnableVertexAttribArray(location + column)
+                glVertexAttribPointer(location + column, 4, GL_FLOAT, GL_FALSE, 64, ctypes.c_void_p(16 * column))
+                glVertexAttribDivisor(location + column, 1)
+        else:
+            packing.setAttributes(self.format, location)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def bind(self, unit=0):
+        """bind the matrices to texture unit or storage buffer binding unit,
+        the other storages are read through the vao"""
+        if self.storage == 'texture':
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_BUFFER, self.texture)
+        elif self.storage == 'ssbo':
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, unit, self.buffer)
+
+    def draw(self, indexCount, count=None):
+        """draw the instances with the vao of the mesh and its index buffer
+        of indexCount GL_UNSIGNED_INT triangle indices bound"""
+        if count is None:
+            count = self.store.count
+        if self.__ring:
+            glDrawElementsInstancedBaseInstance(GL_TRIANGLES, indexCount, GL_UNSIGNED_INT, None, count,
+                                                self.baseInstance)
+            # the segment is free again once the draw is done
+            self.__ring.end()
+        else:
+            glDrawElementsInstanced(GL_TRIANGLES, indexCount, GL_UNSIGNED_INT, None, count)
+
+    def delete(self):
+        if self.__ring:
+            self.__ring.delete()
+            return
+        if self.texture is not None:
+            glDeleteTextures([self.texture])
+        glDeleteBuffers(1, [self.buffer])
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# many meshes in one draw call
+# MeshBatch packs the vertices and indices of several meshes into one
+# vertex and one index buffer and keeps a DrawElementsIndirectCommand per
+# mesh in an indirect buffer:
+#   count, instanceCount, firstIndex, baseVertex, baseInstance
+# The instances of all meshes are stored one mesh after the other, the
+# base instance of a command selects the range of its mesh, so instanced
+# vertex attributes (divisor 1) need no offsets in the shader.
+# draw() renders the whole scene with one glMultiDrawElementsIndirect
+# (OpenGL 4.3), drawLoop() issues one draw call per mesh from python for
+# comparison. The commands live in a buffer object, so they can just as
+# well be written by a compute shader, e.g. for culling on the gpu.
+
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+
+COMMAND = np.dtype([('count', np.uint32), ('instanceCount', np.uint32), ('firstIndex', np.uint32),
+                    ('baseVertex', np.int32), ('baseInstance', np.uint32)])
+
+
+class MeshBatch(object):
+
+    def __init__(self, meshes):
+        """meshes is a sequence of (vertices, indices), vertices are (n, k)
+        float32 with the same k for all meshes, indices are uint32 starting
+        at 0 for every mesh"""
+        vertices = [np.asarray(v, dtype=np.float32) for v, i in meshes]
+        indices = [np.asarray(i, dtype=np.uint32).ravel() for v, i in meshes]
+        self.meshCount = len(vertices)
+        self.vertexSize = vertices[0].shape[1]
+
+        self.commands = np.zeros(self.meshCount, dtype=COMMAND)
+        self.commands['count'] = [len(i) for i in indices]
+        self.commands['firstIndex'] = np.cumsum([0] + [len(i) for i in indices[:-1]])
+        self.commands['baseVertex'] = np.cumsum([0] + [len(v) for v in vertices[:-1]])
+        self.__loop = []
+
+        vertexData = np.concatenate(vertices)
+        indexData = np.concatenate(indices)
+
+        self.vbo, self.ibo, self.indirect = glGenBuffers(3)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertexData.nbytes, vertexData, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indexData.nbytes, indexData, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.indirect)
+        glBufferData(GL_DRAW_INDIRECT_BUFFER, self.commands.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+
+    def bind(self):
+        """bind the vertex and index buffer, to set up the attributes of a
+        vao with it bound"""
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+
+    def setInstances(self, counts, baseInstances=None):
+        """set the number of instances of every mesh and write the commands
+        by default the instances of the meshes follow each other from 0
+        returns the total number of instances"""
+        counts = np.asarray(counts, dtype=np.uint32)
+        if baseInstances is None:
+            baseInstances = np.cumsum(counts) - counts
+        self.commands['instanceCount'] = counts
+        self.commands['baseInstance'] = baseInstances
+
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.indirect)
+        glBufferSubData(GL_DRAW_INDIRECT_BUFFER, 0, self.commands.nbytes, self.commands)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+
+        # the arguments of the per mesh draw calls, as python numbers
+        self.__loop = [(int(c['count']), ctypes.c_void_p(4 * int(c['firstIndex'])), int(c['instanceCount']),
+                        int(c['baseVertex']), int(c['baseInstance']))
+                       for c in self.commands if c['instanceCount']]
+        return int(counts.sum())
+
+    def draw(self):
+        """draw all meshes with one call, the vao has to be bound"""
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.indirect)
+        glMultiDrawElementsIndirect(GL_TRIANGLES, GL_UNSIGNED_INT, None, self.meshCount, 0)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+
+    def drawLoop(self):
+        """draw the meshes one call each, the vao has to be bound"""
+        for count, offset, instances, baseVertex, baseInstance in self.__loop:
+            glDrawElementsInstancedBaseVertexBaseInstance(GL_TRIANGLES, count, GL_UNSIGNED_INT, offset,
+                                                          instances, baseVertex, baseInstance)
+
+    def delete(self):
+        glDeleteBuffers(3, [self.vbo, self.ibo, self.indirect])
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+# octree level of detail for point clouds
+# StarOctree sorts the points along a morton curve, so every octree node
+# is a contiguous range of points, and builds the nodes level by level
+# from the morton codes. Every node stores the centroid of its points as
+# representative point and the number of points as summed brightness.
+# Nodes with at most leafSize points are not subdivided, their children
+# are the points themselves.
+#
+# cut() walks the tree top down one level at a time with numpy: nodes
+# outside the view frustum are dropped, nodes that project to less than
+# a given number of pixels are drawn as one point and the children of
+# all other nodes are visited on the next level. So the work per frame
+# and the number of drawn points depend on the screen coverage, not on
+# the number of points.
+#
+# vertices() holds the nodes followed by the points, as
+# (x, y, z, brightness) float32, cut() returns indices into it.
+
+import numpy as np
+
+from culling import frustumPlanes
+
+
+def spreadBits(x):
+    """insert two zero bits between the lower 10 bits of uint32 x"""
+    x = x & np.uint32(0x000003ff)
+    x = (x | (x << np.uint32(16))) & np.uint32(0x030000ff)
+    x = (x | (x << np.uint32(8))) & np.uint32(0x0300f00f)
+    x = (x | (x << np.uint32(4))) & np.uint32(0x030c30c3)
+    x = (x | (x << np.uint32(2))) & np.uint32(0x09249249)
+    return x
+
+
+def mortonCodes(cells):
+    """30 bit morton codes of (n, 3) integer cell coordinates < 1024"""
+    cells = cells.astype(np.uint32)
+    return (spreadBits(cells[:, 0]) | (spreadBits(cells[:, 1]) << np.uint32(1)) |
+            (spreadBits(cells[:, 2]) << np.uint32(2)))
+
+
+def expandRanges(first, count):
+    """concatenation of the ranges [first, first + count) as int64 array"""
+    count = np.asarray(count, dtype=np.int64)
+    ends = np.cumsum(count)
+    return np.repeat(np.asarray(first, dtype=np.int64) - ends + count, count) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class StarOctree(object):
+
+    def __init__(self, points, depth=10, leafSize=1):
+        """build the octree of (n, 3) points with at most depth levels
+        below the root (depth <= 10)"""
+        if depth > 10:
+            raise ValueError('the morton codes allow at most 10 levels, not %d' % depth)
+        points = np.asarray(points, dtype=np.float32)
+        count = len(points)
+        self.depth = depth
+        self.leafSize = leafSize
+
+        # the bounding cube of the points
+        low = points.min(axis=0).astype(np.float64)
+        extent = float((points.max(axis=0) - low).max()) * 1.0001 + 1e-6
+        self.origin = low
+        self.extent = extent
+
+        # sort the points along the morton curve of the finest level
+        scale = (1 << depth) / extent
+        cells = np.minimum(((points - low) * scale).astype(np.int64), (1 << depth) - 1)
+        codes = mortonCodes(cells)
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        self.points = points[order]
+        # original index of every sorted point
+        self.order = order
+
+        # per level: first point, point count and centroid of every node
+        starts = []
+        counts = []
+        centroids = []
+        # first point and subdivision of all nodes of the previous level,
+        # the dropped ones included
+        levelFirst = None
+        subdivided = None
+        for level in range(depth + 1):
+            keys = codes >> np.uint32(3 * (depth - level))
+            first = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+            first = np.concatenate(([0], first))
+            n = np.diff(np.concatenate((first, [count])))
+
+            # only keep the nodes whose parent is kept and subdivided
+            keep = np.ones(len(first), dtype=bool)
+            if level > 0:
+                parent = np.searchsorted(levelFirst, first, side='right') - 1
+                keep = subdivided[parent]
+            levelFirst = first
+            subdivided = keep & (n > leafSize)
+
+            first = first[keep]
+            n = n[keep]
+            centroid = np.add.reduceat(self.points, first, axis=0, dtype=np.float64) / n[:, None]
+            starts.append(first)
+            counts.append(n)
+            centroids.append(centroid)
+
+        self.levelFirst = np.cumsum([0] + [len(s) for s in starts])
+        nodeCount = int(self.levelFirst[-1])
+        # the points follow the nodes in the vertices
+        self.pointBase = nodeCount
+        self.nodeLevel = np.repeat(np.arange(depth + 1), [len(s) for s in starts])
+
+        # representative points and summed brightness
+        self.nodes = np.empty((nodeCount, 4), dtype=np.float32)
+        self.nodes[:, 0:3] = np.concatenate(centroids)
+        self.nodes[:, 3] = np.concatenate(counts)
+
+        # bounding sphere radius of the node cells
+        self.nodeRadius = (0.5 * np.sqrt(3.0) * extent / (1 << self.nodeLevel)).astype(np.float32)
+        # the coordinates are gathered separately while cutting
+        self.__x = np.ascontiguousarray(self.nodes[:, 0])
+        self.__y = np.ascontiguousarray(self.nodes[:, 1])
+        self.__z = np.ascontiguousarray(self.nodes[:, 2])
+
+        # children: the nodes of the next level or, for leaves, the points
+        self.childFirst = np.empty(nodeCount, dtype=np.int64)
+        self.childCount = np.empty(nodeCount, dtype=np.int64)
+        self.isLeaf = np.empty(nodeCount, dtype=bool)
+        for level in range(depth + 1):
+            a, b = self.levelFirst[level], self.levelFirst[level + 1]
+            leaf = counts[level] <= leafSize
+            if level == depth:
+                leaf[:] = True
+            first = np.searchsorted(starts[level + 1], starts[level]) if level < depth else starts[level]
+            last = (np.searchsorted(starts[level + 1], starts[level] + counts[level])
+                    if level < depth else starts[level] + counts[level])
+
+            self.isLeaf[a:b] = leaf
+            self.childFirst[a:b] = np.where(leaf, self.pointBase + starts[level],
+                                            self.levelFirst[level + 1] + first)
+            self.childCount[a:b] = np.where(leaf, counts[level], last - first)
+
+    def __len__(self):
+        return len(self.points)
+
+    def vertices(self):
+        """(nodes + points, 4) float32 of position and brightness"""
+        data = np.empty((self.pointBase + len(self.points), 4), dtype=np.float32)
+        data[:self.pointBase] = self.nodes
+        data[self.pointBase:, 0:3] = self.points
+        data[self.pointBase:, 3] = 1.0
+        return data
+
+    def cut(self, viewProjection, cameraPosition, pixelScale, pixels=1.0, margin=0.0, near=0.1):
+        """indices into vertices() of the nodes and points to draw
+        viewProjection is the column major view projection matrix,
+        pixelScale the size in pixels of one unit at distance 1
+        (Projection[1][1] * viewport height / 2). Nodes whose bounding
+        sphere is smaller than pixels on screen are drawn as one point.
+        margin is the radius of a point as drawn, for the frustum test"""
+        planes = frustumPlanes(viewProjection)
+        cx, cy, cz = np.asarray(cameraPosition, dtype=np.float32)
+
+        drawn = []
+        active = np.zeros(1, dtype=np.int64)
+        while len(active):
+            x = self.__x[active]
+            y = self.__y[active]
+            z = self.__z[active]
+            # the centroid is inside the cell, so a sphere of twice the
+            # cell radius around it holds the cell
+            reach = 2.0 * self.nodeRadius[active]
+
+            # drop the nodes outside one of the planes
+            visible = np.ones(len(active), dtype=bool)
+            for a, b, c, d in planes:
+                visible &= a * x + b * y + c * z + d >= -(reach + margin)
+            active = active[visible]
+            x = x[visible] - cx
+            y = y[visible] - cy
+            z = z[visible] - cz
+            reach = reach[visible]
+
+            # projected size of the sphere from its nearest point
+            distance = np.maximum(np.sqrt(x * x + y * y + z * z) - reach, near)
+            small = reach * pixelScale < pixels * distance
+            drawn.append(active[small])
+
+            refine = active[~small]
+            leaf = self.isLeaf[refine]
+            # the points of refined leaves are drawn
+            leaves = refine[leaf]
+            drawn.append(expandRanges(self.childFirst[leaves], self.childCount[leaves]))
+            # the children of the other nodes are visited next
+            inner = refine[~leaf]
+            active = expandRanges(self.childFirst[inner], self.childCount[inner])
+
+        return np.concatenate(drawn).astype(np.uint32)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# quantized per instance data
+# A model matrix takes 64 bytes per instance, position, rotation
+# quaternion and uniform scale as float32 still 32. The packed formats
+# store the same transform in fewer bytes and let the vertex attribute
+# fetch unpack them to floats for free:
+#   'float32'     position + scale 4 float, quaternion 4 float  32 bytes
+#   'snorm16'     position + scale 4 half,  quaternion 4 snorm16 16 bytes
+#   '2_10_10_10'  position + scale 4 half,  quaternion in smallest
+#                 three encoding in GL_INT_2_10_10_10_REV         12 bytes
+# Half floats have 11 significant bits, positions up to 1024 are exact
+# to 0.5 or better, so keep them relative to a nearby origin.
+# The smallest three encoding drops the component of the quaternion with
+# the largest magnitude and stores its index in the 2 bit field. q and
+# -q are the same rotation, so the sign is chosen to make the dropped
+# component positive and the shader computes it from the other three
+# (the SMALLEST_THREE define of defines()). Those are at most 1/sqrt(2)
+# in magnitude and stored scaled by sqrt(2) in the 10 bit fields, which
+# keeps the error to about 0.2 degrees. Dropping w instead would blow
+# the error up to several degrees for rotations near 180 degrees.
+#
+# The shader reads the attributes as
+#   layout(location=2) in vec4 instancePositionScale;
+#   layout(location=3) in vec4 instanceRotation;
+
+import ctypes
+import math
+
+import numpy as np
+from OpenGL.GL import *
+
+
+FORMATS = ('float32', 'snorm16', '2_10_10_10')
+
+DTYPES = {'float32': np.dtype([('positionScale', np.float32, 4), ('rotation', np.float32, 4)]),
+          'snorm16': np.dtype([('positionScale', np.float16, 4), ('rotation', np.int16, 4)]),
+          '2_10_10_10': np.dtype([('positionScale', np.float16, 4), ('rotation', np.uint32)])}
+
+
+def packSnorm16(values):
+    """int16 signed normalized values of floats in [-1, 1]"""
+    return np.round(np.clip(values, -1.0, 1.0) * 32767.0).astype(np.int16)
+
+
+# the components kept by the smallest three encoding, by dropped index
+SMALLEST_THREE = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])
+
+
+def packInt2101010(xyz, w):
+    """uint32 GL_INT_2_10_10_10_REV of (n, 3) integers in [-512, 511] and
+    (n,) integers in [-2, 1]"""
+    xyz = np.asarray(xyz, dtype=np.int32) & 0x3ff
+    w = np.asarray(w, dtype=np.int32) & 0x3
+    return (xyz[:, 0] | (xyz[:, 1] << 10) | (xyz[:, 2] << 20) | (w << 30)).astype(np.uint32)
+
+
+def packSmallestThree(rotations):
+    """uint32 GL_INT_2_10_10_10_REV of (n, 4) unit quaternions, the three
+    smallest components times sqrt(2) as 10 bit integers / 511 and the
+    index of the largest minus 2 in the 2 bit field"""
+    rotations = np.asarray(rotations, dtype=np.float32)
+    largest = np.argmax(np.abs(rotations), axis=1)
+    rows = np.arange(len(rotations))
+    sign = np.where(rotations[rows, largest] < 0.0, -1.0, 1.0).astype(np.float32)
+    smallest = np.take_along_axis(rotations, SMALLEST_THREE[largest], axis=1) * sign[:, None]
+    xyz = np.round(np.clip(smallest * np.float32(math.sqrt(2.0)), -1.0, 1.0) * 511.0)
+    return packInt2101010(xyz, largest - 2)
+
+
+def packInstances(positions, rotations, scales, format='snorm16', out=None):
+    """structured array of DTYPES[format] with (n, 3) positions, (n, 4)
+    unit quaternions (x, y, z, w) and (n,) uniform scales"""
+    if format not in FORMATS:
+        raise ValueError('unknown instance format %r' % format)
+    n = len(positions)
+    if out is None:
+        out = np.empty(n, dtype=DTYPES[format])
+
+    out['positionScale'][:, 0:3] = positions
+    out['positionScale'][:, 3] = scales
+    if format == 'float32':
+        out['rotation'] = rotations
+    elif format == 'snorm16':
+        out['rotation'] = packSnorm16(rotations)
+    else:
+        out['rotation'] = packSmallestThree(rotations)
+    return out
+
+
+def setAttributes(format, location=2):
+    """set up the instanced position + scale attribute at location and the
+    rotation at location + 1 of the bound vao from the bound array buffer"""
+    stride = DTYPES[format].itemsize
+    if format == 'float32':
+        glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, stride, None)
+        glVertexAttribPointer(location + 1, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(16))
+    elif format == 'snorm16':
+        glVertexAttribPointer(location, 4, GL_HALF_FLOAT, GL_FALSE, stride, None)
+        glVertexAttribPointer(location + 1, 4, GL_SHORT, GL_TRUE, stride, ctypes.c_void_p(8))
+    else:
+        glVertexAttribPointer(location, 4, GL_HALF_FLOAT, GL_FALSE, stride, None)
+        # not normalized, the 2 bit index would not survive it
+        glVertexAttribPointer(location + 1, 4, GL_INT_2_10_10_10_REV, GL_FALSE, stride, ctypes.c_void_p(8))
+
+    for i in (location, location + 1):
+        glEnableVertexAttribArray(i)
+        glVertexAttribDivisor(i, 1)
+
+
+def defines(format):
+    """shader defines for the format"""
+    return ['SMALLEST_THREE'] if format == '2_10_10_10' else []
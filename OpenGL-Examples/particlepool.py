@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# multi process particle simulation on the cpu
+# The particle state lives in a shared memory block and every worker
+# process advances its own slice of it with particles.step. The workers
+# run in lock step: the main process releases them through one barrier
+# and waits at a second one until all slices are done. Every particle
+# goes through exactly the same numpy operations as in a single
+# process, so the results are bit identical to particles.step.
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import particles
+
+
+# slices start at multiples of this many particles
+ALIGNMENT = 1024
+
+
+def partition(count, workers):
+    """slice boundaries splitting count particles over workers"""
+    bounds = [0]
+    for i in range(1, workers):
+        first = (count * i // workers) // ALIGNMENT * ALIGNMENT
+        bounds.append(max(bounds[-1], first))
+    bounds.append(count)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _worker(name, count, worker, workers, physics, seed, active, stop, start, done):
+    """worker process main loop"""
+    shm = shared_memory.SharedMemory(name=name)
+    state = None
+    try:
+        state = np.ndarray((count, 6), dtype=np.float32, buffer=shm.buf)
+        center, radius, g, dt, bounce = physics
+        while True:
+            start.wait()
+            if stop.value:
+                break
+            # the slices follow the active count so the load stays balanced
+            first, last = partition(active.value, workers)[worker]
+            particles.step(state[first:last], center, radius, g, dt, bounce, seed.value, first)
+            done.wait()
+    except Exception:
+        # wake up everybody waiting for this worker
+        start.abort()
+        done.abort()
+        raise
+    finally:
+        # the view must be gone before the shared memory can be closed
+        del state
+        shm.close()
+
+
+class ParticlePool(object):
+
+    def __init__(self, count, center, radius, g, dt, bounce, workers=None):
+        self.count = count
+        self.workers = workers or mp.cpu_count()
+
+        self.__shm = shared_memory.SharedMemory(create=True, size=max(count * 6 * 4, 1))
+        # the (count, 6) particle state shared with the workers
+        self.state = np.ndarray((count, 6), dtype=np.float32, buffer=self.__shm.buf)
+        self.state[...] = 0.0
+
+        self.__seed = mp.Value('i', 0, lock=False)
+        self.__active = mp.Value('i', count, lock=False)
+        self.__stop = mp.Value('b', 0, lock=False)
+        self.__start = mp.Barrier(self.workers + 1)
+        self.__done = mp.Barrier(self.workers + 1)
+
+        physics = (np.asarray(center, dtype=np.float32), np.asarray(radius, dtype=np.float32),
+                   np.asarray(g, dtype=np.float32), dt, bounce)
+
+        self.__processes = []
+        for worker in range(self.workers):
+            p = mp.Process(target=_worker, args=(self.__shm.name, count, worker, self.workers, physics,
+                                                 self.__seed, self.__active, self.__stop,
+                                                 self.__start, self.__done))
+            p.daemon = True
+            p.start()
+            self.__processes.append(p)
+
+    def step(self, seed, count=None):
+        """advance the first count particles, all by default, by one timestep"""
+        self.__seed.value = seed
+        self.__active.value = self.count if count is None else count
+        self.__start.wait()
+        self.__done.wait()
+
+    def close(self):
+        """stop the workers and free the shared memory"""
+        self.__stop.value = 1
+        try:
+            self.__start.wait()
+        except Exception:
+            pass
+        for p in self.__processes:
+            p.join()
+        self.__processes = []
+
+        del self.state
+        self.__shm.close()
+        self.__shm.unlink()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# particle physics on the cpu
+# a vectorized numpy version of the update step in shaders/09tfshader.vert.
+# The particle state is a (n, 6) float32 array with the same interleaved
+# position/velocity layout as the transform feedback vbos.
+
+import numpy as np
+
+
+# respawn area, same as the initial cube of the particle examples
+SPAWN_CENTER = np.array((0.0, 20.0, 0.0), dtype=np.float32)
+SPAWN_SIZE = np.float32(5.0)
+# particles below this height get respawned
+FLOOR = np.float32(-30.0)
+
+
+def glslHash(x, vertexId, seed):
+    """the hash function of 09tfshader.vert with 32 bit integer wrapping
+    x and vertexId are int32 arrays, returns floats in [0, 1]"""
+    with np.errstate(over='ignore'):
+        x = (x * np.int32(1235167) + vertexId * np.int32(948737) +
+             np.int32(seed) * np.int32(9284365)).astype(np.int32)
+        x = (x >> 13) ^ x
+        x = x * (x * x * np.int32(60493) + np.int32(19990303)) + np.int32(1376312589)
+    return (x & np.int32(0x7fffffff)).astype(np.float32) / np.float32(0x7fffffff - 1)
+
+
+def step(state, center, radius, g, dt, bounce, seed, first=0):
+    """advance the particles by one timestep in place
+
+    state is the (n, 6) float32 particle array, center and radius describe
+    the spheres to bounce off. first is the index of state[0] in the whole
+    particle system, it takes the place of gl_VertexID in the respawn hash.
+    """
+    pos = state[:, 0:3]
+    vel = state[:, 3:6]
+    g = np.asarray(g, dtype=np.float32)
+    dt = np.float32(dt)
+    bounce = np.float32(bounce)
+
+    # every sphere is tested with the incoming velocity
+    outvel = vel.copy()
+    for c, r in zip(np.asarray(center, dtype=np.float32), np.asarray(radius, dtype=np.float32)):
+        diff = pos - c
+        dist2 = np.einsum('ij,ij->i', diff, diff)
+        vdot = np.einsum('ij,ij->i', diff, vel)
+        hit = np.flatnonzero((dist2 < r * r) & (vdot < 0.0))
+        if hit.size:
+            outvel[hit] -= bounce * diff[hit] * (vdot[hit] / dist2[hit])[:, None]
+
+    # integrate
+    outvel += dt * g
+    vel[...] = outvel
+    pos += dt * vel
+
+    # respawn the particles that fell out of the scene
+    dead = np.flatnonzero(pos[:, 1] < FLOOR)
+    if dead.size:
+        vertexId = (dead + first).astype(np.int32)
+        rnd = np.empty((dead.size, 3), dtype=np.float32)
+        for i in range(3):
+            rnd[:, i] = glslHash(np.int32(3) * vertexId + np.int32(i), vertexId, seed)
+        vel[dead] = 0.0
+        pos[dead] = SPAWN_CENTER + SPAWN_SIZE * (np.float32(0.5) - rnd)
+
+    return state
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# exclusive prefix sum of uint buffers with compute shaders (OpenGL 4.3)
+# Every work group scans a block of 512 elements, the block totals are
+# scanned recursively and added back. Used by the spatial hash grid to
+# turn cell counts into cell start offsets.
+
+from OpenGL.GL import *
+
+import glutil
+
+
+BLOCK_SIZE = 512
+
+
+class PrefixSum(object):
+
+    def __init__(self, maxCount):
+        self.maxCount = maxCount
+
+        self.__scanProgram = glutil.computeProgram('./shaders/prefixsum.comp')
+        self.__addProgram = glutil.computeProgram('./shaders/prefixsum_add.comp')
+        self.__scanCountLocation = glGetUniformLocation(self.__scanProgram, 'count')
+        self.__addCountLocation = glGetUniformLocation(self.__addProgram, 'count')
+
+        # one buffer of block sums per recursion level
+        self.__levels = []
+        count = maxCount
+        while count > BLOCK_SIZE:
+            count = glutil.workGroups(count, BLOCK_SIZE)
+            buf = glGenBuffers(1)
+            glBindBuffer(GL_SHADER_STORAGE_BUFFER, buf)
+            glBufferData(GL_SHADER_STORAGE_BUFFER, count * 4, None, GL_DYNAMIC_COPY)
+            self.__levels.append(buf)
+
+        # the last level has a single block, its sum is the total
+        self.total = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.total)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, 4, None, GL_DYNAMIC_COPY)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+    def scan(self, buffer, count, level=0):
+        """replace the first count uints of buffer with their exclusive prefix sum"""
+        if count > self.maxCount:
+            raise ValueError('prefix sum of %d elements, the maximum is %d' % (count, self.maxCount))
+
+        groups = glutil.workGroups(count, BLOCK_SIZE)
+        blockSums = self.__levels[level] if groups > 1 else self.total
+
+        glUseProgram(self.__scanProgram)
+        glUniform1ui(self.__scanCountLocation, count)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, buffer)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, blockSums)
+        glDispatchCompute(groups, 1, 1)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+
+        if groups > 1:
+            self.scan(blockSums, groups, level + 1)
+
+            glUseProgram(self.__addProgram)
+            glUniform1ui(self.__addCountLocation, count)
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, buffer)
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, blockSums)
+            glDispatchCompute(glutil.workGroups(count, 256), 1, 1)
+            glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+
+        glUseProgram(0)
+
+    def delete(self):
+        glDeleteBuffers(len(self.__levels) + 1, self.__levels + [self.total])
+        glDeleteProgram(self.__scanProgram)
+        glDeleteProgram(self.__addProgram)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# gpu radix sort of uint keys with a uint payload (OpenGL 4.3)
+# Every pass sorts by 4 bits of the keys: the keys of every block of 4096
+# are counted per digit, the digit-major counts are turned into output
+# offsets with a PrefixSum and the keys are scattered stably to their
+# offset plus their rank among the same digits of their block.
+# 8 passes sort 32 bit keys, the sorted keys end up in the input buffers.
+#
+# RadixSort.depthKeys fills the keys with the view depth of particles so
+# they can be drawn back to front, the payload is the particle index
+# and can be used as an index buffer.
+
+import numpy as np
+from OpenGL.GL import *
+
+import glutil
+from prefixsum import PrefixSum
+
+
+# keys per work group, 256 invocations with 16 keys each
+BLOCK_SIZE = 4096
+RADIX_BITS = 4
+RADIX = 1 << RADIX_BITS
+
+
+def floatKeys(values):
+    """map floats to uints that sort in the same order, like the shaders do"""
+    bits = np.asarray(values, dtype=np.float32).view(np.uint32)
+    mask = np.where(bits >> 31, np.uint32(0xffffffff), np.uint32(0x80000000))
+    return bits ^ mask
+
+
+def sortReference(keys):
+    """the order RadixSort.sort produces, a stable argsort"""
+    return np.argsort(keys, kind='stable').astype(np.uint32)
+
+
+class RadixSort(object):
+    """sorts the first count elements of keys and values by keys"""
+
+    def __init__(self, maxCount):
+        self.maxCount = maxCount
+        blocks = glutil.workGroups(maxCount, BLOCK_SIZE)
+
+        self.__depthProgram = glutil.computeProgram('./shaders/radixsort_depth.comp')
+        self.__countProgram = glutil.computeProgram('./shaders/radixsort_count.comp')
+        self.__scatterProgram = glutil.computeProgram('./shaders/radixsort_scatter.comp')
+        self.__prefixSum = PrefixSum(blocks * RADIX)
+
+        # the keys and values are sorted back and forth between
+        # these and the scratch buffers
+        self.keys, self.values, self.__keys, self.__values = glGenBuffers(4)
+        for buf in (self.keys, self.values, self.__keys, self.__values):
+            glBindBuffer(GL_SHADER_STORAGE_BUFFER, buf)
+            glBufferData(GL_SHADER_STORAGE_BUFFER, maxCount * 4, None, GL_DYNAMIC_COPY)
+
+        # digit counts of every block, digit major
+        self.__counts = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.__counts)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, blocks * RADIX * 4, None, GL_DYNAMIC_COPY)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+    def depthKeys(self, particleBuffer, count, view, stride=6):
+        """fill keys with the view depth of the first count particles of
+        particleBuffer and values with their indices. Sorted, the values
+        are the particles from back to front.
+        view is the view matrix as column major float32 array, the
+        particles have stride floats each with the position first"""
+        if count > self.maxCount:
+            raise ValueError('sorting %d keys, the maximum is %d' % (count, self.maxCount))
+
+        glUseProgram(self.__depthProgram)
+        glUniformMatrix4fv(glGetUniformLocation(self.__depthProgram, 'View'), 1, GL_FALSE, view)
+        glUniform1ui(glGetUniformLocation(self.__depthProgram, 'count'), count)
+        glUniform1ui(glGetUniformLocation(self.__depthProgram, 'stride'), stride)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, particleBuffer)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, self.keys)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 2, self.values)
+        glDispatchCompute(glutil.workGroups(count, 256), 1, 1)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+        glUseProgram(0)
+
+    def sort(self, count, bits=32):
+        """sort the first count keys and values by the lowest bits of the keys"""
+        if count > self.maxCount:
+            raise ValueError('sorting %d keys, the maximum is %d' % (count, self.maxCount))
+
+        blocks = glutil.workGroups(count, BLOCK_SIZE)
+        # an odd number of passes would leave the result in the scratch buffers
+        passes = glutil.workGroups(bits, 2 * RADIX_BITS) * 2
+
+        source = (self.keys, self.values)
+        target = (self.__keys, self.__values)
+        for i in range(passes):
+            shift = i * RADIX_BITS
+
+            # count the digits per block
+            glUseProgram(self.__countProgram)
+            glUniform1ui(glGetUniformLocation(self.__countProgram, 'count'), count)
+            glUniform1ui(glGetUniformLocation(self.__countProgram, 'blocks'), blocks)
+            glUniform1ui(glGetUniformLocation(self.__countProgram, 'shift'), shift)
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, source[0])
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, self.__counts)
+            glDispatchCompute(blocks, 1, 1)
+            glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+
+            # the counts become the output offset of every digit and block
+            self.__prefixSum.scan(self.__counts, blocks * RADIX)
+
+            # move the keys and values to their place
+            glUseProgram(self.__scatterProgram)
+            glUniform1ui(glGetUniformLocation(self.__scatterProgram, 'count'), count)
+            glUniform1ui(glGetUniformLocation(self.__scatterProgram, 'blocks'), blocks)
+            glUniform1ui(glGetUniformLocation(self.__scatterProgram, 'shift'), shift)
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, source[0])
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, source[1])
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 2, self.__counts)
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 3, target[0])
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 4, target[1])
+            glDispatchCompute(blocks, 1, 1)
+            glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+
+            source, target = target, source
+
+        # the values are used as index buffer afterwards
+        glMemoryBarrier(GL_ELEMENT_ARRAY_BARRIER_BIT)
+        glUseProgram(0)
+
+    def delete(self):
+        glDeleteBuffers(5, [self.keys, self.values, self.__keys, self.__values, self.__counts])
+        for program in (self.__depthProgram, self.__countProgram, self.__scatterProgram):
+            glDeleteProgram(program)
+        self.__prefixSum.delete()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# asynchronous gpu to cpu readback
+# ReadbackRing copies buffers, framebuffer pixels or textures into a ring
+# of buffer objects (pixel buffer objects for images) and puts a fence
+# behind every copy. poll() checks the fences without waiting and hands
+# every finished copy to a callback as a numpy array over the mapped
+# buffer, so nothing is copied on the cpu unless the callback wants to.
+# The array is only valid during the callback.
+#
+# With enough buffers in the ring the copies of a frame are done by the
+# time they are polled a few frames later and reading back never stalls
+# the render loop. If the ring runs full, the oldest copy is waited for
+# or, with dropWhenFull, the new copy is skipped.
+
+import ctypes
+from collections import deque
+
+import numpy as np
+from OpenGL.GL import *
+
+
+class ReadbackRing(object):
+
+    def __init__(self, nbytes, callback, count=3, dropWhenFull=False):
+        """nbytes is the size of the largest copy, callback(array, tag) is
+        called with every finished copy in the order they were made"""
+        self.nbytes = nbytes
+        self.callback = callback
+        self.dropWhenFull = dropWhenFull
+        # copies that were skipped because the ring was full
+        self.dropped = 0
+
+        self.__buffers = list(glGenBuffers(count))
+        for buf in self.__buffers:
+            glBindBuffer(GL_COPY_WRITE_BUFFER, buf)
+            glBufferData(GL_COPY_WRITE_BUFFER, nbytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, 0)
+
+        self.__free = list(self.__buffers)
+        # (buffer, fence, shape, dtype, tag) of the copies in flight, oldest first
+        self.__pending = deque()
+
+    def __acquire(self):
+        """a free buffer of the ring, None if the copy should be skipped"""
+        if not self.__free:
+            if self.dropWhenFull:
+                self.dropped += 1
+                return None
+            # wait for the oldest copy
+            self.__finish(*self.__pending.popleft())
+        return self.__free.pop()
+
+    def __submit(self, buf, shape, dtype, tag):
+        fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.__pending.append((buf, fence, shape, dtype, tag))
+
+    def copyBuffer(self, buffer, shape, dtype=np.float32, tag=None, offset=0):
+        """queue a copy of a buffer object, shape and dtype describe the data
+        returns False if the copy was dropped"""
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        buf = self.__acquire()
+        if buf is None:
+            return False
+
+        glBindBuffer(GL_COPY_READ_BUFFER, buffer)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, buf)
+        glCopyBufferSubData(GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, offset, 0, nbytes)
+        glBindBuffer(GL_COPY_READ_BUFFER, 0)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, 0)
+
+        self.__submit(buf, tuple(shape), dtype, tag)
+        return True
+
+    def readPixels(self, x, y, width, height, tag=None):
+        """queue a copy of RGBA8 pixels of the bound read framebuffer,
+        the array is (height, width, 4) uint8 with the bottom row first"""
+        buf = self.__acquire()
+        if buf is None:
+            return False
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, buf)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glReadPixels(x, y, width, height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        self.__submit(buf, (height, width, 4), np.uint8, tag)
+        return True
+
+    def readTexture(self, texture, width, height, tag=None, level=0):
+        """queue a copy of a RGBA8 2d texture level, see readPixels"""
+        buf = self.__acquire()
+        if buf is None:
+            return False
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, buf)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glGetTexImage(GL_TEXTURE_2D, level, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        self.__submit(buf, (height, width, 4), np.uint8, tag)
+        return True
+
+    def pending(self):
+        """number of copies in flight"""
+        return len(self.__pending)
+
+    def poll(self):
+        """hand the copies the gpu has finished to the callback, never waits
+        returns the number of copies handed over"""
+        count = 0
+        while self.__pending:
+            fence = self.__pending[0][1]
+            result = glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0)
+            if result not in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED):
+                break
+            self.__finish(*self.__pending.popleft())
+            count += 1
+        return count
+
+    def __finish(self, buf, fence, shape, dtype, tag):
+        """wait for a copy and hand it to the callback"""
+        while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000) == GL_TIMEOUT_EXPIRED:
+            pass
+        glDeleteSync(fence)
+
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        glBindBuffer(GL_COPY_READ_BUFFER, buf)
+        ptr = glMapBufferRange(GL_COPY_READ_BUFFER, 0, nbytes, GL_MAP_READ_BIT)
+        data = (ctypes.c_ubyte * nbytes).from_address(ptr)
+        try:
+            self.callback(np.frombuffer(data, dtype=dtype).reshape(shape), tag)
+        finally:
+            glBindBuffer(GL_COPY_READ_BUFFER, buf)
+            glUnmapBuffer(GL_COPY_READ_BUFFER)
+            glBindBuffer(GL_COPY_READ_BUFFER, 0)
+            self.__free.append(buf)
+
+    def flush(self):
+        """wait for all copies in flight and hand them to the callback"""
+        while self.__pending:
+            self.__finish(*self.__pending.popleft())
+
+    def delete(self):
+        """free the buffers, copies in flight are discarded"""
+        for buf, fence, shape, dtype, tag in self.__pending:
+            glDeleteSync(fence)
+        self.__pending.clear()
+        glDeleteBuffers(len(self.__buffers), self.__buffers)
+        self.__buffers = []
+        self.__free = []
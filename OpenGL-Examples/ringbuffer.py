@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# persistently mapped ring buffer for streaming data to the gpu
+# PersistentRing allocates an immutable buffer with glBufferStorage
+# (OpenGL 4.4) and keeps it mapped persistent and coherent for its whole
+# life. The buffer is split into segments, by default three: every frame
+# the cpu writes into the next segment through a numpy array over the
+# mapping while the gpu still reads the segments of the previous frames.
+# A fence behind the draws of a segment tells when it may be written
+# again, so neither glBufferData orphaning nor glBufferSubData with its
+# implicit synchronization is needed.
+#
+# The data of a segment are addressed by offset, for instanced vertex
+# attributes the offset is passed as base instance of the draw.
+#
+#   data = ring.begin()           # waits for the segment if needed
+#   data[...] = ...               # write the frame's data
+#   ... draw with ring.offset ...
+#   ring.end()                    # fence the draws of the segment
+
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+
+class PersistentRing(object):
+
+    def __init__(self, segmentBytes, segments=3, alignment=256):
+        """segmentBytes is the size of the data of one frame, it is rounded
+        up to a multiple of alignment, e.g. the size of one instance or
+        GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT"""
+        self.segmentBytes = (segmentBytes + alignment - 1) // alignment * alignment
+        self.segments = segments
+        self.nbytes = self.segmentBytes * segments
+        # number of times a segment was still in use by the gpu
+        self.stalls = 0
+
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        self.buffer = glGenBuffers(1)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, self.buffer)
+        glBufferStorage(GL_COPY_WRITE_BUFFER, self.nbytes, None, flags)
+        ptr = glMapBufferRange(GL_COPY_WRITE_BUFFER, 0, self.nbytes, flags)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, 0)
+        self.__memory = np.frombuffer((ctypes.c_ubyte * self.nbytes).from_address(ptr), dtype=np.uint8)
+
+        self.__fences = [None] * segments
+        self.index = 0
+        # byte offset of the current segment in the buffer
+        self.offset = 0
+
+    def begin(self, dtype=np.uint8, shape=None):
+        """move to the next segment and return it as array of dtype with
+        shape, the whole segment by default. Waits for the gpu if it still
+        reads the segment"""
+        self.index = (self.index + 1) % self.segments
+        self.offset = self.index * self.segmentBytes
+
+        fence = self.__fences[self.index]
+        if fence is not None:
+            if glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0) == GL_TIMEOUT_EXPIRED:
+                self.stalls += 1
+                while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000) == GL_TIMEOUT_EXPIRED:
+                    pass
+            glDeleteSync(fence)
+            self.__fences[self.index] = None
+
+        segment = self.__memory[self.offset:self.offset + self.segmentBytes].view(dtype)
+        if shape is not None:
+            segment = segment[:int(np.prod(shape))].reshape(shape)
+        return segment
+
+    def end(self):
+        """fence the commands issued so far, the current segment is written
+        again once they are done"""
+        if self.__fences[self.index] is not None:
+            glDeleteSync(self.__fences[self.index])
+        self.__fences[self.index] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def delete(self):
+        for fence in self.__fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        self.__fences = [None] * self.segments
+        self.__memory = None
+        glBindBuffer(GL_COPY_WRITE_BUFFER, self.buffer)
+        glUnmapBuffer(GL_COPY_WRITE_BUFFER)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, 0)
+        glDeleteBuffers(1, [self.buffer])
@@ -1,14 +1,16 @@
 #version 330
 
+// INSTANCES_PER_BLOCK is defined by the program from the uniform block
+// size limit, the uniform buffer is bound one chunk at a time
+uniform mat4 ViewProjection;
+
 layout(std140) uniform Matrices
 {
-    mat4 ViewProjection;
-    mat4 Model[8];
+    mat4 Model[INSTANCES_PER_BLOCK];
 };
 
 layout(location=0) in vec4 vposition;
 layout(location=1) in vec4 vcolor;
-layout(location=2) in vec3 voffset; // the per instance offset
 out vec4 fcolor;
 
 void main()
@@ -0,0 +1,20 @@
+#version 330
+
+uniform mat4 ViewProjection;
+uniform samplerBuffer models; // the model matrices, 4 texels per matrix
+layout(location=0) in vec4 vposition;
+layout(location=1) in vec4 vcolor;
+
+out vec4 fcolor;
+
+void main()
+{
+    // the columns of the model matrix of this instance
+    int base = 4 * gl_InstanceID;
+    mat4 Model = mat4(texelFetch(models, base),
+                      texelFetch(models, base + 1),
+                      texelFetch(models, base + 2),
+                      texelFetch(models, base + 3));
+    fcolor = vcolor;
+    gl_Position = ViewProjection * Model * vposition;
+}
@@ -0,0 +1,14 @@
+#version 330
+
+uniform mat4 ViewProjection;
+layout(location=0) in vec4 vposition;
+layout(location=1) in vec4 vcolor;
+layout(location=2) in mat4 Model; // per instance, locations 2 to 5
+
+out vec4 fcolor;
+
+void main()
+{
+    fcolor = vcolor;
+    gl_Position = ViewProjection * Model * vposition;
+}
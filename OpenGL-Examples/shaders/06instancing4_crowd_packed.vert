@@ -0,0 +1,39 @@
+#version 330
+
+uniform mat4 ViewProjection;
+layout(location=0) in vec4 vposition;
+layout(location=1) in vec4 vcolor;
+// per instance, unpacked to floats by the attribute fetch
+layout(location=2) in vec4 instancePositionScale;
+layout(location=3) in vec4 instanceRotation;
+
+out vec4 fcolor;
+
+void main()
+{
+    // the quaternion, 10 bit quaternions store the three smallest
+    // components times sqrt(2) and the index of the largest minus 2
+#ifdef SMALLEST_THREE
+    vec3 abc = instanceRotation.xyz * (1.0 / (511.0 * sqrt(2.0)));
+    float d = sqrt(max(0.0, 1.0 - dot(abc, abc)));
+    int largest = int(instanceRotation.w) + 2;
+    vec4 q;
+    if (largest == 0)
+        q = vec4(d, abc);
+    else if (largest == 1)
+        q = vec4(abc.x, d, abc.yz);
+    else if (largest == 2)
+        q = vec4(abc.xy, d, abc.z);
+    else
+        q = vec4(abc, d);
+#else
+    vec4 q = instanceRotation;
+#endif
+    q = normalize(q);
+
+    // scale, rotate and translate
+    vec3 p = vposition.xyz * instancePositionScale.w;
+    p += 2.0 * cross(q.xyz, cross(q.xyz, p) + q.w * p);
+    fcolor = vcolor;
+    gl_Position = ViewProjection * vec4(p + instancePositionScale.xyz, 1.0);
+}
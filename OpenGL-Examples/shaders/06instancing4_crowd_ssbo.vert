@@ -0,0 +1,17 @@
+#version 430
+
+uniform mat4 ViewProjection;
+layout(std430, binding=0) readonly buffer Models
+{
+    mat4 Model[];
+};
+layout(location=0) in vec4 vposition;
+layout(location=1) in vec4 vcolor;
+
+out vec4 fcolor;
+
+void main()
+{
+    fcolor = vcolor;
+    gl_Position = ViewProjection * Model[gl_InstanceID] * vposition;
+}
@@ -1,11 +1,18 @@
 #version 330
 
+#ifdef POINT_SPRITE
+// the quad coordinates of the point sprite, y points up like in the quad
+#define txcoord (vec2(2, -2) * gl_PointCoord + vec2(-1, 1))
+#else
 in vec2 txcoord;
+#endif
+// number of stars the billboard stands for, see octree.py
+in float brightness;
 
 layout(location = 0) out vec4 FragColor;
 
 void main()
 {
     float s = 0.2 * (1 / (1 + 15. * dot(txcoord, txcoord)) - 1 / 16.);
-    FragColor = s * vec4(1, 0.9, 0.6, 1);
+    FragColor = brightness * s * vec4(1, 0.9, 0.6, 1);
 }
@@ -1,8 +1,13 @@
 #version 330
 
 layout(location = 0) in vec4 vposition;
+// number of stars a point stands for, see octree.py
+layout(location = 1) in float vbrightness;
+
+out float gbrightness;
 
 void main()
 {
     gl_Position = vposition;
+    gbrightness = vbrightness;
 }
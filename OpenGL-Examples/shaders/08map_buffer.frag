@@ -1,6 +1,11 @@
 #version 330
 
+#ifdef POINT_SPRITE
+// the quad coordinates of the point sprite, y points up like in the quad
+#define txcoord (vec2(2, -2) * gl_PointCoord + vec2(-1, 1))
+#else
 in vec2 txcoord;
+#endif
 
 layout(location = 0) out vec4 FragColor;
 
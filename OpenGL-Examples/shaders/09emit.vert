@@ -0,0 +1,45 @@
+#version 400
+
+// particles with a lifetime. With spawn set new particles are created
+// from the emitter parameters instead of reading the input, 09emit.geom
+// drops the dead particles from the transform feedback output.
+
+#include "09physics.glsl"
+
+layout(location = 0) in vec3 inposition;
+layout(location = 1) in vec3 invelocity;
+layout(location = 2) in float inlife;
+
+uniform bool spawn;
+uniform vec3 emitterPosition;
+uniform vec3 emitterVelocity;
+uniform float emitterSpread;
+uniform float emitterSpeedSpread;
+uniform vec2 emitterLife;
+
+out vec3 position;
+out vec3 velocity;
+out float life;
+
+void main()
+{
+    int id = gl_VertexID;
+    if(spawn)
+    {
+        vec3 offset = vec3(hash(7 * id + 0, id), hash(7 * id + 1, id), hash(7 * id + 2, id)) - 0.5;
+        vec3 speed = vec3(hash(7 * id + 3, id), hash(7 * id + 4, id), hash(7 * id + 5, id)) - 0.5;
+        position = emitterPosition + emitterSpread * offset;
+        velocity = emitterVelocity + emitterSpeedSpread * speed;
+        life = mix(emitterLife.x, emitterLife.y, hash(7 * id + 6, id));
+    }
+    else
+    {
+        velocity = invelocity;
+        bounceColliders(inposition, invelocity, velocity);
+        velocity += dt * g;
+        position = inposition + dt * velocity;
+
+        // particles that fall out of the scene die as well
+        life = position.y < -30.0 ? 0.0 : inlife - dt;
+    }
+}
@@ -0,0 +1,91 @@
+// particle physics shared by 09tfshader.vert, 09particles.comp and 09emit.vert,
+// included after the #version line
+
+// colliders and their bvh, see colliders.py
+uniform samplerBuffer colliders;
+uniform samplerBuffer nodeBounds;
+uniform isamplerBuffer nodeLinks;
+uniform int nodeCount;
+
+uniform vec3 g;
+uniform float dt;
+uniform float bounce;
+uniform int seed;
+
+// random number for particle id, must match glslHash in particles.py
+float hash(int x, int id)
+{
+    x = x * 1235167 + id * 948737 + seed * 9284365;
+    x = (x >> 13) ^ x;
+    return ((x * (x * x * 60493 + 19990303) + 1376312589) & 0x7fffffff) / float(0x7fffffff-1);
+}
+
+// velocity change from bouncing off collider k
+vec3 bounceCollider(int k, vec3 position, vec3 velocity)
+{
+    vec4 shape = texelFetch(colliders, 2 * k);
+    vec3 size = texelFetch(colliders, 2 * k + 1).xyz;
+    vec3 diff = position - shape.xyz;
+
+    if(shape.w == 0.0)
+    {
+        // sphere
+        float dist = length(diff);
+        float vdot = dot(diff, velocity);
+        if(dist < size.x && vdot < 0.0)
+            return -bounce * diff * vdot / (dist * dist);
+    }
+    else
+    {
+        // box, push out along the axis of least penetration
+        vec3 depth = size - abs(diff);
+        if(all(greaterThan(depth, vec3(0, 0, 0))))
+        {
+            int axis = depth.x <= depth.y ? (depth.x <= depth.z ? 0 : 2) : (depth.y <= depth.z ? 1 : 2);
+            vec3 normal = vec3(0, 0, 0);
+            normal[axis] = diff[axis] < 0.0 ? -1.0 : 1.0;
+            float vdot = dot(normal, velocity);
+            if(vdot < 0.0)
+                return -bounce * normal * vdot;
+        }
+    }
+    return vec3(0, 0, 0);
+}
+
+// add the bounces off all colliders containing position to outvelocity
+void bounceColliders(vec3 position, vec3 velocity, inout vec3 outvelocity)
+{
+    // walk the bvh, nodes are in depth first order: descend into nodes
+    // containing the particle and skip the subtrees of all others
+    int node = 0;
+    while(node < nodeCount)
+    {
+        vec3 lower = texelFetch(nodeBounds, 2 * node).xyz;
+        vec3 upper = texelFetch(nodeBounds, 2 * node + 1).xyz;
+        ivec4 link = texelFetch(nodeLinks, node);
+        if(all(greaterThanEqual(position, lower)) && all(lessThanEqual(position, upper)))
+        {
+            for(int k = link.y; k < link.y + link.z; ++k)
+                outvelocity += bounceCollider(k, position, velocity);
+            node += 1;
+        }
+        else
+        {
+            node = link.x;
+        }
+    }
+}
+
+// gravity and integration, particles falling out of the scene are
+// respawned in the initial cube
+void integrate(int id, inout vec3 position, inout vec3 velocity)
+{
+    velocity += dt * g;
+    position = position + dt * velocity;
+    if(position.y < -30.0)
+    {
+        velocity = vec3(0, 0, 0);
+        position = 0.5 - vec3(hash(3 * id + 0, id), hash(3 * id + 1, id), hash(3 * id + 2, id));
+        position = vec3(0, 20, 0) + 5.0 * position;
+    }
+}
@@ -1,11 +1,18 @@
 #version 330
 
-uniform vec3 center[3];
-uniform float radius[3];
-uniform vec3 g;
-uniform float dt;
-uniform float bounce;
-uniform int seed;
+#include "09physics.glsl"
+
+#ifdef PARTICLE_COLLISIONS
+// spatial hash grid built by spatialhash.py
+uniform samplerBuffer particles;   // position at 2 * i, velocity at 2 * i + 1
+uniform usamplerBuffer cellStart;
+uniform usamplerBuffer sortedIndex;
+uniform float cellSize;
+uniform int tableSize;
+uniform float particleRadius;
+uniform float stiffness;
+uniform float damping;
+#endif
 
 layout(location = 0) in vec3 inposition;
 layout(location = 1) in vec3 invelocity;
@@ -13,31 +20,56 @@ layout(location = 1) in vec3 invelocity;
 out vec3 outposition;
 out vec3 outvelocity;
 
-float hash(int x)
+#ifdef PARTICLE_COLLISIONS
+// must match cellHash in spatialhash.py
+int cellHash(ivec3 cell)
 {
-    x = x * 1235167 + gl_VertexID * 948737 + seed * 9284365;
-    x = (x >> 13) ^ x;
-    return ((x * (x * x * 60493 + 19990303) + 1376312589) & 0x7fffffff) / float(0x7fffffff-1);
+    return int(uint((cell.x * 73856093) ^ (cell.y * 19349663) ^ (cell.z * 83492791)) % uint(tableSize));
 }
 
-void main()
+// spring and damping forces from the particles touching this one
+vec3 collideParticles()
 {
-    outvelocity = invelocity;
-    for(int j = 0; j < 3; ++j)
+    vec3 force = vec3(0, 0, 0);
+    ivec3 cell = ivec3(floor(inposition / cellSize));
+    for(int z = -1; z <= 1; ++z)
+    for(int y = -1; y <= 1; ++y)
+    for(int x = -1; x <= 1; ++x)
     {
-        vec3 diff = inposition - center[j];
-        float dist = length(diff);
-        float vdot = dot(diff, invelocity);
-        if(dist < radius[j] && vdot < 0.0)
-            outvelocity -= bounce * diff * vdot / (dist * dist);
+        ivec3 neighbor = cell + ivec3(x, y, z);
+        int h = cellHash(neighbor);
+        int end = int(texelFetch(cellStart, h + 1).r);
+        for(int k = int(texelFetch(cellStart, h).r); k < end; ++k)
+        {
+            int j = int(texelFetch(sortedIndex, k).r);
+            vec3 position = texelFetch(particles, 2 * j).xyz;
+            // the entry also holds other cells with the same hash, some
+            // of them are neighbors of this cell too
+            if(ivec3(floor(position / cellSize)) != neighbor)
+                continue;
+            vec3 diff = inposition - position;
+            float dist2 = dot(diff, diff);
+            if(j != gl_VertexID && dist2 < 4.0 * particleRadius * particleRadius && dist2 > 0.0)
+            {
+                float dist = sqrt(dist2);
+                vec3 n = diff / dist;
+                float vn = dot(invelocity - texelFetch(particles, 2 * j + 1).xyz, n);
+                force += (stiffness * (2.0 * particleRadius - dist) - damping * vn) * n;
+            }
+        }
     }
+    return force;
+}
+#endif
 
-    outvelocity += dt * g;
-    outposition = inposition + dt * outvelocity;
-    if(outposition.y < -30.0)
-    {
-        outvelocity = vec3(0, 0, 0);
-        outposition = 0.5 - vec3(hash(3 * gl_VertexID + 0), hash(3 * gl_VertexID + 1), hash(3 * gl_VertexID + 2));
-        outposition = vec3(0, 20, 0) + 5.0 * outposition;
-    }
+void main()
+{
+    outvelocity = invelocity;
+#ifdef PARTICLE_COLLISIONS
+    outvelocity += dt * collideParticles();
+#endif
+    bounceColliders(inposition, invelocity, outvelocity);
+
+    outposition = inposition;
+    integrate(gl_VertexID, outposition, outvelocity);
 }
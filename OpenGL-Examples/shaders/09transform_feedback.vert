@@ -1,8 +1,12 @@
 #version 330
 
 layout(location = 0) in vec4 vposition;
+layout(location = 1) in vec3 vvelocity;
+
+// time since the drawn state, used to interpolate between two timesteps
+uniform float lag;
 
 void main()
 {
-    gl_Position = vposition;
+    gl_Position = vec4(vposition.xyz - lag * vvelocity, 1.0);
 }
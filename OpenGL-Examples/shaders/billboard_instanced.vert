@@ -0,0 +1,25 @@
+#version 330
+
+uniform mat4 View;
+uniform mat4 Projection;
+// half width of the quad in view space
+uniform float size;
+
+// one particle per instance
+layout(location = 0) in vec4 vposition;
+// passed on for the fragment shaders that use it
+layout(location = 1) in float vbrightness;
+
+out vec2 txcoord;
+out float brightness;
+
+void main()
+{
+    brightness = vbrightness;
+    // the corners of the triangle strip in the order of the geometry
+    // shader: (-1, -1), (1, -1), (-1, 1), (1, 1)
+    txcoord = vec2(gl_VertexID & 1, gl_VertexID >> 1) * 2.0 - 1.0;
+
+    vec4 pos = View * vposition;
+    gl_Position = Projection * (pos + size * vec4(txcoord, 0, 0));
+}
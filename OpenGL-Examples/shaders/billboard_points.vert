@@ -0,0 +1,22 @@
+#version 330
+
+uniform mat4 View;
+uniform mat4 Projection;
+// half width of the quad in view space
+uniform float size;
+uniform float viewportHeight;
+
+layout(location = 0) in vec4 vposition;
+// passed on for the fragment shaders that use it
+layout(location = 1) in float vbrightness;
+
+out float brightness;
+
+void main()
+{
+    brightness = vbrightness;
+    gl_Position = Projection * (View * vposition);
+
+    // the projected width of the quad in pixels
+    gl_PointSize = size * Projection[1][1] * viewportHeight / gl_Position.w;
+}
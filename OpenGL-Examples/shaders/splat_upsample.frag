@@ -0,0 +1,49 @@
+#version 330
+
+// upsample the low resolution splat buffer, bilinear by default,
+// Catmull-Rom bicubic with BICUBIC defined
+
+uniform sampler2D splats;
+in vec2 ftexcoord;
+layout(location = 0) out vec4 FragColor;
+
+#ifdef BICUBIC
+vec4 catmullRom(float t)
+{
+    // weights of the 4 texels around t in [0, 1)
+    float t2 = t * t;
+    float t3 = t2 * t;
+    return 0.5 * vec4(-t3 + 2.0 * t2 - t,
+                      3.0 * t3 - 5.0 * t2 + 2.0,
+                      -3.0 * t3 + 4.0 * t2 + t,
+                      t3 - t2);
+}
+#endif
+
+void main()
+{
+#ifdef BICUBIC
+    ivec2 size = textureSize(splats, 0);
+    vec2 texel = ftexcoord * vec2(size) - 0.5;
+    ivec2 base = ivec2(floor(texel));
+    vec2 f = texel - vec2(base);
+    vec4 wx = catmullRom(f.x);
+    vec4 wy = catmullRom(f.y);
+
+    vec4 color = vec4(0);
+    for(int y = 0; y < 4; ++y)
+    {
+        vec4 row = vec4(0);
+        for(int x = 0; x < 4; ++x)
+        {
+            ivec2 p = clamp(base + ivec2(x - 1, y - 1), ivec2(0), size - 1);
+            row += wx[x] * texelFetch(splats, p, 0);
+        }
+        color += wy[y] * row;
+    }
+    // the negative lobes can undershoot next to bright particles
+    FragColor = max(color, vec4(0));
+#else
+    FragColor = texture(splats, ftexcoord);
+#endif
+}
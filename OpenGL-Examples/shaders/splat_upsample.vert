@@ -0,0 +1,11 @@
+#version 330
+
+out vec2 ftexcoord;
+
+void main()
+{
+    // a triangle covering the screen: (-1, -1), (3, -1), (-1, 3)
+    vec2 corner = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2);
+    ftexcoord = corner;
+    gl_Position = vec4(2.0 * corner - 1.0, 0, 1);
+}
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+# uniform grid spatial hash for particle-particle collisions
+# The particles are sorted by the hash table entry of their grid cell,
+# cellStart[h]:cellStart[h + 1] is then the range of sortedIndex holding
+# the particles of entry h. A particle only has to look at the 27 cells
+# around it, so finding the neighbors of all particles is O(n).
+# An entry also holds the particles of every other cell with the same
+# hash. Because the hash is a xor, mirrored neighbor cells like (-1, -1, z)
+# and (1, 1, z) around a cell with a 0 coordinate share an entry, so the
+# candidates of an entry are only accepted if they are in the cell that
+# is looked at. Otherwise some contacts would be counted twice.
+#
+# SpatialHashGrid builds the grid on the gpu with compute shaders
+# (OpenGL 4.3), the numpy functions are the reference implementation.
+
+import numpy as np
+from OpenGL.GL import *
+
+import glutil
+from prefixsum import PrefixSum
+
+
+# the 27 cells around and including the cell of a particle, in the
+# order the shader visits them
+NEIGHBOR_OFFSETS = np.array([(x, y, z) for z in (-1, 0, 1)
+                                       for y in (-1, 0, 1)
+                                       for x in (-1, 0, 1)], dtype=np.int32)
+
+
+def cellHash(cells, tableSize):
+    """hash table entry of integer (n, 3) cell coordinates"""
+    cells = np.asarray(cells, dtype=np.int32)
+    with np.errstate(over='ignore'):
+        h = ((cells[:, 0] * np.int32(73856093)) ^
+             (cells[:, 1] * np.int32(19349663)) ^
+             (cells[:, 2] * np.int32(83492791)))
+    return h.view(np.uint32) % np.uint32(tableSize)
+
+
+def cellCoords(positions, cellSize):
+    """integer grid cell of (n, 3) positions"""
+    return np.floor(positions / np.float32(cellSize)).astype(np.int32)
+
+
+def buildGrid(positions, cellSize, tableSize):
+    """sort particles by hash table entry
+    returns (sortedIndex, cellStart) as built by SpatialHashGrid, except
+    that the gpu version does not keep the order inside a cell"""
+    h = cellHash(cellCoords(positions, cellSize), tableSize)
+    sortedIndex = np.argsort(h, kind='stable').astype(np.uint32)
+
+    cellStart = np.zeros(tableSize + 1, dtype=np.uint32)
+    np.cumsum(np.bincount(h, minlength=tableSize), out=cellStart[1:])
+    return sortedIndex, cellStart
+
+
+def collide(state, grid, cellSize, tableSize, radius, stiffness, damping, dt):
+    """velocity change of every particle from particle-particle contacts
+    state is the (n, 6) particle array, grid the result of buildGrid.
+    Touching particles are pushed apart by a spring and their approach
+    velocity is damped, the same as collideParticles in 09tfshader.vert."""
+    pos = state[:, 0:3]
+    vel = state[:, 3:6]
+    sortedIndex, cellStart = grid
+
+    radius2 = np.float32(2 * radius) ** 2
+    cells = cellCoords(pos, cellSize)
+    dv = np.zeros_like(pos)
+
+    for offset in NEIGHBOR_OFFSETS:
+        neighbor = cells + offset
+        h = cellHash(neighbor, tableSize)
+        k = cellStart[h].astype(np.int64)
+        end = cellStart[h + 1].astype(np.int64)
+
+        # walk through the cells of all particles at once, one
+        # neighbor per iteration
+        i = np.flatnonzero(k < end)
+        while i.size:
+            j = sortedIndex[k[i]]
+            diff = pos[i] - pos[j]
+            dist2 = np.einsum('ij,ij->i', diff, diff)
+
+            # only the particles of the neighbor cell, not of the
+            # other cells in the same entry
+            inCell = (cells[j] == neighbor[i]).all(axis=1)
+            touch = inCell & (j != i) & (dist2 < radius2) & (dist2 > 0.0)
+            if touch.any():
+                ti = i[touch]
+                tj = j[touch]
+                dist = np.sqrt(dist2[touch])
+                n = diff[touch] / dist[:, None]
+                vn = np.einsum('ij,ij->i', vel[ti] - vel[tj], n)
+                force = np.float32(stiffness) * (np.float32(2 * radius) - dist) - np.float32(damping) * vn
+                dv[ti] += force[:, None] * n
+
+            k[i] += 1
+            i = i[k[i] < end[i]]
+
+    return np.float32(dt) * dv
+
+
+class SpatialHashGrid(object):
+    """builds sortedIndex and cellStart on the gpu for the particles in a
+    vertex buffer with stride floats per particle and the position first"""
+
+    def __init__(self, maxParticles, cellSize, tableSize=None, stride=6):
+        self.maxParticles = maxParticles
+        self.cellSize = cellSize
+        # about one table entry per particle keeps the cells short
+        self.tableSize = tableSize or max(1 << 16, 1 << (maxParticles - 1).bit_length())
+        self.stride = stride
+
+        self.__countProgram = glutil.computeProgram('./shaders/spatialhash_count.comp')
+        self.__scatterProgram = glutil.computeProgram('./shaders/spatialhash_scatter.comp')
+        self.__prefixSum = PrefixSum(self.tableSize + 1)
+
+        self.cellStart = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.cellStart)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, (self.tableSize + 1) * 4, None, GL_DYNAMIC_COPY)
+
+        # (hash table entry, rank in cell) of every particle
+        self.__particleCell = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.__particleCell)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, maxParticles * 2 * 4, None, GL_DYNAMIC_COPY)
+
+        self.sortedIndex = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.sortedIndex)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, maxParticles * 4, None, GL_DYNAMIC_COPY)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+        # buffer textures so vertex shaders can read the grid
+        self.cellStartTexture, self.sortedIndexTexture = glGenTextures(2)
+        glBindTexture(GL_TEXTURE_BUFFER, self.cellStartTexture)
+        glTexBuffer(GL_TEXTURE_BUFFER, GL_R32UI, self.cellStart)
+        glBindTexture(GL_TEXTURE_BUFFER, self.sortedIndexTexture)
+        glTexBuffer(GL_TEXTURE_BUFFER, GL_R32UI, self.sortedIndex)
+        glBindTexture(GL_TEXTURE_BUFFER, 0)
+
+    def build(self, particleBuffer, count):
+        """sort the first count particles of particleBuffer into the grid"""
+        # clear the counters
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.cellStart)
+        glClearBufferData(GL_SHADER_STORAGE_BUFFER, GL_R32UI, GL_RED_INTEGER, GL_UNSIGNED_INT, None)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, particleBuffer)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, self.cellStart)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 2, self.__particleCell)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 3, self.sortedIndex)
+
+        # count the particles per cell
+        glUseProgram(self.__countProgram)
+        glUniform1ui(glGetUniformLocation(self.__countProgram, 'count'), count)
+        glUniform1ui(glGetUniformLocation(self.__countProgram, 'stride'), self.stride)
+        glUniform1f(glGetUniformLocation(self.__countProgram, 'cellSize'), self.cellSize)
+        glUniform1ui(glGetUniformLocation(self.__countProgram, 'tableSize'), self.tableSize)
+        glDispatchCompute(glutil.workGroups(count, 256), 1, 1)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+
+        # the counts become start offsets, the extra last entry is the total
+        self.__prefixSum.scan(self.cellStart, self.tableSize + 1)
+
+        # put every particle at its place
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, self.cellStart)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 2, self.__particleCell)
+        glUseProgram(self.__scatterProgram)
+        glUniform1ui(glGetUniformLocation(self.__scatterProgram, 'count'), count)
+        glDispatchCompute(glutil.workGroups(count, 256), 1, 1)
+
+        # the grid is read through buffer textures afterwards
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT | GL_TEXTURE_FETCH_BARRIER_BIT)
+        glUseProgram(0)
+
+    def bindTextures(self, cellStartUnit, sortedIndexUnit):
+        """bind the grid buffer textures to texture units"""
+        glActiveTexture(GL_TEXTURE0 + cellStartUnit)
+        glBindTexture(GL_TEXTURE_BUFFER, self.cellStartTexture)
+        glActiveTexture(GL_TEXTURE0 + sortedIndexUnit)
+        glBindTexture(GL_TEXTURE_BUFFER, self.sortedIndexTexture)
+        glActiveTexture(GL_TEXTURE0)
+
+    def delete(self):
+        glDeleteTextures([self.cellStartTexture, self.sortedIndexTexture])
+        glDeleteBuffers(3, [self.cellStart, self.__particleCell, self.sortedIndex])
+        glDeleteProgram(self.__countProgram)
+        glDeleteProgram(self.__scatterProgram)
+        self.__prefixSum.delete()
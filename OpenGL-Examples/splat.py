@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# low resolution splat buffer for additive blending
+# The particle examples blend many overlapping billboards additively, so
+# their frame time is mostly fill rate. SplatBuffer renders them into a
+# RGBA16F framebuffer at a fraction of the window resolution instead and
+# composites the result with an upsampling pass, which needs scale^2 of
+# the blending work. The float format keeps the sums of the overlapping
+# particles from clamping before they are upsampled.
+# The upsampling filter is 'bilinear' (the texture unit's linear filter)
+# or 'bicubic' (Catmull-Rom from 16 texel fetches, sharper).
+
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+import glutil
+
+
+FILTERS = ('bilinear', 'bicubic')
+
+
+class SplatBuffer(object):
+
+    def __init__(self, width, height, scale=0.5, filter='bilinear'):
+        """width and height of the window, scale the fraction of the
+        window resolution that is rendered to"""
+        if filter not in FILTERS:
+            raise ValueError('unknown upsampling filter %r' % filter)
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.filter = filter
+        self.splatWidth = max(1, int(round(width * scale)))
+        self.splatHeight = max(1, int(round(height * scale)))
+
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA16F, self.splatWidth, self.splatHeight, 0,
+                     GL_RGBA, GL_HALF_FLOAT, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise Exception('the splat framebuffer is not complete')
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        defines = ['BICUBIC'] if filter == 'bicubic' else []
+        self.__program = shaders.compileProgram(
+            glutil.shaderFromFile(GL_VERTEX_SHADER, './shaders/splat_upsample.vert'),
+            glutil.shaderFromFile(GL_FRAGMENT_SHADER, './shaders/splat_upsample.frag', defines))
+        self.__textureLocation = glGetUniformLocation(self.__program, 'splats')
+
+        # the fullscreen triangle is made from gl_VertexID alone
+        self.__vao = glGenVertexArrays(1)
+
+    def begin(self):
+        """render to the splat buffer from here on"""
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.splatWidth, self.splatHeight)
+        glClearColor(0.0, 0.0, 0.0, 0.0)
+        glClear(GL_COLOR_BUFFER_BIT)
+
+    def end(self):
+        """upsample the splats and add them to the window framebuffer"""
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glViewport(0, 0, self.width, self.height)
+
+        glUseProgram(self.__program)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glUniform1i(self.__textureLocation, 0)
+
+        # composited additively like the particles themselves
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_ONE, GL_ONE)
+        glBindVertexArray(self.__vao)
+        glDrawArrays(GL_TRIANGLES, 0, 3)
+        glBindVertexArray(0)
+
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glUseProgram(0)
+
+    def delete(self):
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteTextures([self.texture])
+        glDeleteVertexArrays(1, [self.__vao])
+        glDeleteProgram(self.__program)
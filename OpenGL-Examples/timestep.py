@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+# fixed timestep scheduling
+# The particle examples advance their simulation in steps of a fixed dt.
+# FixedTimestep collects the real time that passed since the last frame
+# and tells the render loop how many of those steps to run, so the
+# simulation speed doesn't depend on the frame rate. The time left over
+# is reported as alpha so the drawn state can be interpolated between
+# the last two steps.
+
+
+class FixedTimestep(object):
+
+    def __init__(self, dt=1.0 / 60.0, maxSteps=4, realtime=True):
+        """dt is the length of a step in seconds
+        at most maxSteps are run per frame, the time a slow frame couldn't
+        catch up on is dropped. With realtime=False every frame runs
+        exactly one step, e.g. for benchmarks"""
+        self.dt = dt
+        self.maxSteps = maxSteps
+        self.realtime = realtime
+        # simulated time that is still owed to real time
+        self.accumulator = 0.0
+        self.__last = None
+
+    def reset(self):
+        """forget the time collected so far, e.g. after a pause"""
+        self.accumulator = 0.0
+        self.__last = None
+
+    def advance(self, t):
+        """collect the time since the last call, t is the time in seconds
+        returns the number of steps to run this frame"""
+        if not self.realtime:
+            return 1
+
+        # the first frame runs one step
+        if self.__last is None:
+            self.__last = t
+            return 1
+
+        self.accumulator += t - self.__last
+        self.__last = t
+
+        steps = int(self.accumulator / self.dt)
+        if steps > self.maxSteps:
+            # the simulation can't keep up, slow it down instead of
+            # running more and more steps per frame
+            steps = self.maxSteps
+            self.accumulator = self.dt * steps
+        self.accumulator -= self.dt * steps
+        return steps
+
+    def alpha(self):
+        """fraction of a step between the last step and the current time"""
+        if not self.realtime:
+            return 1.0
+        return min(self.accumulator / self.dt, 1.0)
+
+    def lag(self):
+        """how far the drawn state lags behind the last step in seconds
+        drawing position - lag * velocity interpolates between the last
+        two steps, so the motion is smooth when steps and frames don't align"""
+        return (1.0 - self.alpha()) * self.dt
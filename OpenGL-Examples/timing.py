@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# gpu timing with timer queries
+# GPUTimer measures the gpu time between begin and end with GL_TIME_ELAPSED
+# queries. The queries are kept in a ring and only read once their result
+# is available, so measuring never stalls the pipeline: the result of a
+# frame arrives a few frames later.
+# Results are read with 64 bits, 32 bits of nanoseconds overflow after
+# 4.3 seconds which software renderers do reach with large scenes.
+
+import ctypes
+
+from OpenGL.GL import *
+# the wrapped version fails to convert its 64 bit output
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v as rawGetQueryObjectui64v
+
+
+def queryResult64(query):
+    """the 64 bit GL_QUERY_RESULT of a query, waits for it if necessary"""
+    result = ctypes.c_uint64(0)
+    rawGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(result))
+    return result.value
+
+
+class GPUTimer(object):
+
+    def __init__(self, ringSize=4):
+        self.__queries = glGenQueries(ringSize)
+        self.__ringSize = ringSize
+        # queries that were ended but not read back yet, oldest first
+        self.__pending = []
+        self.__next = 0
+        # the first result of some drivers is invalid
+        self.__first = True
+
+        # gpu time of the newest frame read back in milliseconds
+        self.lastMs = None
+
+    def begin(self):
+        """start measuring, at most one timer can be running at a time"""
+        if len(self.__pending) == self.__ringSize:
+            # all queries are in flight, wait for the oldest one
+            self.__read(self.__pending.pop(0))
+        glBeginQuery(GL_TIME_ELAPSED, self.__queries[self.__next])
+
+    def end(self):
+        """stop measuring"""
+        glEndQuery(GL_TIME_ELAPSED)
+        self.__pending.append(self.__queries[self.__next])
+        self.__next = (self.__next + 1) % self.__ringSize
+
+    def poll(self):
+        """read all finished queries without waiting
+        returns the newest gpu time in milliseconds or None if there was none"""
+        result = None
+        while self.__pending and glGetQueryObjectuiv(self.__pending[0], GL_QUERY_RESULT_AVAILABLE):
+            ms = self.__read(self.__pending.pop(0))
+            if ms is not None:
+                result = ms
+        return result
+
+    def __read(self, query):
+        """result of query in milliseconds, None if it is invalid"""
+        ns = queryResult64(query)
+        if self.__first:
+            self.__first = False
+            return None
+        self.lastMs = ns * 1e-6
+        return self.lastMs
+
+    def delete(self):
+        glDeleteQueries(self.__ringSize, self.__queries)
+        self.__pending = []
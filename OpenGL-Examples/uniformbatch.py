@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+# per instance data in uniform buffers beyond the size of one block
+# A uniform block holds at most GL_MAX_UNIFORM_BLOCK_SIZE bytes (16KB to
+# 64KB), e.g. 256 to 1024 mat4. UniformBatch splits the data of any
+# number of instances into chunks of a block each, one after the other
+# in one uniform buffer at offsets aligned to
+# GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT. draw() binds the chunks in turn
+# with glBindBufferRange and draws the instances of each with one
+# instanced draw call, gl_InstanceID indexes the array of the chunk.
+#
+# The array length of the block in the shader comes from the limit:
+# compile it with the defines() of the batch, e.g.
+#   layout(std140) uniform Matrices { mat4 Model[INSTANCES_PER_BLOCK]; };
+
+import numpy as np
+from OpenGL.GL import *
+
+
+class UniformBatch(object):
+
+    def __init__(self, count, itemSize=64, maxItems=None):
+        """count instances of itemSize bytes each (a multiple of 16 for
+        std140 arrays), maxItems limits the instances per block"""
+        self.count = count
+        self.itemSize = itemSize
+
+        blockSize = int(glGetIntegerv(GL_MAX_UNIFORM_BLOCK_SIZE))
+        alignment = int(glGetIntegerv(GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT))
+        self.itemsPerBlock = blockSize // itemSize
+        if maxItems:
+            self.itemsPerBlock = min(self.itemsPerBlock, maxItems)
+        self.blockSize = self.itemsPerBlock * itemSize
+        # distance of the chunks in the buffer
+        self.stride = (self.blockSize + alignment - 1) // alignment * alignment
+        self.chunks = max(1, (count + self.itemsPerBlock - 1) // self.itemsPerBlock)
+
+        # the last chunk is padded to a whole block, the bound range has
+        # to cover the block as declared
+        self.__data = np.zeros((self.chunks, self.stride), dtype=np.uint8)
+
+        self.buffer = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferData(GL_UNIFORM_BUFFER, self.__data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def defines(self):
+        """shader defines with the array length of the block"""
+        return ['INSTANCES_PER_BLOCK %d' % self.itemsPerBlock]
+
+    def upload(self, data):
+        """write the data of the instances, count items of itemSize bytes
+        (e.g. (count, 4, 4) float32 matrices), into the chunks"""
+        data = np.ascontiguousarray(data).view(np.uint8).reshape(self.count, self.itemSize)
+        full = self.count // self.itemsPerBlock
+        blocks = self.__data[:, :self.blockSize].reshape(self.chunks, self.itemsPerBlock, self.itemSize)
+        blocks[:full] = data[:full * self.itemsPerBlock].reshape(full, self.itemsPerBlock, self.itemSize)
+        rest = self.count - full * self.itemsPerBlock
+        if rest:
+            blocks[full, :rest] = data[full * self.itemsPerBlock:]
+
+        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.__data.nbytes, self.__data)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def draw(self, binding, indexCount):
+        """draw all instances with the vao bound, one chunk per draw call
+        binding is the uniform buffer binding point of the block"""
+        for chunk in range(self.chunks):
+            first = chunk * self.itemsPerBlock
+            instances = min(self.itemsPerBlock, self.count - first)
+            if instances <= 0:
+                break
+            glBindBufferRange(GL_UNIFORM_BUFFER, binding, self.buffer, chunk * self.stride, self.blockSize)
+            glDrawElementsInstanced(GL_TRIANGLES, indexCount, GL_UNSIGNED_INT, None, instances)
+
+    def delete(self):
+        glDeleteBuffers(1, [self.buffer])